@@ -1,18 +1,42 @@
 import pandas as pd
+import argparse
 import os
+import sys
+import threading
+import time
 
-from collections import namedtuple
-from datetime import datetime as dt
-import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from queue import Empty, Full, Queue
 import numpy as np
 from sqlalchemy import create_engine
 from urllib import parse
 
+import bulk_writer
+import checkpoint as ckpt
+import connection_manager
+import id_allocator
+import instrument_schema
+import metrics
+import par_archive
+import par_index
+import par_reader
+import par_watcher
+import stations
+
 # Setting constants
 database_name = 'dateaubase2020'
 local_server = r'GCI-PR-DATEAU02\DATEAUBASE'
 remote_server = r'132.203.190.77\DATEAUBASE'
-path = "//10.10.11.13/infpc1_2/"
+checkpoint_file = 'anapro_checkpoint.sqlite'
+endpoint_cache_file = 'anapro_endpoint.json'
+# Compressed copies of the finished .parx files, in one subdirectory per station
+archive_dir = 'par_archive'
+batch_size = bulk_writer.batch_size
+# File receiving one JSON line of metrics per pass (None: no metrics log)
+metrics_log = None
+# Merge the records into dbo.value on (Metadata_ID, Timestamp) instead of appending them
+upsert = False
 with open('login.txt') as f:
     username = f.readline().strip()
     password = f.readline().strip()
@@ -31,171 +55,668 @@ def connect_remote(server, database, login_file):
     return engine
 
 
-def get_last(db_engine):
-    query = 'SELECT Value_ID, Timestamp FROM dbo.value WHERE Value_ID = (SELECT MAX(Value_ID) FROM dbo.value)'
-    result = db_engine.execute(query)
-    Record = namedtuple('record', result.keys())
-    records = [Record(*r) for r in result.fetchall()]
-    return records[0]
+def get_station_last(db_engine, checkpoint, station):
+    '''latest Timestamp of the station in dbo.value, only searching past the checkpointed one'''
+    last = ckpt.load_last(checkpoint, station.name)
+    since = last[1] if last is not None else 0
+    metadata_IDs = ', '.join(str(metadata_ID) for metadata_ID in stations.metadata_IDs(station))
+
+    def max_timestamp(condition=''):
+        query = f'SELECT MAX(Timestamp) FROM dbo.value WHERE Metadata_ID IN ({metadata_IDs}){condition}'
+        with metrics.timer('get_last'):
+            result = db_engine.execute(query).scalar()
+        metrics.count('db_round_trips')
+        return result
+
+    newer = max_timestamp(f' AND Timestamp > {since}')
+    if newer is not None:
+        # Rows newer than the checkpoint were written by another writer or before a crash
+        return newer
+    if not since or max_timestamp(f' AND Timestamp = {since}') is not None:
+        return since
+
+    # The checkpointed row is gone after a restore or a deletion: the checkpoint is ahead of dbo.value
+    print(f'{station.name}: the checkpoint is ahead of {database_name}, reading the files again from its last row')
+    ckpt.forget_files(checkpoint, station.name, list(ckpt.load_offsets(checkpoint, station.name)))
+    return max_timestamp() or 0
 
-def engine_runs(engine):
-    try:
-        _ = get_last(engine)
-    except Exception:
-        return False
-    else:
-        return True
 
-def get_par_files(path):
+def get_par_files(path, checkpoint=None, source=None, suffix='.par'):
     full_path = os.path.join(os.getcwd(), path)
 
+    if checkpoint is not None:
+        # Reuse the stored listing as long as the directory did not change
+        names = ckpt.list_files(checkpoint, source or path, full_path, suffix)
+        file_list = [os.path.join(full_path, file) for file in names]
+        return len(file_list) - 1, file_list
+
     file_list = []
     for file in os.listdir(full_path):
-        if file.endswith(".par"):
+        if file.endswith(suffix):
             filename = os.path.join(full_path, file)
             file_list.append(filename)
 
     # Sort the list from the oldest to the last
-    file_list.sort
+    file_list.sort()
 
     # Index of the oldest file with new data (will change during the execution but the last file always has new data)
     index = len(file_list) - 1
     return index, file_list
 
 
-def read_par(f_name, db_engine):
-    # load a file's data into a DataFrame
-    df = pd.read_csv(f_name, sep='\t', skiprows=0, encoding='ANSI', header=1)
-
-    # Rename and select only the columns you need
-    new_cols = [
-        'Datetime', 'Status', 'TSS', 'TSSinfo',
-        'NO3N', 'NO3Ninfo', 'COD', 'CODinfo',
-        'CODf', 'CODfinfo', 'NH4N', 'NH4Ninfo',
-        'K', 'Kinfo', 'pH', 'pHinfo',
-        'Temp', 'Tempinfo'
-    ]
-    df.columns = new_cols
-    cols_to_keep = ['Datetime', 'TSS', 'NO3N', 'COD', 'CODf', 'NH4N', 'K', 'pH', 'Temp']
-    df = df[cols_to_keep]
-
-    # Fill the 'NaN' values
-    df.fillna(0, inplace=True)
-
-    # Convert the datetime strings into epoch time
-    df['Datetime'] = pd.to_datetime(df['Datetime'], format='%Y.%m.%d  %H:%M:%S').dt.tz_localize('US/Eastern').astype(np.int64) // 10 ** 9
-
-    # Get the last ID from the database
-    last_ID, last_Timestamp = get_last(engine)
-
+def par_records(par, last_Timestamp, station=stations.stations['laval']):
+    '''(timestamps, values, metadata_IDs) of the rows of a par_reader.ParData newer than last_Timestamp,
+    with one column of values per ingested parameter, or None'''
     # Remove rows with a timestamp already in the dateaubase
-    time_mask = (df['Datetime'] > last_Timestamp)
-    df = df[time_mask]
-    if (not len(df)):
+    time_mask = par.Timestamp > last_Timestamp
+    if not time_mask.any():
         return None
-    # Stack the values into unique records
-    df.set_index('Datetime', inplace=True)
-    df2 = pd.DataFrame(df.stack())
-    df = df2
-    df.reset_index(inplace=True)
-
-    # Rename the columns
-    df.columns = ['Timestamp', 'Metadata_ID', 'Value']
-
-    # Map the parameter names to the correct metadata_id
-    mapping = {
-        'TSS': 5,
-        'NO3N': 6,
-        'COD': 7,
-        'CODf': 8,
-        'NH4N': 1,
-        'K': 2,
-        'pH': 3,
-        'Temp': 4
-    }
-    df['Metadata_ID'] = df['Metadata_ID'].map(mapping)
-
-    # Apply a factor of 1000 for rows where Metadata_ID is 5, 6, 7 or 8
-    # These contain values for TSS, NO3, COD and CODf respectively
-    mask = (df['Metadata_ID'] > 4)
-    df.loc[mask, 'Value'] = df['Value'] / 1000
-
-    # Add 'Number of experiments column
-    df['Number_of_experiment'] = 1
-    df['Comment_ID'] = np.nan
-
-    # Add the lastID value plus increment to the index of the new values
-    df.index = df.index + last_ID + 1
-
-    # Turn index into regular column
-    df.reset_index(inplace=True)
-    df.rename(columns={
-        'index': 'Value_ID'
-    }, inplace=True)
-
-    # reorder columns
-    df = df[['Value_ID', 'Value', 'Number_of_experiment', 'Metadata_ID', 'Comment_ID', 'Timestamp']]
-
-    # And return result!
-    return df
-
-
-def send_to_db(df, db_engine):
-    '''stores df in SQL table dbo.value'''
-    df.to_sql('value', con=db_engine, if_exists='append', index=False)
-    return None
+    schema = instrument_schema.compile_schema(par.columns, station.parameters)
+    values = np.nan_to_num(par.Values[time_mask][:, schema.index], nan=0.0) / schema.divisors
+    return par.Timestamp[time_mask], values, schema.metadata_IDs
+
+
+def records_frame(timestamps, values, metadata_IDs, last_ID):
+    '''dbo.value records of par_records arrays, numbered from last_ID + 1'''
+    # One record per (row, parameter), in the row order of the file
+    n_records = values.size
+    return pd.DataFrame({
+        'Value_ID': np.arange(last_ID + 1, last_ID + 1 + n_records),
+        'Value': values.ravel(),
+        'Number_of_experiment': 1,
+        'Metadata_ID': np.tile(metadata_IDs, len(timestamps)),
+        'Comment_ID': np.nan,
+        'Timestamp': np.repeat(timestamps, len(metadata_IDs)),
+    })
+
+
+def format_par_data(par, last_ID, last_Timestamp, station=stations.stations['laval']):
+    '''turns a par_reader.ParData into dbo.value records newer than last_Timestamp'''
+    records = par_records(par, last_Timestamp, station)
+    if records is None:
+        return None
+    return records_frame(*records, last_ID)
+
+
+def read_new_bytes(f_name, offset):
+    '''returns the complete lines appended to f_name since offset, and the offset after them'''
+    with open(f_name, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    # Keep a partially written last line for the next pass
+    end = chunk.rfind(b'\n') + 1
+    # Wait for both header lines before consuming the start of a file
+    if offset == 0 and chunk.count(b'\n', 0, end) < 2:
+        return b'', offset
+    return chunk[:end], offset + end
+
+
+def read_par_tail(f_name, offset, after=None):
+    '''parses only the bytes appended to f_name since offset (lines following the epoch after) into a par_reader.ParData'''
+    with metrics.timer('read'):
+        chunk, new_offset = read_new_bytes(f_name, offset)
+    metrics.count('files_read')
+    metrics.count('bytes_read', len(chunk))
+    if not chunk:
+        return None, new_offset
+    # Only the start of the file carries the two header lines
+    columns = None if offset == 0 else par_reader.header_columns(f_name)
+    with metrics.timer('parse'):
+        par = par_reader.parse_par_bytes(chunk, header=(offset == 0), columns=columns, after=after)
+    # A file read from its start may have been rewritten with another header
+    par_reader.cache_header(f_name, par.columns)
+    metrics.count('rows_parsed', len(par.Timestamp))
+    return par, new_offset
+
+
+def send_to_db(df, db_engine, merge=False):
+    '''stores df in SQL table dbo.value and returns the number of new rows, merging them with --upsert or merge'''
+    with metrics.timer('insert'):
+        if upsert or merge:
+            new_rows = bulk_writer.upsert_values(db_engine, df, batch_size)
+        else:
+            new_rows = bulk_writer.insert_values(db_engine, df, batch_size)
+    # One commit per batch
+    metrics.count('db_round_trips', -(-len(df) // batch_size))
+    metrics.count('records_written', new_rows)
+    return new_rows
 
 
 # _________Main Function__________
 
 
-def main(engine):
-    # Find the .par files on the path
-    index, file_list = get_par_files(path)
+# Items held by each queue of the pipeline: a share answering faster than the
+# database blocks instead of filling the memory
+queue_depth = 4
+# Seconds a blocked reader waits before checking whether the pass was abandoned
+put_timeout = 0.1
 
-    # get the latest timestamp on the dateaubase
-    _, last_Timestamp = get_last(engine)
 
-    # Convert the Timestamp in DateTime format
-    db_last_time = dt.fromtimestamp(last_Timestamp)
+def scan_station(station, last_Timestamp):
+    '''returns the .par files of a station that may have new lines, and how far each file was read'''
+    checkpoint = ckpt.open_checkpoint(checkpoint_file)
+    try:
+        # Find the .par files on the path, from the oldest to the last
+        with metrics.timer('list'):
+            _, file_list = get_par_files(station.path, checkpoint, station.name)
+            starts, file_list = par_index.build_index(file_list)
+        metrics.count('files_scanned', len(file_list))
+
+        offsets = ckpt.load_offsets(checkpoint, station.name)
+        if not offsets:
+            # First pass: files older than the database content are already ingested
+            index = par_index.first_file_index(starts, last_Timestamp)
+            for file in file_list[:index]:
+                stat = os.stat(file)
+                ckpt.save_offset(checkpoint, station.name, file, stat.st_size, stat.st_mtime)
+                offsets[file] = (stat.st_size, stat.st_mtime)
+
+        # Forget the files that were renamed or removed by the analyser
+        gone = set(offsets) - set(file_list)
+        ckpt.forget_files(checkpoint, station.name, gone)
+        for file in gone:
+            del offsets[file]
+    finally:
+        checkpoint.close()
+
+    # Only the newest file grows: finished files are not even looked at again
+    newest_known = next((file for file in reversed(file_list) if file in offsets), None)
+    to_check = [file for file in file_list if file not in offsets or file == newest_known]
+    return to_check, offsets
+
+
+def read_station(station, last_Timestamp, parsed, stop):
+    '''reads the lines appended to the .par files of a station since the previous pass into the parsed queue,
+    until the stop event is set'''
+    # Runs in the I/O thread pool: only touches the share and its own checkpoint connection
+    def put(item):
+        # Nobody reads the queue once the pass is abandoned: give up instead of blocking the pool
+        while not stop.is_set():
+            try:
+                parsed.put(item, timeout=put_timeout)
+                return True
+            except Full:
+                pass
+        return False
 
-    # loop to check all the files for data more recent than the last value in the db
-    for idx, file in enumerate(file_list):
-        with open(file, 'r') as f:
-            first_point_line = f.read().splitlines()[2]
-            first_time_string = re.split(r'\t', first_point_line)[0]
-            file_first_time = dt.strptime(first_time_string, '%Y.%m.%d  %H:%M:%S')
-        # if a file is more recent than the last data => change the index to begin the import with the
-        # file just before this one
-        if file_first_time > db_last_time:
-            index = max(idx - 1, 0)
+    if not put(('start', station, last_Timestamp)):
+        return
+    try:
+        to_check, offsets = scan_station(station, last_Timestamp)
+        for file in to_check:
+            if stop.is_set():
+                return
+            offset, mtime = offsets.get(file, (0, None))
+            stat = os.stat(file)
+            if stat.st_size == offset and stat.st_mtime == mtime:
+                continue
+            if stat.st_size < offset:
+                # The file was rewritten: read it again from the start
+                offset = 0
+            if offset == 0 and last_Timestamp:
+                # Lines already in the dateaubase are skipped without being parsed
+                with metrics.timer('seek'):
+                    offset = par_index.first_newer_offset(file, last_Timestamp)
+            # The lines before offset were ingested up to last_Timestamp
+            par, offset = read_par_tail(file, offset, last_Timestamp)
+            # Waits here while the transform and write stages are behind
+            if not put(('file', station, file, par, offset, stat.st_mtime)):
+                return
+    except Exception as e:
+        put(('error', station, e))
+    else:
+        put(('done', station))
+
+
+class Pipeline:
+    '''transform stage between the station readers and the writer, with a bounded queue on each side'''
+
+    def __init__(self, allocator, depth=queue_depth):
+        self.allocator = allocator
+        # ('start' | 'file' | 'done' | 'error', station, ...) items from the readers
+        self.parsed = Queue(depth)
+        # The same items for the writer, with the records of each file formatted
+        self.formatted = Queue(depth)
+        self.last_Timestamps = {}
+        # Stations whose writes failed, skipped until their reader is done
+        self.failed = set()
+        # Set when the pass is abandoned: the readers stop putting items
+        self.stopping = threading.Event()
+        threading.Thread(target=self.transform, daemon=True).start()
+
+    def transform(self):
+        while True:
+            item = self.parsed.get()
+            if item is None:
+                return
+            kind, station = item[:2]
+            if kind == 'start':
+                self.last_Timestamps[station.name] = item[2]
+                continue
+            if kind == 'file':
+                _, _, file, par, offset, mtime = item
+                try:
+                    item = ('file', station, file, self.format(station, par), offset, mtime)
+                except Exception as e:
+                    item = ('failed', station, e)
+            self.formatted.put(item)
+
+    def format(self, station, par):
+        '''dbo.value records of the new rows of par, with their Value_IDs'''
+        if par is None:
+            return None
+        with metrics.timer('format'):
+            new_data = format_par_data(par, 0, self.last_Timestamps[station.name], station)
+        new_rows = 0 if new_data is None else len(new_data) // len(station.parameters)
+        metrics.count('rows_skipped', len(par.Timestamp) - new_rows)
+        if new_data is None:
+            return None
+        # Value_IDs are reserved on the server in a single round trip
+        with metrics.timer('allocate'):
+            new_data['Value_ID'] = self.allocator.allocate(len(new_data)) + np.arange(len(new_data))
+        metrics.count('db_round_trips')
+        self.last_Timestamps[station.name] = new_data['Timestamp'].iloc[-1]
+        return new_data
+
+    def drain(self):
+        '''drops the items waiting in both queues'''
+        for queue in (self.parsed, self.formatted):
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+
+    def stop(self, readers=()):
+        '''makes the readers give up and empties the queues until the reader futures are done,
+        so that no thread stays blocked on a full queue'''
+        self.stopping.set()
+        readers = list(readers)
+        while True:
+            self.drain()
+            if not wait(readers, timeout=put_timeout).not_done:
+                break
+        # Items put by the transform thread while the readers finished
+        self.drain()
+
+    def close(self):
+        try:
+            self.parsed.put_nowait(None)
+        except Full:
+            # The transform thread is a daemon: it stops with the process
+            pass
+
+
+def write_file(engine, checkpoint, station, file, new_data, offset, mtime):
+    '''sends the records read from a file to the dateaubase and records how far the file was read'''
+    new_records = 0
+    if new_data is not None:
+        new_records = send_to_db(new_data, engine)
+        with metrics.timer('checkpoint'):
+            ckpt.save_last(checkpoint, station.name, new_data['Value_ID'].iloc[-1], new_data['Timestamp'].iloc[-1])
+    with metrics.timer('checkpoint'):
+        ckpt.save_offset(checkpoint, station.name, file, offset, mtime)
+    return new_records
+
+
+def log_pass(before, new_records):
+    '''writes the metrics of the pass started at the snapshot before to metrics_log'''
+    if metrics_log is not None:
+        metrics.log_json(metrics_log, 'pass', records=new_records, **metrics.since(before))
+
+
+def ingest_pass(engine, checkpoint, pipeline, pool, station_list, in_flight, timeout=None):
+    '''reads the stations concurrently and writes their new data from this thread'''
+    with metrics.timer('pass'):
+        return run_pass(engine, checkpoint, pipeline, pool, station_list, in_flight, timeout)
+
+
+def run_pass(engine, checkpoint, pipeline, pool, station_list, in_flight, timeout=None):
+    for station in station_list:
+        # A station whose share did not answer during the previous pass is not read twice
+        if station.name not in in_flight:
+            last_Timestamp = get_station_last(engine, checkpoint, station)
+            in_flight[station.name] = pool.submit(
+                read_station, station, last_Timestamp, pipeline.parsed, pipeline.stopping)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    new_records = {}
+    # Files are written as soon as they are read and formatted
+    while in_flight:
+        remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            item = pipeline.formatted.get(timeout=remaining)
+        except Empty:
+            print(f"Still waiting for {', '.join(sorted(in_flight))}")
             break
-
+        kind, station = item[:2]
+        if kind == 'file':
+            if station.name in pipeline.failed:
+                continue
+            try:
+                n = write_file(engine, checkpoint, station, *item[2:])
+                new_records[station.name] = new_records.get(station.name, 0) + n
+                continue
+            except Exception as e:
+                error = e
+        elif kind == 'failed':
+            error = item[2]
+        else:
+            # The reader of the station is done
+            del in_flight[station.name]
+            pipeline.failed.discard(station.name)
+            if kind == 'done':
+                new_records.setdefault(station.name, 0)
+                continue
+            error = item[2]
+        # One failing station does not stop the others; its next files are read again on the next pass
+        if kind != 'error':
+            pipeline.failed.add(station.name)
+        metrics.count('station_errors')
+        print(f'{station.name}: {error}')
+    return new_records
+
+
+def prepare(engine):
+    '''creates what the writers need on the server and checks the index they search dbo.value with'''
+    id_allocator.ensure_allocator(engine)
+    # get_station_last and the upserts both search dbo.value by (Metadata_ID, Timestamp)
+    if not bulk_writer.has_dedupe_index(engine):
+        raise RuntimeError(
+            f'dbo.value of {database_name} has no (Metadata_ID, Timestamp) index: '
+            'create it once with "python AnaPro_37.py create-index"')
+
+
+def create_index(engine):
+    '''creates the (Metadata_ID, Timestamp) index of dbo.value, a one-off operation'''
+    if bulk_writer.has_dedupe_index(engine):
+        print(f'The (Metadata_ID, Timestamp) index of dbo.value already exists on {database_name}')
+        return
+    print(f'Creating the (Metadata_ID, Timestamp) index of dbo.value on {database_name}')
+    start = time.perf_counter()
+    bulk_writer.ensure_dedupe_index(engine)
+    seconds = time.perf_counter() - start
+    print(f'Created the index in {seconds:.1f} s')
+    if metrics_log is not None:
+        metrics.log_json(metrics_log, 'create_index', database=database_name, seconds=round(seconds, 3))
+
+
+def main(engine, station_list):
+    prepare(engine)
+    pipeline = Pipeline(id_allocator.ValueIDAllocator(engine))
+    checkpoint = ckpt.open_checkpoint(checkpoint_file)
+    before = metrics.snapshot()
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=len(station_list)) as pool:
+            try:
+                new_records = ingest_pass(engine, checkpoint, pipeline, pool, station_list, in_flight)
+            except BaseException:
+                # Readers blocked on the full queues would keep the pool from shutting down
+                pipeline.stop(in_flight.values())
+                raise
+    finally:
+        pipeline.close()
+        checkpoint.close()
+    log_pass(before, new_records)
+
+    for name, n in new_records.items():
+        print(f"Added {n} rows from {name} to {database_name}")
+
+
+def follow(manager, station_list, interval, watcher=None):
+    '''keeps ingesting new .par lines every interval seconds, or when the watcher sees them'''
+    checkpoint = ckpt.open_checkpoint(checkpoint_file)
+    # Stations being read, carried over passes when a share is slow to answer
+    in_flight = {}
+    pool = ThreadPoolExecutor(max_workers=len(station_list))
+    pipeline = Pipeline(None)
+    engine = None
+    # The first pass reads every station
+    to_read = station_list
+    try:
+        while True:
+            try:
+                # The engine only changes when the manager fails over to another endpoint
+                if manager.engine() is not engine:
+                    engine = manager.engine()
+                    prepare(engine)
+                    pipeline.allocator = id_allocator.ValueIDAllocator(engine)
+                before = metrics.snapshot()
+                new_records = ingest_pass(engine, checkpoint, pipeline, pool, to_read, in_flight, timeout=interval)
+            except Exception as e:
+                print(e)
+                metrics.count('pass_errors')
+                # Check the endpoints again on the next pass
+                manager.invalidate()
+            else:
+                log_pass(before, new_records)
+                for name, n in new_records.items():
+                    if n:
+                        print(f"Added {n} rows from {name} to {database_name}")
+            if watcher is None:
+                time.sleep(interval)
+                continue
+            # Sleep until a .par file changes, checking back on the stations still being read
+            changed = watcher.wait(timeout=interval if in_flight else None)
+            to_read = [station for station in station_list if station.name in changed]
+    finally:
+        # Readers of slow shares are not waited for, but stop at their next item
+        pipeline.stop()
+        pool.shutdown(wait=False, cancel_futures=True)
+        pipeline.close()
+        checkpoint.close()
+
+
+def local_epoch(date):
+    '''epoch of a local date string'''
+    return pd.Timestamp(date).tz_localize('US/Eastern').value // 10**9
+
+
+def window_files(station, since, until):
+    '''the .par and .parx files of a station (or their archives) that may hold rows with since < Timestamp <= until,
+    as (start, file) in time order'''
+    _, file_list = get_par_files(station.path, suffix=par_watcher.suffixes)
+    # Archived files are replayed from their archive instead of parsed again
+    archived = par_archive.archived_files(os.path.join(archive_dir, station.name))
+    stems = {os.path.splitext(os.path.basename(file))[0] for file in archived}
+    file_list = archived + [file for file in file_list if os.path.splitext(os.path.basename(file))[0] not in stems]
+    starts, file_list = par_index.build_index(file_list)
+    first = par_index.first_file_index(starts, since)
+    return [(start, file) for start, file in zip(starts[first:], file_list[first:]) if start <= until]
+
+
+def read_window(file, since, until):
+    '''par_reader.ParData of the rows of a file or archive from a little before since, or None'''
+    if file.endswith(par_archive.suffix):
+        return par_archive.read_archive(file, since, until)
+    par, _ = read_par_tail(file, par_index.first_newer_offset(file, since))
+    return par
+
+
+def rescan_station(engine, allocator, station, since, until):
+    '''merges the rows of a station with since < Timestamp <= until into dbo.value, returns the number of new rows'''
+    files = [file for _, file in window_files(station, since, until)]
     new_records = 0
-    for file in file_list[index:]:
-        new_data = read_par(file, engine)
-        if new_data is not None:
-            send_to_db(new_data, engine)
-            new_records += len(new_data)
-
-    print(f"Added {new_records} rows to {database_name}")
+    # The next files are read while the current one is written
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        reads = deque(reader.submit(read_window, file, since, until) for file in files[:queue_depth])
+        for i in range(len(files)):
+            par = reads.popleft().result()
+            if i + queue_depth < len(files):
+                reads.append(reader.submit(read_window, files[i + queue_depth], since, until))
+            if par is None:
+                continue
+            new_data = format_par_data(par_reader.take_rows(par, par.Timestamp <= until), 0, since, station)
+            if new_data is not None:
+                new_data['Value_ID'] = allocator.allocate(len(new_data)) + np.arange(len(new_data))
+                new_records += bulk_writer.upsert_values(engine, new_data, batch_size)
+    return new_records
+
+
+def rescan(engine, station_list, since, until):
+    '''re-ingests a time window of the .par files without duplicating the rows already in dbo.value'''
+    prepare(engine)
+    allocator = id_allocator.ValueIDAllocator(engine)
+    for station in station_list:
+        try:
+            n = rescan_station(engine, allocator, station, since, until)
+            print(f"Added {n} missing rows from {station.name} to {database_name}")
+        except Exception as e:
+            print(f'{station.name}: {e}')
+
+
+def backfill_read(station, file, since, until):
+    '''par_records of the rows of a file or archive with since < Timestamp <= until, in a worker process'''
+    par = read_window(file, since, until)
+    if par is None:
+        return None
+    # Compact arrays are pickled back to the coordinator much faster than DataFrames
+    return par_records(par_reader.take_rows(par, par.Timestamp <= until), since, station)
+
+
+def backfill(engine, station_list, since, until, processes=None):
+    '''merges the .par and .parx files (or their archives) of a time window into dbo.value, parsed by a pool of processes'''
+    prepare(engine)
+    allocator = id_allocator.ValueIDAllocator(engine)
+    processes = processes or os.cpu_count()
+
+    # The files of all the stations, in the order of their first measurement
+    files = []
+    for station in station_list:
+        files += [(start, station, file) for start, file in window_files(station, since, until)]
+    files.sort(key=lambda item: item[0])
+
+    new_records = {station.name: 0 for station in station_list}
+    # Workers parse the next files while this process numbers and writes the records in time order
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        window = 2 * processes
+        reads = deque(pool.submit(backfill_read, station, file, since, until) for _, station, file in files[:window])
+        for i, (_, station, file) in enumerate(files):
+            future = reads.popleft()
+            if i + window < len(files):
+                _, next_station, next_file = files[i + window]
+                reads.append(pool.submit(backfill_read, next_station, next_file, since, until))
+            try:
+                records = future.result()
+            except Exception as e:
+                print(f'{file}: {e}')
+                continue
+            if records is None:
+                continue
+            metrics.count('rows_parsed', len(records[0]))
+            new_data = records_frame(*records, 0)
+            with metrics.timer('allocate'):
+                new_data['Value_ID'] = allocator.allocate(len(new_data)) + np.arange(len(new_data))
+            # Windows overlap what is already in dbo.value: always merged
+            new_records[station.name] += send_to_db(new_data, engine, merge=True)
+    for name, n in new_records.items():
+        print(f"Added {n} rows from {name} to {database_name}")
+
+
+def archive(station_list):
+    '''archives the finished .parx files of the stations not archived yet'''
+    for station in station_list:
+        try:
+            files, text_bytes, archive_bytes = par_archive.archive_directory(
+                station.path, os.path.join(archive_dir, station.name))
+        except Exception as e:
+            print(f'{station.name}: {e}')
+            continue
+        if files:
+            print(f'Archived {files} files of {station.name}: {text_bytes / 2**20:.1f} MiB to {archive_bytes / 2**20:.1f} MiB')
 
 
 # ________Main Script_________
-engine = connect_local(local_server, database_name)
-if engine_runs(engine):
-    print('local connection engine is running')
-else:
-    print('local connection engine failed to connect. Trying remote')
-    engine = connect_remote(remote_server, database_name, 'login.txt')
-    if engine_runs(engine):
-        print('remote connection engine is running')
-    else:
-        print('Remote connection engine failed to connect. Quitting.')
-
-try:
-    main(engine)
-except Exception as e:
-    print(e)
-finally:
-    engine.dispose()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest spectro::lyser .par files into the dateaubase')
+    parser.add_argument('mode', nargs='?', default='once', choices=['once', 'follow', 'watch', 'rescan', 'backfill', 'archive', 'create-index'],
+                        help='once: ingest the new data and quit; follow: keep reading the lines appended to the files; '
+                             'watch: like follow, but only when a .par file changes; '
+                             'rescan: merge the rows between --since and --until into the dateaubase; '
+                             'backfill: merge the rows between --since and --until of the .par and .parx files, '
+                             'parsed by --processes processes; archive: compress the finished .parx files into --archive-dir; '
+                             'create-index: create the (Metadata_ID, Timestamp) index of dbo.value that the other '
+                             'modes need (once, it locks the table while it is built)')
+    parser.add_argument('--interval', type=float, default=60,
+                        help='seconds between two passes in follow mode, longest polling interval in watch mode')
+    parser.add_argument('--debounce', type=float, default=2, help='seconds of changes batched into one pass in watch mode')
+    parser.add_argument('--poll', action='store_true', help='poll the directories in watch mode, even where inotify works')
+    parser.add_argument('--upsert', action='store_true',
+                        help='merge the records on (Metadata_ID, Timestamp) so that rows already written are not duplicated')
+    parser.add_argument('--since', help="start of the rescan or backfill window, local time ('2020-02-01 00:00')")
+    parser.add_argument('--until', help='end of the rescan or backfill window, local time (default: now)')
+    parser.add_argument('--processes', type=int, help='processes parsing the files in backfill mode (default: one per core)')
+    parser.add_argument('--checkpoint', default=checkpoint_file, help='local checkpoint file')
+    parser.add_argument('--archive-dir', default=archive_dir,
+                        help='directory of the .parx archives, written in archive mode and replayed in backfill mode')
+    parser.add_argument('--batch-size', type=int, default=batch_size, help='rows inserted per commit')
+    parser.add_argument('--stations', nargs='+', default=list(stations.stations), choices=list(stations.stations),
+                        help='stations to ingest')
+    parser.add_argument('--metrics-log', help="file receiving one JSON line of metrics per pass ('-' for stdout)")
+    parser.add_argument('--metrics-port', type=int, help='serve the metrics in the Prometheus text format on this port of 127.0.0.1')
+    parser.add_argument('--profile', nargs='?', const='anapro.prof',
+                        help='run every thread under cProfile and dump the merged stats to this file; the backfill '
+                             'processes are not profiled, their stages show in the metrics timers (--metrics-log)')
+    args = parser.parse_args()
+    checkpoint_file = args.checkpoint
+    archive_dir = args.archive_dir
+    batch_size = args.batch_size
+    upsert = args.upsert
+    if args.mode in ('rescan', 'backfill') and args.since is None:
+        parser.error(f'{args.mode} needs --since')
+    if args.metrics_log == '-':
+        metrics_log = sys.stdout
+    elif args.metrics_log is not None:
+        metrics_log = open(args.metrics_log, 'a')
+    if args.metrics_port is not None:
+        metrics.serve(args.metrics_port)
+    profiler = None
+    if args.profile is not None:
+        profiler = metrics.ThreadProfiler()
+        profiler.enable()
+
+    manager = connection_manager.ConnectionManager([
+        ('local', lambda: connect_local(local_server, database_name)),
+        ('remote', lambda: connect_remote(remote_server, database_name, 'login.txt')),
+    ], cache_file=endpoint_cache_file)
+
+    station_list = [stations.stations[name] for name in args.stations]
+    try:
+        if args.mode == 'follow':
+            follow(manager, station_list, args.interval)
+        elif args.mode == 'watch':
+            watcher = par_watcher.ParWatcher(
+                {station.name: station.path for station in station_list},
+                debounce=args.debounce, max_poll=args.interval, use_inotify=not args.poll)
+            try:
+                follow(manager, station_list, args.interval, watcher)
+            finally:
+                watcher.close()
+        elif args.mode == 'rescan':
+            until = time.time() if args.until is None else local_epoch(args.until)
+            rescan(manager.engine(), station_list, local_epoch(args.since), until)
+        elif args.mode == 'backfill':
+            until = time.time() if args.until is None else local_epoch(args.until)
+            backfill(manager.engine(), station_list, local_epoch(args.since), until, args.processes)
+        elif args.mode == 'archive':
+            archive(station_list)
+        elif args.mode == 'create-index':
+            create_index(manager.engine())
+        else:
+            engine = manager.engine()
+            print(f'{manager.current} connection engine is running')
+            main(engine, station_list)
+    except Exception as e:
+        print(e)
+        # The next run checks the endpoints again
+        manager.invalidate()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.dispose()
+        if profiler is not None:
+            profiler.disable()
+            stats = profiler.stats()
+            stats.dump_stats(args.profile)
+            stats.sort_stats('cumulative').print_stats(25)
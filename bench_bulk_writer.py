@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import bulk_writer
+from standin_db import create_standin
+
+# Times inserting a week of 1-minute spectro::lyser records (8 parameters)
+# into a local stand-in of dbo.value, with DataFrame.to_sql (the former
+# send_to_db) and with bulk_writer.insert_values.
+
+
+def week_of_values(first_ID=1, days=7):
+    n_rows = days * 24 * 60
+    timestamps = 1580533200 + 60 * np.arange(n_rows)
+    return pd.DataFrame({
+        'Value_ID': np.arange(first_ID, first_ID + 8 * n_rows),
+        'Value': np.random.default_rng(0).random(8 * n_rows),
+        'Number_of_experiment': 1,
+        'Metadata_ID': np.tile(np.arange(1, 9), n_rows),
+        'Comment_ID': np.nan,
+        'Timestamp': np.repeat(timestamps, 8),
+    })
+
+
+def with_to_sql(engine, df):
+    df.to_sql('value', con=engine, schema='dbo', if_exists='append', index=False)
+
+
+def with_bulk_writer(engine, df):
+    bulk_writer.insert_values(engine, df)
+
+
+def main(days, batch_size):
+    bulk_writer.batch_size = batch_size
+    df = week_of_values(days=days)
+    print(f'{len(df)} rows, batch size {batch_size}')
+    directory = tempfile.TemporaryDirectory()
+    for name, writer in [('to_sql', with_to_sql), ('bulk_writer', with_bulk_writer)]:
+        engine = create_standin(os.path.join(directory.name, f'{name}.sqlite'))
+        start = time.perf_counter()
+        writer(engine, df)
+        seconds = time.perf_counter() - start
+        count = engine.execute('SELECT COUNT(*) FROM dbo.value').scalar()
+        assert count == len(df)
+        print(f'{name:>12}: {seconds:6.2f} s  {len(df) / seconds:12,.0f} rows/s')
+        engine.dispose()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark inserts into a stand-in dbo.value')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--batch-size', type=int, default=bulk_writer.batch_size)
+    args = parser.parse_args()
+    main(args.days, args.batch_size)
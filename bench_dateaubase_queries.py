@@ -0,0 +1,100 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import dateaubase
+from standin_db import add_series, connect_standin
+
+# Times thousands of short range queries on a local stand-in of the
+# dateaubase, with the parameters inlined in the statement text (the former
+# str.format SQL, a new statement to compile for every range) and with bound
+# parameters (one statement text per query shape, compiled once and reused).
+
+series = [
+    ('NH4-N', 'Ammo_005', 'mg/l'),
+    ('pH', 'pH_001', 'pH'),
+    ('TSS', 'Spectro', 'mg/l'),
+]
+project = 'pilEAUte'
+location = 'Primary settling tank effluent'
+first_timestamp = 1578416400
+
+
+def fill_standin(conn, days):
+    '''registers the series and writes one value per minute for each'''
+    timestamps = first_timestamp + 60 * np.arange(days * 24 * 60)
+    value_ID = 1
+    for parameter, equipment, unit in series:
+        metadata_ID = add_series(conn, project, location, equipment, parameter, unit)
+        rows = [(value_ID + i, float(i), 1, metadata_ID, None, int(timestamp)) for i, timestamp in enumerate(timestamps)]
+        conn.executemany('INSERT INTO dbo.value VALUES (?, ?, ?, ?, ?, ?)', rows)
+        value_ID += len(rows)
+    conn.commit()
+
+
+def literal(value):
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return 'NULL' if value is None else str(value)
+
+
+def inline(query, params):
+    '''substitutes the parameters into the statement text'''
+    parts = query.split('?')
+    return parts[0] + ''.join(literal(value) + part for value, part in zip(params, parts[1:]))
+
+
+def range_queries(n_queries, days, window, catalog=None):
+    '''returns n_queries (query, params) pairs over random windows of the stand-in'''
+    rng = np.random.default_rng(0)
+    starts = first_timestamp + rng.integers(0, days * 86400 - window, n_queries)
+    queries = []
+    for i, start in enumerate(starts):
+        parameter, equipment, _ = series[i % len(series)]
+        extract = {'Project': project, 'Location': location, 'Equipment': equipment, 'Parameter': parameter}
+        queries.append(dateaubase.series_query(int(start), int(start) + window, extract, catalog))
+    return queries
+
+
+def run(conn, queries, bound):
+    '''returns (seconds, rows) to run every query'''
+    cursor = conn.cursor()
+    n_rows = 0
+    start = time.perf_counter()
+    for query, params in queries:
+        if bound:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(inline(query, params))
+        n_rows += len(cursor.fetchall())
+    return time.perf_counter() - start, n_rows
+
+
+def main(n_queries, days, window):
+    directory = tempfile.TemporaryDirectory()
+    conn = connect_standin(os.path.join(directory.name, 'dateaubase.sqlite'))
+    fill_standin(conn, days)
+    catalog = dateaubase.MetadataCatalog(conn)
+    print(f'{n_queries} queries of {window} s over {days} days of {len(series)} series')
+    for shape, shape_catalog in [('joins', None), ('catalog', catalog)]:
+        queries = range_queries(n_queries, days, window, shape_catalog)
+        results = {}
+        for name, bound in [('inlined', False), ('bound', True)]:
+            seconds, n_rows = run(conn, queries, bound)
+            results[name] = n_rows
+            print(f'{shape:>8} {name:>8}: {seconds:6.2f} s  {n_queries / seconds:10,.0f} queries/s  ({n_rows} rows)')
+        assert results['inlined'] == results['bound']
+    conn.close()
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark range queries on a stand-in dateaubase')
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--window', type=int, default=3600, help='seconds per query')
+    args = parser.parse_args()
+    main(args.queries, args.days, args.window)
@@ -0,0 +1,197 @@
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import AnaPro_37
+import dateaubase
+import instrument_schema
+import metrics
+import standin_db
+import stations
+import synthetic_par
+
+# End-to-end benchmark on synthetic data: generates the .par files of N
+# stations (synthetic_par.py), ingests them with AnaPro_37.main into a local
+# stand-in of the dateaubase (standin_db.py), appends a few rows to the newest
+# files and ingests them again like a follow pass, then pulls the series of
+# the first station back with dateaubase.extract_data. Reports rows/s, the
+# time spent in each stage of metrics.py and the peak traced memory.
+
+project = 'pilEAUte'
+
+# Local midnight of 2020-01-01
+first_epoch = 1577854800
+
+
+def register_station(conn, name, path, columns):
+    '''adds the series of a synthetic station to the stand-in and returns its Station'''
+    divisors = stations.stations['laval'].parameters
+    parameters = {}
+    for label, _, _, _ in columns:
+        column = instrument_schema.parse_label(label)
+        metadata_ID = standin_db.add_series(conn, project, name, name, column.parameter, column.unit)
+        parameters[column.parameter] = (metadata_ID, divisors[column.parameter][1])
+    return stations.Station(name=name, path=path, parameters=parameters)
+
+
+def generate(directory, n_stations, days, step, seed, **options):
+    '''writes the .par files of the stations and returns [(name, path, columns)] and the number of rows'''
+    layouts = [synthetic_par.laval_columns, synthetic_par.grandpiles_columns]
+    generated, n_rows = [], 0
+    for i in range(n_stations):
+        name = f'station_{i}'
+        path = os.path.join(directory, name)
+        columns = layouts[i % len(layouts)]
+        # Files of a previous run would be ingested too
+        shutil.rmtree(path, ignore_errors=True)
+        _, rows = synthetic_par.write_station(
+            path, first_epoch, first_epoch + days * 86400, columns, step, seed=seed + i, **options)
+        generated.append((name, path, columns))
+        n_rows += rows
+    return generated, n_rows
+
+
+def new_database(directory, generated, tag):
+    '''empty stand-in and checkpoint for one run, and the Stations writing to it'''
+    db_file = os.path.join(directory, f'{tag}.sqlite')
+    checkpoint_file = os.path.join(directory, f'{tag}_checkpoint.sqlite')
+    for f_name in [db_file, checkpoint_file]:
+        if os.path.exists(f_name):
+            os.remove(f_name)
+    conn = standin_db.connect_standin(db_file)
+    station_list = [register_station(conn, name, path, columns) for name, path, columns in generated]
+    conn.close()
+    return db_file, checkpoint_file, station_list
+
+
+def ingest(engine, checkpoint_file, station_list):
+    '''one AnaPro_37.main pass; returns its seconds and stage times'''
+    AnaPro_37.checkpoint_file = checkpoint_file
+    before = metrics.snapshot()
+    start = time.perf_counter()
+    # The per-station summary lines of main are not part of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        AnaPro_37.main(engine, station_list)
+    return time.perf_counter() - start, metrics.since(before)['timers']
+
+
+def append(generated, start, n_rows, step, seed):
+    '''appends n_rows rows to the newest file of each station'''
+    for i, (_, path, columns) in enumerate(generated):
+        newest = max(os.listdir(path))
+        synthetic_par.append_rows(os.path.join(path, newest), start, n_rows, columns, step, seed=seed + i)
+
+
+def extract_list(station, start, end):
+    return {
+        i: {'Start': start, 'End': end, 'Project': project, 'Location': station.name,
+            'Equipment': station.name, 'Parameter': parameter}
+        for i, parameter in enumerate(station.parameters)}
+
+
+def extract(db_file, entries, **options):
+    '''one dateaubase.extract_data pull; returns its seconds and number of values'''
+    conn = standin_db.connect_standin(db_file)
+    try:
+        start = time.perf_counter()
+        df = dateaubase.extract_data(conn, entries, **options)
+        return time.perf_counter() - start, int(df.count().sum())
+    finally:
+        conn.close()
+
+
+def traced(function, *args, **kwargs):
+    '''peak bytes traced while running function'''
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def ingestion_run(directory, generated, tag, append_rows, end, step, seed):
+    '''ingests the generated files, then the appended rows, into a new stand-in'''
+    db_file, checkpoint_file, station_list = new_database(directory, generated, tag)
+    engine = standin_db.create_standin(db_file)
+    try:
+        first = ingest(engine, checkpoint_file, station_list)
+        append(generated, end, append_rows, step, seed)
+        follow = ingest(engine, checkpoint_file, station_list)
+        records = engine.execute('SELECT COUNT(*) FROM dbo.value').scalar()
+    finally:
+        engine.dispose()
+    return db_file, station_list, first, follow, records
+
+
+def print_stages(timers):
+    print(f"{'stage':>12} {'seconds':>9} {'count':>7} {'ms each':>9}")
+    for stage, timer in sorted(timers.items(), key=lambda item: -item[1]['seconds']):
+        print(f"{stage:>12} {timer['seconds']:9.3f} {timer['count']:7d} {1000 * timer['seconds'] / timer['count']:9.2f}")
+
+
+def main(directory, n_stations, days, step, append_rows, seed, memory, **options):
+    start = time.perf_counter()
+    generated, n_rows = generate(directory, n_stations, days, step, seed, **options)
+    n_files = sum(len(os.listdir(path)) for _, path, _ in generated)
+    print(f'{n_stations} stations x {days} days: {n_rows:,} rows in {n_files} files '
+          f'(generated in {time.perf_counter() - start:.1f} s)')
+
+    end = first_epoch + days * 86400
+    db_file, station_list, (seconds, timers), (follow_seconds, follow_timers), records = ingestion_run(
+        directory, generated, 'timed', append_rows, end, step, seed)
+    # Every row gives one record per parameter, NaN values included
+    n_parameters = len(station_list[0].parameters)
+    assert records == (n_rows + n_stations * append_rows) * n_parameters, records
+
+    peak = None
+    if memory:
+        # Same run on a copy of the files, traced
+        fresh_directory = os.path.join(directory, 'traced')
+        fresh, _ = generate(fresh_directory, n_stations, days, step, seed, **options)
+        peak = traced(ingestion_run, fresh_directory, fresh, 'traced', append_rows, end, step, seed)
+
+    def peak_text(peak):
+        return '' if peak is None else f'  {peak / 2 ** 20:8.1f} MiB peak'
+
+    print(f'\nIngestion: {records:,} records')
+    print(f'{"first pass":>12}: {n_rows / seconds:12,.0f} rows/s  {seconds:8.2f} s{peak_text(peak)}')
+    print(f'{"follow pass":>12}: {n_stations * append_rows:12,} rows    {follow_seconds:8.2f} s')
+    print()
+    print_stages(timers)
+    print('\nFollow pass')
+    print_stages(follow_timers)
+
+    print(f'\nExtraction of {station_list[0].name} ({n_parameters} series)')
+    entries = extract_list(station_list[0], first_epoch - 1, end + append_rows * step)
+    stored = None
+    for name, pull in [('raw', {}), ('1h mean', {'resolution': '1h'})]:
+        seconds, values = extract(db_file, entries, **pull)
+        # Both pulls read the same stored records
+        stored = stored or values
+        peak = traced(extract, db_file, entries, **pull) if memory else None
+        print(f'{name:>12}: {stored / seconds:12,.0f} records/s  {seconds:6.2f} s  {values:,} values{peak_text(peak)}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ingestion and extraction on synthetic .par files')
+    parser.add_argument('--stations', type=int, default=3)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--step', type=int, default=60, help='seconds between two rows')
+    parser.add_argument('--append', type=int, default=60, help='rows appended to each station before the follow pass')
+    parser.add_argument('--nan-rate', type=float, default=0.005, help='share of rows without spectral values')
+    parser.add_argument('--failure-rate', type=float, default=0.2, help="share of hours with a 'Failure' status")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced runs measuring the peak memory')
+    parser.add_argument('--directory', help='where to write the files and databases (default: a temporary directory)')
+    args = parser.parse_args()
+    with contextlib.ExitStack() as stack:
+        directory = args.directory or stack.enter_context(tempfile.TemporaryDirectory())
+        main(directory, args.stations, args.days, args.step, args.append, args.seed, not args.no_memory,
+             nan_rate=args.nan_rate, failure_rate=args.failure_rate)
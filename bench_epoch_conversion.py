@@ -0,0 +1,63 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import dateaubase
+
+# Times clean_up_pulled_data on a synthetic pull of one value per minute,
+# with the former per-row conversion (time.localtime and pd.Timestamp for
+# every epoch) and with the vectorized dateaubase.epochs_to_datetimes.
+
+
+def synthetic_pull(n_rows):
+    return pd.DataFrame({
+        'Timestamp': 1577854800 + 60 * np.arange(n_rows),
+        'measurement': np.random.default_rng(0).random(n_rows),
+    })
+
+
+def clean_up_per_row(df, project, location, equipment, parameter):
+    '''clean_up_pulled_data as it was before the vectorized conversion'''
+    df['datetime'] = [pd.Timestamp(*time.localtime(x)[:6]) for x in df.Timestamp]
+    df.sort_values('datetime', axis=0, inplace=True)
+    df.drop(['Timestamp'], axis=1, inplace=True)
+    df.rename(columns={'measurement': dateaubase.series_name(project, location, equipment, parameter)}, inplace=True)
+    df.set_index('datetime', inplace=True, drop=True)
+    df = df[~df.index.duplicated(keep='first')]
+    return df
+
+
+def measure(clean_up, pull):
+    start = time.perf_counter()
+    df = clean_up(pull.copy(), 'pilEAUte', 'Primary settling tank effluent', 'Ammo_005', 'NH4-N')
+    return time.perf_counter() - start, df
+
+
+def main(n_rows):
+    # The per-row conversion uses the time zone of the host
+    os.environ['TZ'] = dateaubase.local_tz
+    time.tzset()
+    pull = synthetic_pull(n_rows)
+    print(f'{n_rows} rows')
+    results = {}
+    for name, clean_up in [('per row', clean_up_per_row), ('vectorized', dateaubase.clean_up_pulled_data)]:
+        seconds, results[name] = measure(clean_up, pull)
+        print(f'{name:>12}: {seconds:6.2f} s  {n_rows / seconds:12,.0f} rows/s')
+    before, after = results['per row'], results['vectorized']
+    assert before.index.equals(after.index)
+    # The former unstable sort kept an arbitrary value in the repeated hour of the fall DST change
+    naive = pd.to_datetime(pull.Timestamp, unit='s', utc=True).dt.tz_convert(dateaubase.local_tz).dt.tz_localize(None)
+    unambiguous = ~after.index.isin(naive[naive.duplicated()])
+    assert before[unambiguous].equals(after[unambiguous])
+    seconds, _ = measure(lambda df, *series: dateaubase.clean_up_pulled_data(df, *series, tz_aware=True), pull)
+    print(f'{"tz-aware":>12}: {seconds:6.2f} s  {n_rows / seconds:12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the epoch to datetime conversion of pulled data')
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    main(args.rows)
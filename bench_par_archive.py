@@ -0,0 +1,53 @@
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import par_archive
+import par_reader
+from bench_par_reader import parse_par
+
+# Compares the disk usage and read speed of .par text files with their
+# par_archive copies: pd.read_csv (parse_par), par_reader, and replaying the
+# archive as ParData or as a DataFrame.
+
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(directory, repeat):
+    files = sorted(glob.glob(os.path.join(directory, '*.par*')))
+    archive = tempfile.TemporaryDirectory()
+    for f_name in files:
+        par_archive.write_archive(par_archive.archive_name(f_name, archive.name), par_reader.read_par_file(f_name))
+    rows = sum(len(par.Timestamp) for par in par_archive.replay(archive.name))
+    text_bytes = sum(os.path.getsize(f_name) for f_name in files)
+    archive_bytes = sum(os.path.getsize(f_name) for f_name in par_archive.archived_files(archive.name))
+    print(f'{len(files)} files, {rows} rows: {text_bytes / 2 ** 20:.2f} MiB of text, '
+          f'{archive_bytes / 2 ** 20:.2f} MiB archived ({text_bytes / archive_bytes:.1f}x smaller)')
+
+    readers = [
+        ('pd.read_csv', lambda: [parse_par(f_name) for f_name in files]),
+        ('par_reader', lambda: [par_reader.read_par_file(f_name) for f_name in files]),
+        ('archive replay', lambda: list(par_archive.replay(archive.name))),
+        ('archive frame', lambda: par_archive.read_frame(archive.name)),
+    ]
+    for name, reader in readers:
+        seconds = best_time(reader, repeat)
+        print(f'{name:>16}: {rows / seconds:12,.0f} rows/s')
+    archive.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the .par archive against the text files')
+    parser.add_argument('directory', nargs='?', default='sample_files')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.directory, args.repeat)
@@ -0,0 +1,143 @@
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import par_reader
+from AnaPro_37 import format_par_data
+
+# Compares the former pandas path of AnaPro_37.py (parse_par and
+# format_values, kept below as they were) with the par_reader engine on the
+# .par/.parx files of a directory (rows/s and peak traced memory).
+
+# Column names of the spectro::lyser .par layout
+new_cols = [
+    'Datetime', 'Status', 'TSS', 'TSSinfo',
+    'NO3N', 'NO3Ninfo', 'COD', 'CODinfo',
+    'CODf', 'CODfinfo', 'NH4N', 'NH4Ninfo',
+    'K', 'Kinfo', 'pH', 'pHinfo',
+    'Temp', 'Tempinfo'
+]
+
+
+def parse_par(f_name, header=1):
+    '''loads .par data (a path or a buffer) into a DataFrame with the spectro::lyser columns'''
+    df = pd.read_csv(f_name, sep='\t', skiprows=0, encoding=par_reader.par_encoding, header=header)
+    df.columns = new_cols
+    return df
+
+
+def format_values(df, last_ID, last_Timestamp):
+    '''turns parsed .par rows into dbo.value records newer than last_Timestamp'''
+    # Select only the columns you need
+    cols_to_keep = ['Datetime', 'TSS', 'NO3N', 'COD', 'CODf', 'NH4N', 'K', 'pH', 'Temp']
+    df = df[cols_to_keep]
+
+    # Fill the 'NaN' values
+    df = df.fillna(0)
+
+    # Convert the datetime strings into epoch time
+    df['Datetime'] = pd.to_datetime(df['Datetime'], format='%Y.%m.%d  %H:%M:%S').dt.tz_localize('US/Eastern').astype(np.int64) // 10 ** 9
+
+    # Remove rows with a timestamp already in the dateaubase
+    time_mask = (df['Datetime'] > last_Timestamp)
+    df = df[time_mask]
+    if (not len(df)):
+        return None
+    # Stack the values into unique records
+    df.set_index('Datetime', inplace=True)
+    df2 = pd.DataFrame(df.stack())
+    df = df2
+    df.reset_index(inplace=True)
+
+    # Rename the columns
+    df.columns = ['Timestamp', 'Metadata_ID', 'Value']
+
+    # Map the parameter names to the correct metadata_id
+    mapping = {
+        'TSS': 5,
+        'NO3N': 6,
+        'COD': 7,
+        'CODf': 8,
+        'NH4N': 1,
+        'K': 2,
+        'pH': 3,
+        'Temp': 4
+    }
+    df['Metadata_ID'] = df['Metadata_ID'].map(mapping)
+
+    # Apply a factor of 1000 for rows where Metadata_ID is 5, 6, 7 or 8
+    # These contain values for TSS, NO3, COD and CODf respectively
+    mask = (df['Metadata_ID'] > 4)
+    df.loc[mask, 'Value'] = df['Value'] / 1000
+
+    # Add 'Number of experiments column
+    df['Number_of_experiment'] = 1
+    df['Comment_ID'] = np.nan
+
+    # Add the lastID value plus increment to the index of the new values
+    df.index = df.index + last_ID + 1
+
+    # Turn index into regular column
+    df.reset_index(inplace=True)
+    df.rename(columns={
+        'index': 'Value_ID'
+    }, inplace=True)
+
+    # reorder columns
+    df = df[['Value_ID', 'Value', 'Number_of_experiment', 'Metadata_ID', 'Comment_ID', 'Timestamp']]
+
+    # And return result!
+    return df
+
+
+
+def read_with_pandas(f_name):
+    return format_values(parse_par(f_name), 0, 0)
+
+
+def read_with_par_reader(f_name):
+    return format_par_data(par_reader.read_par_file(f_name), 0, 0)
+
+
+def measure(reader, files, repeat):
+    '''returns (seconds per pass, peak bytes) to read all files with reader'''
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for f_name in files:
+            reader(f_name)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    for f_name in files:
+        reader(f_name)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main(directory, repeat):
+    files = sorted(glob.glob(os.path.join(directory, '*.par*')))
+    rows = sum(len(par_reader.read_par_file(f_name).Timestamp) for f_name in files)
+
+    # Both paths must produce the same records
+    for f_name in files:
+        pd.testing.assert_frame_equal(read_with_pandas(f_name), read_with_par_reader(f_name), check_dtype=False)
+
+    print(f'{len(files)} files, {rows} rows')
+    for name, reader in [('pandas read_par', read_with_pandas), ('par_reader', read_with_par_reader)]:
+        seconds, peak = measure(reader, files, repeat)
+        print(f'{name:>16}: {rows / seconds:12,.0f} rows/s  {peak / 2 ** 20:8.1f} MiB peak')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the .par readers')
+    parser.add_argument('directory', nargs='?', default='sample_files')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.directory, args.repeat)
@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import par_index
+import par_reader
+import synthetic_par
+from AnaPro_37 import format_par_data, read_par_tail
+
+# Times resuming the ingestion inside one large .par file: parsing the whole
+# file and filtering the rows newer than the checkpoint, against bisecting the
+# memory-mapped file for the first new line and parsing only the rest.
+
+
+def parse_all(f_name, last_Timestamp):
+    return format_par_data(par_reader.read_par_file(f_name), 0, last_Timestamp)
+
+
+def bisect_then_parse(f_name, last_Timestamp):
+    par, _ = read_par_tail(f_name, par_index.first_newer_offset(f_name, last_Timestamp))
+    return None if par is None else format_par_data(par, 0, last_Timestamp)
+
+
+def main(days, fractions, repeat):
+    directory = tempfile.TemporaryDirectory()
+    start = 1577854800
+    # A single file holding all the rows
+    (f_name,), n_rows = synthetic_par.write_station(directory.name, start, start + days * 86400, rows=days * 1440 + 1)
+    size = os.path.getsize(f_name)
+    print(f'{n_rows} rows, {size / 2 ** 20:.1f} MiB')
+    for fraction in fractions:
+        last_Timestamp = start + int(fraction * days * 86400)
+        # Both paths must produce the same records
+        expected, found = parse_all(f_name, last_Timestamp), bisect_then_parse(f_name, last_Timestamp)
+        assert (expected is None and found is None) or np.array_equal(expected.to_numpy(), found.to_numpy(), equal_nan=True)
+        times = []
+        for reader in [parse_all, bisect_then_parse]:
+            best = float('inf')
+            for _ in range(repeat):
+                begin = time.perf_counter()
+                reader(f_name, last_Timestamp)
+                best = min(best, time.perf_counter() - begin)
+            times.append(best)
+        skipped = par_index.first_newer_offset(f_name, last_Timestamp)
+        print(f'resume at {fraction:4.0%}: parse all {1000 * times[0]:8.1f} ms, '
+              f'bisect {1000 * times[1]:8.1f} ms ({skipped / size:4.0%} of the file skipped)')
+    directory.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark resuming inside a large .par file')
+    parser.add_argument('--days', type=int, default=30, help='days of 1-minute rows in the file')
+    parser.add_argument('--at', type=float, nargs='+', default=[0.25, 0.5, 0.9, 0.99],
+                        help='resume points, as fractions of the file')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    main(args.days, args.at, args.repeat)
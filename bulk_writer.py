@@ -0,0 +1,203 @@
+import numpy as np
+
+# Batched inserts into dbo.value with one commit per batch.
+# pyodbc connections use fast_executemany with explicit parameter types
+# (the rows are sent as one bulk parameter array), pymssql connections use
+# multi-row INSERT ... VALUES statements and any other DB-API driver (such as
+# the sqlite3 stand-in) uses a plain executemany.
+# upsert_values is the idempotent variant: each batch goes through a session
+# staging table and is merged into dbo.value on (Metadata_ID, Timestamp), so
+# rows already in the table are updated instead of duplicated.
+
+value_columns = ['Value_ID', 'Value', 'Number_of_experiment', 'Metadata_ID', 'Comment_ID', 'Timestamp']
+
+# Default number of rows per commit
+batch_size = 10000
+
+# SQL Server accepts at most 1000 row constructors per INSERT ... VALUES
+max_rows_per_statement = 1000
+
+
+def pyodbc_input_sizes():
+    import pyodbc
+    # Explicit types let fast_executemany skip guessing them from the first row
+    return [
+        (pyodbc.SQL_BIGINT, 0, 0),   # Value_ID
+        (pyodbc.SQL_DOUBLE, 0, 0),   # Value
+        (pyodbc.SQL_INTEGER, 0, 0),  # Number_of_experiment
+        (pyodbc.SQL_INTEGER, 0, 0),  # Metadata_ID
+        (pyodbc.SQL_INTEGER, 0, 0),  # Comment_ID
+        (pyodbc.SQL_BIGINT, 0, 0),   # Timestamp
+    ]
+
+
+def to_rows(df, columns=value_columns):
+    '''converts the columns of df into a list of tuples of Python values, with None for NaN'''
+    data = []
+    for column in columns:
+        values = df[column].to_numpy()
+        if values.dtype.kind == 'f' and np.isnan(values).any():
+            values = values.astype(object)
+            values[df[column].isna().to_numpy()] = None
+        data.append(values.tolist())
+    return list(zip(*data))
+
+
+def insert_statement(table, columns, placeholder, n_rows=1):
+    row = '(' + ', '.join([placeholder] * len(columns)) + ')'
+    return f'INSERT INTO {table} ({", ".join(columns)}) VALUES ' + ', '.join([row] * n_rows)
+
+
+def insert_batch(cursor, driver, table, columns, rows):
+    if driver == 'pymssql':
+        # One round trip per statement of up to max_rows_per_statement rows
+        for start in range(0, len(rows), max_rows_per_statement):
+            chunk = rows[start:start + max_rows_per_statement]
+            query = insert_statement(table, columns, '%s', len(chunk))
+            cursor.execute(query, tuple(value for row in chunk for value in row))
+    else:
+        cursor.executemany(insert_statement(table, columns, '?'), rows)
+
+
+def insert_values(db_engine, df, batch_size=batch_size, table='dbo.value', columns=value_columns):
+    '''inserts the records of df into table, committing once per batch_size rows'''
+    rows = to_rows(df, columns)
+    if not rows:
+        return 0
+
+    driver = db_engine.dialect.driver
+    conn = db_engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        if driver == 'pyodbc':
+            cursor.fast_executemany = True
+            if columns == value_columns:
+                cursor.setinputsizes(pyodbc_input_sizes())
+        for start in range(0, len(rows), batch_size):
+            insert_batch(cursor, driver, table, columns, rows[start:start + batch_size])
+            conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return len(rows)
+
+
+DEDUPE_INDEX = {
+    'mssql': '''
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_value_Metadata_ID_Timestamp' AND object_id = OBJECT_ID('dbo.value'))
+    CREATE INDEX IX_value_Metadata_ID_Timestamp ON dbo.value (Metadata_ID, Timestamp);
+''',
+    'sqlite': 'CREATE INDEX IF NOT EXISTS dbo.value_metadata_timestamp ON value (Metadata_ID, Timestamp);',
+}
+
+HAS_DEDUPE_INDEX = {
+    'mssql': "SELECT 1 FROM sys.indexes WHERE name = 'IX_value_Metadata_ID_Timestamp' AND object_id = OBJECT_ID('dbo.value');",
+    'sqlite': "SELECT 1 FROM dbo.sqlite_master WHERE type = 'index' AND name = 'value_metadata_timestamp';",
+}
+
+STAGING_TABLE = {'mssql': '#value_staging', 'sqlite': 'temp.value_staging'}
+
+CREATE_STAGING = {
+    'mssql': '''
+IF OBJECT_ID('tempdb..#value_staging') IS NULL
+    CREATE TABLE #value_staging (
+        Value_ID BIGINT, Value FLOAT, Number_of_experiment INT, Metadata_ID INT, Comment_ID INT, Timestamp BIGINT);
+''',
+    'sqlite': '''
+CREATE TEMP TABLE IF NOT EXISTS value_staging (
+    Value_ID INTEGER, Value REAL, Number_of_experiment INTEGER, Metadata_ID INTEGER, Comment_ID INTEGER, Timestamp INTEGER);
+''',
+}
+
+# Statements merging the staging table into dbo.value. The last one returns
+# the number of inserted rows (rows with a new (Metadata_ID, Timestamp)).
+MERGE = {
+    'mssql': ['''
+SET NOCOUNT ON;
+DECLARE @actions TABLE (Action NVARCHAR(10));
+MERGE dbo.value WITH (HOLDLOCK) AS target
+USING #value_staging AS source
+ON target.Metadata_ID = source.Metadata_ID AND target.Timestamp = source.Timestamp
+WHEN MATCHED AND EXISTS (SELECT source.Value EXCEPT SELECT target.Value) THEN
+    UPDATE SET Value = source.Value
+WHEN NOT MATCHED BY TARGET THEN
+    INSERT (Value_ID, Value, Number_of_experiment, Metadata_ID, Comment_ID, Timestamp)
+    VALUES (source.Value_ID, source.Value, source.Number_of_experiment, source.Metadata_ID, source.Comment_ID, source.Timestamp)
+OUTPUT $action INTO @actions;
+SELECT COUNT(*) FROM @actions WHERE Action = 'INSERT';
+'''],
+    'sqlite': ['''
+UPDATE dbo.value
+SET Value = s.Value
+FROM temp.value_staging AS s
+WHERE s.Metadata_ID = value.Metadata_ID AND s.Timestamp = value.Timestamp AND s.Value IS NOT value.Value;
+''', '''
+INSERT INTO dbo.value (Value_ID, Value, Number_of_experiment, Metadata_ID, Comment_ID, Timestamp)
+SELECT s.Value_ID, s.Value, s.Number_of_experiment, s.Metadata_ID, s.Comment_ID, s.Timestamp
+FROM temp.value_staging AS s
+WHERE NOT EXISTS (SELECT 1 FROM dbo.value AS v WHERE v.Metadata_ID = s.Metadata_ID AND v.Timestamp = s.Timestamp);
+'''],
+}
+
+
+def has_dedupe_index(db_engine):
+    '''whether dbo.value has the (Metadata_ID, Timestamp) index of ensure_dedupe_index'''
+    return db_engine.execute(HAS_DEDUPE_INDEX[db_engine.dialect.name]).scalar() is not None
+
+
+def ensure_dedupe_index(db_engine):
+    '''creates the (Metadata_ID, Timestamp) index of dbo.value used by upsert_values and the station lookups if needed'''
+    # Building it locks dbo.value for a while: only called on request (AnaPro_37.py create-index)
+    conn = db_engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(DEDUPE_INDEX[db_engine.dialect.name])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def merge_batch(cursor, dialect):
+    '''merges the staging table into dbo.value and returns the number of inserted rows'''
+    for statement in MERGE[dialect][:-1]:
+        cursor.execute(statement)
+    cursor.execute(MERGE[dialect][-1])
+    if dialect == 'mssql':
+        return cursor.fetchone()[0]
+    return cursor.rowcount
+
+
+def upsert_values(db_engine, df, batch_size=batch_size):
+    '''merges the records of df into dbo.value on (Metadata_ID, Timestamp) and returns the number of new rows'''
+    # Within df the last record of a (Metadata_ID, Timestamp) wins
+    df = df.drop_duplicates(['Metadata_ID', 'Timestamp'], keep='last')
+    rows = to_rows(df, value_columns)
+    if not rows:
+        return 0
+
+    dialect = db_engine.dialect.name
+    driver = db_engine.dialect.driver
+    staging = STAGING_TABLE[dialect]
+    inserted = 0
+    conn = db_engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CREATE_STAGING[dialect])
+        if driver == 'pyodbc':
+            cursor.fast_executemany = True
+            cursor.setinputsizes(pyodbc_input_sizes())
+        for start in range(0, len(rows), batch_size):
+            cursor.execute(f'DELETE FROM {staging};')
+            insert_batch(cursor, driver, staging, value_columns, rows[start:start + batch_size])
+            inserted += merge_batch(cursor, dialect)
+            conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return inserted
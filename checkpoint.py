@@ -0,0 +1,104 @@
+import os
+import sqlite3
+
+# Local ingestion checkpoint: what was last sent to the dateaubase for each
+# source (a .par directory), how far each .par file was read and the last
+# directory listing. SQLite keeps every update atomic and journaled.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS source (
+    Source TEXT PRIMARY KEY,
+    Value_ID INTEGER NOT NULL,
+    Timestamp INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS par_file (
+    Source TEXT NOT NULL,
+    Filename TEXT NOT NULL,
+    Offset INTEGER NOT NULL,
+    Mtime REAL NOT NULL,
+    PRIMARY KEY (Source, Filename)
+);
+-- Listings of the former layout, cached without their suffix
+DROP TABLE IF EXISTS listing;
+DROP TABLE IF EXISTS listing_mtime;
+CREATE TABLE IF NOT EXISTS file_listing (
+    Source TEXT NOT NULL,
+    Suffix TEXT NOT NULL,
+    Filename TEXT NOT NULL,
+    PRIMARY KEY (Source, Suffix, Filename)
+);
+CREATE TABLE IF NOT EXISTS file_listing_mtime (
+    Source TEXT NOT NULL,
+    Suffix TEXT NOT NULL,
+    Mtime REAL NOT NULL,
+    PRIMARY KEY (Source, Suffix)
+);
+'''
+
+
+def open_checkpoint(filename):
+    '''opens (and creates if needed) the checkpoint database'''
+    conn = sqlite3.connect(filename, check_same_thread=False)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_last(conn, source):
+    '''returns the (Value_ID, Timestamp) last sent for source, or None'''
+    row = conn.execute('SELECT Value_ID, Timestamp FROM source WHERE Source = ?', (source,)).fetchone()
+    return row
+
+
+def save_last(conn, source, last_ID, last_Timestamp):
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO source (Source, Value_ID, Timestamp) VALUES (?, ?, ?)',
+            (source, int(last_ID), int(last_Timestamp))
+        )
+
+
+def load_offsets(conn, source):
+    '''returns {filename: (offset, mtime)} for the files of source'''
+    rows = conn.execute('SELECT Filename, Offset, Mtime FROM par_file WHERE Source = ?', (source,))
+    return {filename: (offset, mtime) for filename, offset, mtime in rows}
+
+
+def save_offset(conn, source, filename, offset, mtime):
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO par_file (Source, Filename, Offset, Mtime) VALUES (?, ?, ?, ?)',
+            (source, filename, int(offset), mtime)
+        )
+
+
+def forget_files(conn, source, filenames):
+    with conn:
+        conn.executemany(
+            'DELETE FROM par_file WHERE Source = ? AND Filename = ?',
+            [(source, filename) for filename in filenames]
+        )
+
+
+def list_files(conn, source, directory, suffix):
+    '''lists the files of directory ending with suffix (a string or a tuple of them),
+    reusing the stored listing while the directory is unchanged'''
+    # Listings of other suffixes are cached apart
+    key = suffix if isinstance(suffix, str) else '|'.join(suffix)
+    mtime = os.stat(directory).st_mtime
+    row = conn.execute(
+        'SELECT Mtime FROM file_listing_mtime WHERE Source = ? AND Suffix = ?', (source, key)).fetchone()
+    if row is not None and row[0] == mtime:
+        rows = conn.execute(
+            'SELECT Filename FROM file_listing WHERE Source = ? AND Suffix = ? ORDER BY Filename', (source, key))
+        return [filename for filename, in rows]
+
+    filenames = sorted(file for file in os.listdir(directory) if file.endswith(suffix))
+    with conn:
+        conn.execute('DELETE FROM file_listing WHERE Source = ? AND Suffix = ?', (source, key))
+        conn.executemany(
+            'INSERT INTO file_listing (Source, Suffix, Filename) VALUES (?, ?, ?)',
+            [(source, key, filename) for filename in filenames]
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO file_listing_mtime (Source, Suffix, Mtime) VALUES (?, ?, ?)', (source, key, mtime))
+    return filenames
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Picks a live dateaubase endpoint among several (local server first, remote
+# as a fallback). Engines are created once and keep their connection pool,
+# liveness is checked with SELECT 1 on every endpoint at once, and the last
+# good endpoint is trusted for ttl seconds, across runs when a cache file is
+# given.
+
+# Seconds during which the last good endpoint is used without a new check
+ttl = 300
+
+
+def is_alive(engine):
+    '''cheap liveness check of an engine'''
+    try:
+        with engine.connect() as conn:
+            conn.execute('SELECT 1').scalar()
+    except Exception:
+        return False
+    return True
+
+
+class ConnectionManager:
+    '''hands out the engine of the preferred live endpoint'''
+
+    def __init__(self, endpoints, ttl=ttl, cache_file=None):
+        # endpoints: list of (name, function creating the engine), by preference
+        self.endpoints = list(endpoints)
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.engines = {}
+        self.current = None
+        self.checked = 0
+        self.lock = threading.Lock()
+        self.load_cache()
+
+    def load_cache(self):
+        if self.cache_file is None or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cache.get('endpoint') in dict(self.endpoints):
+            self.current = cache['endpoint']
+            self.checked = cache['checked']
+
+    def save_cache(self):
+        if self.cache_file is None:
+            return
+        with open(self.cache_file, 'w') as f:
+            json.dump({'endpoint': self.current, 'checked': self.checked}, f)
+
+    def get_engine(self, name):
+        if name not in self.engines:
+            self.engines[name] = dict(self.endpoints)[name]()
+        return self.engines[name]
+
+    def probe(self):
+        '''checks every endpoint in parallel and returns the preferred live one, or None'''
+        with ThreadPoolExecutor(max_workers=len(self.endpoints)) as pool:
+            alive = list(pool.map(lambda endpoint: is_alive(self.get_engine(endpoint[0])), self.endpoints))
+        for (name, _), ok in zip(self.endpoints, alive):
+            if ok:
+                return name
+        return None
+
+    def engine(self):
+        '''returns the engine of a live endpoint, checking them again once the ttl has expired'''
+        with self.lock:
+            if self.current is None or time.time() - self.checked > self.ttl:
+                self.current = self.probe()
+                if self.current is None:
+                    raise ConnectionError('No dateaubase endpoint is reachable')
+                self.checked = time.time()
+                self.save_cache()
+            return self.get_engine(self.current)
+
+    def invalidate(self):
+        '''forgets the current endpoint after a failure so that the next call checks them again'''
+        with self.lock:
+            self.current = None
+            self.checked = 0
+            self.save_cache()
+
+    def dispose(self):
+        for engine in self.engines.values():
+            engine.dispose()
+        self.engines = {}
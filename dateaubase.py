@@ -1,11 +1,15 @@
 # ## ATTENTION: This script only works on Windows with
 # ## a VPN connection opened to the DatEAUbase Server
+import numpy as np
 import pandas as pd
-import pyodbc
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+
 
 def create_connection():
+    import pyodbc
     with open('login.txt') as f:
         usr = f.readline().strip()
         pwd = f.readline().strip()
@@ -29,15 +33,32 @@ def create_connection():
     return cursor, conn
 
 
+# Time zone of the naive dates used by the dateaubase users
+local_tz = 'US/Eastern'
+
+
 def date_to_epoch(date):
-    naive_datetime = pd.to_datetime(date)
-    local_datetime = naive_datetime.tz_localize(tz='US/Eastern')
-    return int(local_datetime.value / 10**9)
+    return int(dates_to_epochs([date])[0])
+
+
+def dates_to_epochs(dates):
+    '''epochs of an array of dates, naive ones being local_tz wall times'''
+    datetimes = pd.DatetimeIndex(pd.to_datetime(dates))
+    if datetimes.tz is None:
+        datetimes = datetimes.tz_localize(local_tz)
+    return ((datetimes - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(np.int64)
 
 
-def epoch_to_pandas_datetime(epoch):
-    local_time = time.localtime(epoch)
-    return pd.Timestamp(*local_time[:6])
+def epoch_to_pandas_datetime(epoch, tz_aware=False):
+    return epochs_to_datetimes([epoch], tz_aware)[0]
+
+
+def epochs_to_datetimes(epochs, tz_aware=False):
+    '''DatetimeIndex of an array of epochs in local_tz, naive unless tz_aware'''
+    datetimes = pd.to_datetime(np.asarray(epochs, dtype=np.int64), unit='s', utc=True).tz_convert(local_tz)
+    if not tz_aware:
+        datetimes = datetimes.tz_localize(None)
+    return datetimes
 
 
 def get_projects(connection):
@@ -56,10 +77,10 @@ FROM sampling_points
 left outer join dbo.project_has_sampling_points on dbo.project_has_sampling_points.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
 left outer join dbo.project on dbo.project.Project_ID = dbo.project_has_sampling_points.Project_ID
 WHERE
-dbo.project.Project_name = \'{}\'
+dbo.project.Project_name = ?
 ORDER BY dbo.project.Project_ID ASC;
-'''.format(project)
-    locations = pd.read_sql(query, connection)
+'''
+    locations = pd.read_sql(query, connection, params=[project])
     return locations
 
 
@@ -72,10 +93,10 @@ def get_equipment(connection, project, location):
     left outer join dbo.project_has_sampling_points on dbo.project_has_sampling_points.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
     left outer join dbo.project on dbo.project.Project_ID = dbo.project_has_sampling_points.Project_ID
     WHERE
-    dbo.project.Project_name = \'{}\'
-    AND dbo.sampling_points.Sampling_location = \'{}\'
-    ORDER BY dbo.project.Project_ID ASC;'''.format(project, location)
-    equipment = pd.read_sql(query, connection)
+    dbo.project.Project_name = ?
+    AND dbo.sampling_points.Sampling_location = ?
+    ORDER BY dbo.project.Project_ID ASC;'''
+    equipment = pd.read_sql(query, connection, params=[project, location])
     return equipment
 
 
@@ -91,12 +112,12 @@ def get_parameters(connection, project, location, equipment):
     left outer join dbo.project_has_sampling_points on dbo.project_has_sampling_points.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
     left outer join dbo.project on dbo.project.Project_ID = dbo.project_has_sampling_points.Project_ID
     WHERE
-    dbo.project.Project_name = \'{}\'
-    AND dbo.sampling_points.Sampling_location = \'{}\'
-    AND dbo.equipment.Equipment_identifier = \'{}\'
+    dbo.project.Project_name = ?
+    AND dbo.sampling_points.Sampling_location = ?
+    AND dbo.equipment.Equipment_identifier = ?
     ORDER BY dbo.project.Project_ID ASC;
-    '''.format(project, location, equipment)
-    parameters = pd.read_sql(query, connection)
+    '''
+    parameters = pd.read_sql(query, connection, params=[project, location, equipment])
     return parameters
 
 
@@ -113,18 +134,18 @@ def get_units(connection, project, location, equipment, parameter):
     left outer join dbo.project_has_sampling_points on dbo.project_has_sampling_points.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
     left outer join dbo.project on dbo.project.Project_ID = dbo.project_has_sampling_points.Project_ID
     WHERE
-    dbo.project.Project_name = \'{}\'
-    AND dbo.sampling_points.Sampling_location = \'{}\'
-    AND dbo.equipment.Equipment_identifier = \'{}\'
-    AND dbo.parameter.Parameter = \'{}\'
+    dbo.project.Project_name = ?
+    AND dbo.sampling_points.Sampling_location = ?
+    AND dbo.equipment.Equipment_identifier = ?
+    AND dbo.parameter.Parameter = ?
     ORDER BY dbo.project.Project_ID ASC;
-    '''.format(project, location, equipment, parameter)
-    units = pd.read_sql(query, connection)
+    '''
+    units = pd.read_sql(query, connection, params=[project, location, equipment, parameter])
     return units
 
 
-def build_query(start, end, project, location, equipment, parameter):
-    return '''SELECT dbo.value.Timestamp,
+# Value query of build_query_params: one statement text for every series and range
+value_query = '''SELECT dbo.value.Timestamp,
 dbo.value.Value as measurement,
 dbo.parameter.Parameter as par,
 dbo.unit.Unit,
@@ -139,53 +160,282 @@ left outer join dbo.unit on dbo.parameter.Unit_ID = dbo.unit.Unit_ID
 left outer join dbo.equipment on dbo.metadata.Equipment_ID = dbo.equipment.Equipment_ID
 left outer join dbo.sampling_points on dbo.metadata.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
 left outer join dbo.project on dbo.metadata.Project_ID = dbo.project.Project_ID
-WHERE dbo.value.Timestamp > {}
-AND dbo.value.Timestamp < {}
-AND dbo.sampling_points.Sampling_location = \'{}\'
-AND dbo.parameter.Parameter = \'{}\'
-AND dbo.equipment.Equipment_identifier = \'{}\'
-AND dbo.project.Project_name = \'{}\'
+WHERE dbo.value.Timestamp > ?
+AND dbo.value.Timestamp < ?
+AND dbo.sampling_points.Sampling_location = ?
+AND dbo.parameter.Parameter = ?
+AND dbo.equipment.Equipment_identifier = ?
+AND dbo.project.Project_name = ?
 order by dbo.value.Value_ID;
-'''.format(start, end, location, parameter, equipment, project)
+'''
 
 
-def get_span(connection, project, location, equipment, parameter):
-    query = '''SELECT  MIN(dbo.value.Timestamp), MAX(dbo.value.Timestamp)
-    FROM dbo.parameter
-    left outer join dbo.metadata on dbo.parameter.Parameter_ID = dbo.metadata.Parameter_ID
-    left outer join dbo.value on dbo.value.Metadata_ID = dbo.metadata.Metadata_ID
-    left outer join dbo.unit on dbo.parameter.Unit_ID = dbo.unit.Unit_ID
-    left outer join dbo.equipment on dbo.metadata.Equipment_ID = dbo.equipment.Equipment_ID
-    left outer join dbo.sampling_points on dbo.metadata.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
-    left outer join dbo.project on dbo.metadata.Project_ID = dbo.project.Project_ID
-    WHERE dbo.sampling_points.Sampling_location = \'{}\'
-    AND dbo.parameter.Parameter = \'{}\'
-    AND dbo.equipment.Equipment_identifier = \'{}\'
-    AND dbo.project.Project_name = \'{}\';
-    '''.format(location, parameter, equipment, project)
+def sql_literal(text):
+    '''quoted SQL string literal of text'''
+    return "'{}'".format(str(text).replace("'", "''"))
 
-    df = pd.read_sql(query, connection)
+
+def build_query(start, end, project, location, equipment, parameter):
+    '''returns the value query of a series over (start, end) as SQL text, see build_query_params'''
+    literals = [sql_literal(text) for text in (location, parameter, equipment, project)]
+    return value_query.replace('?', '{}').format(int(start), int(end), *literals)
+
+
+def build_query_params(start, end, project, location, equipment, parameter):
+    '''returns the (query, params) pair of build_query to pass to pd.read_sql'''
+    return value_query, [int(start), int(end), location, parameter, equipment, project]
+
+
+# Columns of the metadata tables kept by MetadataCatalog
+catalog_tables = {
+    'project': ['Project_ID', 'Project_name'],
+    'sampling_points': ['Sampling_point_ID', 'Sampling_location', 'Description'],
+    'project_has_sampling_points': ['Project_ID', 'Sampling_point_ID'],
+    'equipment': ['Equipment_ID', 'Equipment_identifier', 'Equipment_model_ID'],
+    'equipment_has_sampling_points': ['Equipment_ID', 'Sampling_point_ID'],
+    'equipment_model_has_parameter': ['Equipment_model_ID', 'Parameter_ID'],
+    'parameter': ['Parameter_ID', 'Parameter', 'Unit_ID'],
+    'unit': ['Unit_ID', 'Unit'],
+    'metadata': ['Metadata_ID', 'Parameter_ID', 'Equipment_ID', 'Sampling_point_ID', 'Project_ID'],
+}
+
+
+class MetadataCatalog:
+    '''metadata tables loaded once and refreshed after ttl seconds, answering the get_* queries locally'''
+
+    def __init__(self, connection, ttl=3600):
+        self.connection = connection
+        self.ttl = ttl
+        self.loaded = None
+        self.tables = {}
+
+    def refresh(self, force=False):
+        if force or self.loaded is None or time.time() - self.loaded > self.ttl:
+            for table, columns in catalog_tables.items():
+                query = 'SELECT {} FROM dbo.{};'.format(', '.join(columns), table)
+                self.tables[table] = pd.read_sql(query, self.connection)
+            self.loaded = time.time()
+        return self.tables
+
+    def project_points(self, project):
+        tables = self.refresh()
+        projects = tables['project'][tables['project'].Project_name == project]
+        points = tables['project_has_sampling_points'].merge(projects, on='Project_ID')
+        return tables['sampling_points'].merge(points, on='Sampling_point_ID')
+
+    def location_equipment(self, project, location):
+        tables = self.refresh()
+        points = self.project_points(project)
+        points = points[points.Sampling_location == location]
+        equipment = tables['equipment_has_sampling_points'].merge(points, on='Sampling_point_ID')
+        return tables['equipment'].merge(equipment, on='Equipment_ID')
+
+    def equipment_parameters(self, project, location, equipment):
+        tables = self.refresh()
+        found = self.location_equipment(project, location)
+        found = found[found.Equipment_identifier == equipment]
+        parameters = tables['equipment_model_has_parameter'].merge(found, on='Equipment_model_ID')
+        return tables['parameter'].merge(parameters, on='Parameter_ID')
+
+    def projects(self):
+        names = self.refresh()['project'].Project_name.drop_duplicates().sort_values()
+        return pd.DataFrame({'Project_name': names.to_numpy()})
+
+    def locations(self, project):
+        return self.project_points(project)[['Description']].reset_index(drop=True)
+
+    def equipment(self, project, location):
+        return self.location_equipment(project, location)[['Equipment_identifier']].reset_index(drop=True)
+
+    def parameters(self, project, location, equipment):
+        return self.equipment_parameters(project, location, equipment)[['Parameter']].reset_index(drop=True)
+
+    def units(self, project, location, equipment, parameter):
+        found = self.equipment_parameters(project, location, equipment)
+        found = found[found.Parameter == parameter]
+        return self.refresh()['unit'].merge(found[['Unit_ID']], on='Unit_ID')[['Unit']]
+
+    def metadata_IDs(self, project, location, equipment, parameter):
+        '''Metadata_IDs of a (project, location, equipment, parameter) series, as resolved by build_query'''
+        tables = self.refresh()
+        metadata = tables['metadata']
+        metadata = metadata.merge(tables['parameter'][tables['parameter'].Parameter == parameter], on='Parameter_ID')
+        metadata = metadata.merge(
+            tables['equipment'][tables['equipment'].Equipment_identifier == equipment], on='Equipment_ID')
+        metadata = metadata.merge(
+            tables['sampling_points'][tables['sampling_points'].Sampling_location == location], on='Sampling_point_ID')
+        metadata = metadata.merge(tables['project'][tables['project'].Project_name == project], on='Project_ID')
+        return sorted(int(metadata_ID) for metadata_ID in metadata.Metadata_ID)
+
+
+def id_placeholders(metadata_IDs):
+    '''returns the placeholders and params of a Metadata_ID IN (...) list'''
+    # Pad the list to a power of two so that few statement texts exist
+    metadata_IDs = [int(metadata_ID) for metadata_ID in metadata_IDs] or [None]
+    size = 1
+    while size < len(metadata_IDs):
+        size *= 2
+    metadata_IDs += [metadata_IDs[-1]] * (size - len(metadata_IDs))
+    return ', '.join(['?'] * size), metadata_IDs
+
+
+def build_value_query(start, end, metadata_IDs):
+    '''build_query_params on dbo.value alone, for Metadata_IDs resolved by a MetadataCatalog'''
+    placeholders, params = id_placeholders(metadata_IDs)
+    query = '''SELECT Timestamp, Value as measurement
+FROM dbo.value
+WHERE Metadata_ID IN ({})
+AND Timestamp > ?
+AND Timestamp < ?
+order by Value_ID;
+'''.format(placeholders)
+    return query, params + [int(start), int(end)]
+
+
+def series_query(start, end, series, catalog=None):
+    '''(query, params) of an extract_list entry over (start, end), without joins when a catalog is given'''
+    if catalog is not None:
+        metadata_IDs = catalog.metadata_IDs(series['Project'], series['Location'], series['Equipment'], series['Parameter'])
+        return build_value_query(start, end, metadata_IDs)
+    return build_query_params(start, end, series['Project'], series['Location'], series['Equipment'], series['Parameter'])
+
+
+# Metadata_IDs of a series, resolved on the server
+metadata_ID_query = '''SELECT dbo.metadata.Metadata_ID
+FROM dbo.metadata
+inner join dbo.parameter on dbo.metadata.Parameter_ID = dbo.parameter.Parameter_ID
+inner join dbo.equipment on dbo.metadata.Equipment_ID = dbo.equipment.Equipment_ID
+inner join dbo.sampling_points on dbo.metadata.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
+inner join dbo.project on dbo.metadata.Project_ID = dbo.project.Project_ID
+WHERE dbo.sampling_points.Sampling_location = ?
+AND dbo.parameter.Parameter = ?
+AND dbo.equipment.Equipment_identifier = ?
+AND dbo.project.Project_name = ?'''
+
+
+def series_filter(series, catalog=None):
+    '''(condition, params) selecting the dbo.value rows of an extract_list entry'''
+    if catalog is not None:
+        placeholders, params = id_placeholders(
+            catalog.metadata_IDs(series['Project'], series['Location'], series['Equipment'], series['Parameter']))
+        return 'Metadata_ID IN ({})'.format(placeholders), params
+    params = [series['Location'], series['Parameter'], series['Equipment'], series['Project']]
+    return 'Metadata_ID IN ({})'.format(metadata_ID_query), params
+
+
+# SQL functions of the aggregates computed on the server ('last' is a window query)
+aggregates = {'mean': 'AVG', 'min': 'MIN', 'max': 'MAX', 'last': None}
+
+
+def resolution_seconds(resolution):
+    '''bucket width in seconds of a resolution such as '15min' or 900'''
+    if isinstance(resolution, str):
+        seconds = int(pd.Timedelta(resolution).total_seconds())
+    else:
+        seconds = int(resolution)
+    # Buckets are aligned on UTC: only widths dividing an hour start on the local hours
+    if seconds <= 0 or 3600 % seconds:
+        raise ValueError('resolution must divide one hour, got {!r}'.format(resolution))
+    return seconds
+
+
+def build_aggregate_query(start, end, series, resolution, aggregate='mean', catalog=None):
+    '''(query, params) returning one aggregated measurement per time bucket of a series over (start, end)'''
+    if aggregate not in aggregates:
+        raise ValueError('aggregate must be one of {}'.format(', '.join(aggregates)))
+    seconds = resolution_seconds(resolution)
+    condition, params = series_filter(series, catalog)
+    # Buckets are aligned on the epoch (UTC) and labelled by their first second. Of
+    # duplicated timestamps only the first Value_ID counts, like clean_up_pulled_data
+    bucketed = '''SELECT Timestamp / ? AS Bucket, Timestamp, Value_ID, Value
+FROM (
+SELECT Timestamp, Value_ID, Value, ROW_NUMBER() OVER (PARTITION BY Timestamp ORDER BY Value_ID) AS Duplicate_rank
+FROM dbo.value
+WHERE {}
+AND Timestamp > ?
+AND Timestamp < ?
+) AS deduplicated
+WHERE Duplicate_rank = 1
+AND Value IS NOT NULL'''.format(condition)
+    # Bucket * ? of the outer query, then Timestamp / ? and the filter of the inner one
+    params = [seconds, seconds] + params + [int(start), int(end)]
+    if aggregate == 'last':
+        # Value at the latest timestamp of each bucket, first Value_ID on ties
+        query = '''SELECT Bucket * ? AS Timestamp, Value AS measurement
+FROM (
+SELECT Bucket, Value, ROW_NUMBER() OVER (PARTITION BY Bucket ORDER BY Timestamp DESC, Value_ID ASC) AS Row_rank
+FROM ({}) AS bucketed
+) AS ranked
+WHERE Row_rank = 1
+ORDER BY Bucket;
+'''.format(bucketed)
+    else:
+        query = '''SELECT Bucket * ? AS Timestamp, {}(Value) AS measurement
+FROM ({}) AS bucketed
+GROUP BY Bucket
+ORDER BY Bucket;
+'''.format(aggregates[aggregate], bucketed)
+    return query, params
+
+
+def get_span_epochs(connection, project, location, equipment, parameter, catalog=None):
+    if catalog is not None:
+        # Metadata_IDs resolved locally: no joins on the server
+        placeholders, params = id_placeholders(catalog.metadata_IDs(project, location, equipment, parameter))
+        query = 'SELECT MIN(Timestamp), MAX(Timestamp) FROM dbo.value WHERE Metadata_ID IN ({});'.format(placeholders)
+    else:
+        query = '''SELECT  MIN(dbo.value.Timestamp), MAX(dbo.value.Timestamp)
+        FROM dbo.parameter
+        left outer join dbo.metadata on dbo.parameter.Parameter_ID = dbo.metadata.Parameter_ID
+        left outer join dbo.value on dbo.value.Metadata_ID = dbo.metadata.Metadata_ID
+        left outer join dbo.unit on dbo.parameter.Unit_ID = dbo.unit.Unit_ID
+        left outer join dbo.equipment on dbo.metadata.Equipment_ID = dbo.equipment.Equipment_ID
+        left outer join dbo.sampling_points on dbo.metadata.Sampling_point_ID = dbo.sampling_points.Sampling_point_ID
+        left outer join dbo.project on dbo.metadata.Project_ID = dbo.project.Project_ID
+        WHERE dbo.sampling_points.Sampling_location = ?
+        AND dbo.parameter.Parameter = ?
+        AND dbo.equipment.Equipment_identifier = ?
+        AND dbo.project.Project_name = ?;
+        '''
+        params = [location, parameter, equipment, project]
+
+    df = pd.read_sql(query, connection, params=params)
     df.columns = ['first', 'last']
-    first = epoch_to_pandas_datetime(df.at[0, 'first'])
-    last = epoch_to_pandas_datetime(df.at[0, 'last'])
+    if pd.isna(df.at[0, 'first']):
+        return None, None
+    return int(df.at[0, 'first']), int(df.at[0, 'last'])
+
+
+def get_span(connection, project, location, equipment, parameter, catalog=None):
+    first, last = get_span_epochs(connection, project, location, equipment, parameter, catalog)
+    if first is None:
+        return None, None
+    first = epoch_to_pandas_datetime(first)
+    last = epoch_to_pandas_datetime(last)
     return first, last
 
 
-def clean_up_pulled_data(df, project, location, equipment, parameter):
-    df['datetime'] = [epoch_to_pandas_datetime(x) for x in df.Timestamp]
-    df.sort_values('datetime', axis=0, inplace=True)
+def series_name(project, location, equipment, parameter):
     project = project.replace('-', '_')
     location = location.replace('-', '_')
     parameter = parameter.replace('-', '_')
     equipment = equipment.replace('-', '_')
+    return '{}-{}-{}-{}'.format(project, location, equipment, parameter)
+
+
+def clean_up_pulled_data(df, project, location, equipment, parameter, tz_aware=False):
+    df['datetime'] = epochs_to_datetimes(df.Timestamp.to_numpy(), tz_aware)
+    # Stable, so that the first of duplicated datetimes is the lowest Value_ID
+    df.sort_values('datetime', axis=0, inplace=True, kind='stable')
     df.drop(
         ['Timestamp', 'Project_name', 'par', 'Unit', 'equipment', 'Sampling_location'],
         axis=1,
-        inplace=True
+        inplace=True,
+        errors='ignore'
     )
     df.rename(
         columns={
-            'measurement': '{}-{}-{}-{}'.format(project, location, equipment, parameter),
+            'measurement': series_name(project, location, equipment, parameter),
         },
         inplace=True)
     df.set_index('datetime', inplace=True, drop=True)
@@ -193,58 +443,106 @@ def clean_up_pulled_data(df, project, location, equipment, parameter):
     return df
 
 
-def extract_data(connexion, extract_list):
+def merge_series(frames):
+    '''outer-joins cleaned series on their datetime index in a single pass'''
+    df = pd.concat(frames, axis=1, join='outer').sort_index()
+    df = df[~df.index.duplicated(keep='first')]
+    return df
+
+
+def extract_data(connexion, extract_list, catalog=None, resolution=None, aggregate='mean', tz_aware=False):
+    '''pulls the series of extract_list, aggregated on the server per resolution bucket when one is given;
+    buckets are aligned on UTC, so resolutions must divide one hour to start on the local hours of the labels'''
+    frames = []
     for i in range(len(extract_list)):
-        query = build_query(
-            extract_list[i]['Start'],
-            extract_list[i]['End'],
+        if resolution is None:
+            query, params = series_query(extract_list[i]['Start'], extract_list[i]['End'], extract_list[i], catalog)
+        else:
+            query, params = build_aggregate_query(
+                extract_list[i]['Start'], extract_list[i]['End'], extract_list[i], resolution, aggregate, catalog)
+        df = pd.read_sql(query, connexion, params=params)
+        frames.append(clean_up_pulled_data(
+            df,
             extract_list[i]['Project'],
             extract_list[i]['Location'],
             extract_list[i]['Equipment'],
-            extract_list[i]['Parameter']
-        )
-        if i == 0:
-            df = pd.read_sql(query, connexion)
-            clean_up_pulled_data(
-                df,
-                extract_list[i]['Project'],
-                extract_list[i]['Location'],
-                extract_list[i]['Equipment'],
-                extract_list[i]['Parameter']
-            )
-        else:
-            temp_df = pd.read_sql(query, connexion)
-            clean_up_pulled_data(
-                temp_df,
-                extract_list[i]['Project'],
-                extract_list[i]['Location'],
-                extract_list[i]['Equipment'],
-                extract_list[i]['Parameter']
-            )
-            df = df.join(temp_df, how='outer')
-            df = df[~df.index.duplicated(keep='first')]
-    return df
+            extract_list[i]['Parameter'],
+            tz_aware
+        ))
+    return merge_series(frames)
+
+
+def split_range(start, end, chunk_seconds):
+    '''splits the open range (start, end) of build_query into open ranges covering the same timestamps'''
+    if start >= end:
+        # An empty range, queried as it is
+        return [(start, end)]
+    bounds = list(range(start, end, chunk_seconds)) + [end]
+    # build_query excludes both ends: later chunks start one second early to keep their first timestamp
+    return [(bounds[0], bounds[1])] + [(low - 1, high) for low, high in zip(bounds[1:-1], bounds[2:])]
+
+
+def extract_data_parallel(extract_list, connect=None, chunk_days=7, max_workers=8, catalog=None, tz_aware=False):
+    '''extract_data fetching time chunks of every series concurrently, one connection per worker'''
+    if connect is None:
+        def connect():
+            return create_connection()[1]
+
+    # Each worker thread opens its own connection on its first chunk
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def fetch(query, params):
+        if not hasattr(local, 'connection'):
+            local.connection = connect()
+            with lock:
+                connections.append(local.connection)
+        return pd.read_sql(query, local.connection, params=params)
+
+    jobs = []
+    for i in range(len(extract_list)):
+        series = extract_list[i]
+        for start, end in split_range(series['Start'], series['End'], int(chunk_days * 86400)):
+            jobs.append((i, series_query(start, end, series, catalog)))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            chunks = list(pool.map(lambda job: fetch(*job[1]), jobs))
+    finally:
+        for connection in connections:
+            connection.close()
+
+    frames = []
+    for i in range(len(extract_list)):
+        series = extract_list[i]
+        # Chunks come back in time order
+        df = pd.concat([chunk for (j, _), chunk in zip(jobs, chunks) if j == i], ignore_index=True)
+        frames.append(clean_up_pulled_data(
+            df, series['Project'], series['Location'], series['Equipment'], series['Parameter'], tz_aware))
+    return merge_series(frames)
+
+
+if __name__ == '__main__':
+    cursor, conn = create_connection()
+    Start = date_to_epoch('2020-01-07 12:00:00')
+    End = date_to_epoch('2020-02-09 12:00:00')
+    Location = 'Primary settling tank effluent'
+    Project = 'pilEAUte'
 
+    param_list = ['NH4-N']
+    equip_list = ['Ammo_005']
 
-cursor, conn = create_connection()
-Start = date_to_epoch('2020-01-07 12:00:00')
-End = date_to_epoch('2020-02-09 12:00:00')
-Location = 'Primary settling tank effluent'
-Project = 'pilEAUte'
-
-param_list = ['NH4-N']
-equip_list = ['Ammo_005']
-
-extract_list={}
-for i in range(len(param_list)):
-    extract_list[i] = {
-        'Start':Start,
-        'End':End,
-        'Project':Project,
-        'Location':Location,
-        'Parameter':param_list[i],
-        'Equipment':equip_list[i]
-    }
-print('ready to extract')
-df = extract_data(conn, extract_list)
-print(len(df))
+    extract_list={}
+    for i in range(len(param_list)):
+        extract_list[i] = {
+            'Start':Start,
+            'End':End,
+            'Project':Project,
+            'Location':Location,
+            'Parameter':param_list[i],
+            'Equipment':equip_list[i]
+        }
+    print('ready to extract')
+    df = extract_data(conn, extract_list)
+    print(len(df))
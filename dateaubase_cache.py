@@ -0,0 +1,173 @@
+import json
+import os
+
+from urllib import parse
+
+import numpy as np
+import pandas as pd
+
+import dateaubase
+
+# Local cache of dateaubase pulls. Each (project, location, equipment,
+# parameter) series gets a directory holding one memory-mappable .npy file
+# of (Timestamp, Value) records per UTC day, plus coverage.json listing the
+# timestamp ranges already fetched. A pull only queries the parts of its
+# range that are not covered yet, clipped to the span of the series on the
+# server.
+
+cache_dir = 'dateaubase_cache'
+
+record_dtype = np.dtype([('Timestamp', np.int64), ('Value', np.float64)])
+
+
+def series_dir(cache_dir, project, location, equipment, parameter):
+    key = '__'.join(parse.quote(part, safe='') for part in (project, location, equipment, parameter))
+    return os.path.join(cache_dir, key)
+
+
+def load_coverage(directory):
+    '''returns the sorted, disjoint [first, last] timestamp ranges already fetched'''
+    try:
+        with open(os.path.join(directory, 'coverage.json')) as f:
+            return [tuple(interval) for interval in json.load(f)]
+    except FileNotFoundError:
+        return []
+
+
+def save_coverage(directory, coverage):
+    filename = os.path.join(directory, 'coverage.json')
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(coverage, f)
+    os.replace(filename + '.tmp', filename)
+
+
+def add_interval(coverage, first, last):
+    '''merges [first, last] into the coverage'''
+    merged = []
+    for low, high in sorted(coverage + [(first, last)]):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def missing_intervals(coverage, first, last):
+    '''parts of [first, last] not in the coverage'''
+    missing = []
+    for low, high in coverage:
+        if high < first or low > last:
+            continue
+        if low > first:
+            missing.append((first, low - 1))
+        first = max(first, high + 1)
+    if first <= last:
+        missing.append((first, last))
+    return missing
+
+
+def day_file(directory, day):
+    return os.path.join(directory, f'{np.datetime64(int(day), "D")}.npy')
+
+
+def store_records(directory, records):
+    '''merges fetched records into their day files'''
+    days = records['Timestamp'] // 86400
+    for day in np.unique(days):
+        new = records[days == day]
+        filename = day_file(directory, day)
+        if os.path.exists(filename):
+            new = np.concatenate([np.load(filename), new])
+        # Keep the first record of each timestamp, like clean_up_pulled_data
+        new = new[np.argsort(new['Timestamp'], kind='stable')]
+        keep = np.ones(len(new), bool)
+        keep[1:] = new['Timestamp'][1:] != new['Timestamp'][:-1]
+        np.save(filename + '.tmp.npy', new[keep])
+        os.replace(filename + '.tmp.npy', filename)
+
+
+def load_records(directory, first, last):
+    '''reads the cached records with first <= Timestamp <= last'''
+    parts = []
+    for day in range(first // 86400, last // 86400 + 1):
+        filename = day_file(directory, day)
+        if not os.path.exists(filename):
+            continue
+        day_records = np.load(filename, mmap_mode='r')
+        mask = (day_records['Timestamp'] >= first) & (day_records['Timestamp'] <= last)
+        parts.append(np.array(day_records[mask]))
+        del day_records
+    if not parts:
+        return np.empty(0, record_dtype)
+    return np.concatenate(parts)
+
+
+def fetch(connexion, series, first, last, catalog=None):
+    '''queries the records with first <= Timestamp <= last from the dateaubase'''
+    # build_query excludes both ends of its range
+    query, params = dateaubase.series_query(first - 1, last + 1, series, catalog)
+    df = pd.read_sql(query, connexion, params=params)
+    records = np.empty(len(df), record_dtype)
+    records['Timestamp'] = df['Timestamp'].to_numpy(np.int64)
+    records['Value'] = df['measurement'].to_numpy(np.float64)
+    return records
+
+
+def cached_records(connexion, series, cache_dir=cache_dir, catalog=None):
+    '''returns the records of a series in its (Start, End) range, only querying what is not cached'''
+    directory = series_dir(cache_dir, series['Project'], series['Location'], series['Equipment'], series['Parameter'])
+    os.makedirs(directory, exist_ok=True)
+    # Same range as build_query(Start, End)
+    first, last = series['Start'] + 1, series['End'] - 1
+
+    coverage = load_coverage(directory)
+    missing = missing_intervals(coverage, first, last)
+    if missing:
+        span_first, span_last = dateaubase.get_span_epochs(
+            connexion, series['Project'], series['Location'], series['Equipment'], series['Parameter'], catalog)
+        for low, high in missing:
+            if span_last is None or high < span_first:
+                # Nothing on the server for this range yet
+                covered_to = high if span_last is not None else None
+            else:
+                if low <= span_last:
+                    records = fetch(connexion, series, max(low, span_first), min(high, span_last), catalog)
+                    store_records(directory, records)
+                # Data newer than the span may still arrive: that part stays uncovered
+                covered_to = min(high, span_last)
+            if covered_to is not None and covered_to >= low:
+                coverage = add_interval(coverage, low, covered_to)
+        save_coverage(directory, coverage)
+
+    return load_records(directory, first, last)
+
+
+def downsample_records(records, resolution, aggregate='mean'):
+    '''aggregates records per time bucket like dateaubase.build_aggregate_query'''
+    if aggregate not in dateaubase.aggregates:
+        raise ValueError('aggregate must be one of {}'.format(', '.join(dateaubase.aggregates)))
+    seconds = dateaubase.resolution_seconds(resolution)
+    records = records[~np.isnan(records['Value'])]
+    buckets = records['Timestamp'] // seconds
+    # Records are sorted by timestamp, so 'last' is the value of the latest one
+    values = pd.Series(records['Value']).groupby(buckets).agg(aggregate)
+    downsampled = np.empty(len(values), record_dtype)
+    downsampled['Timestamp'] = values.index.to_numpy(np.int64) * seconds
+    downsampled['Value'] = values.to_numpy(np.float64)
+    return downsampled
+
+
+def extract_data_cached(connexion, extract_list, cache_dir=cache_dir, catalog=None, resolution=None, aggregate='mean',
+                        tz_aware=False):
+    '''extract_data served from the local cache, topped up from the dateaubase'''
+    frames = []
+    for i in range(len(extract_list)):
+        series = extract_list[i]
+        records = cached_records(connexion, series, cache_dir, catalog)
+        if resolution is not None:
+            # The raw records are cached, the aggregation is done locally
+            records = downsample_records(records, resolution, aggregate)
+        name = dateaubase.series_name(series['Project'], series['Location'], series['Equipment'], series['Parameter'])
+        index = dateaubase.epochs_to_datetimes(records['Timestamp'], tz_aware).rename('datetime')
+        frames.append(pd.DataFrame({name: records['Value']}, index=index))
+    return dateaubase.merge_series(frames)
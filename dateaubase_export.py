@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+import dateaubase
+
+# Streaming export of dateaubase series to CSV or Parquet. Every series is
+# read through its own cursor, ordered by timestamp and fetched in chunks of
+# chunk_rows, and the series are merged on their timestamps chunk by chunk
+# into the wide layout of extract_data. At most a couple of chunks per
+# series are held in memory, whatever the time span of the export.
+
+# Rows fetched per round trip and per series
+chunk_rows = 50000
+
+record_dtype = np.dtype([('Timestamp', np.int64), ('Value', np.float64)])
+
+stream_query = '''SELECT Timestamp, Value
+FROM dbo.value
+WHERE {}
+AND Timestamp > ?
+AND Timestamp < ?
+ORDER BY Timestamp, Value_ID;
+'''
+
+
+def stream_series(connection, series, catalog=None, chunk_rows=chunk_rows):
+    '''yields the (Timestamp, Value) records of an extract_list entry in time order, chunk_rows at a time'''
+    condition, params = dateaubase.series_filter(series, catalog)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(stream_query.format(condition), params + [int(series['Start']), int(series['End'])])
+        previous = None
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            records = np.array([(row[0], np.nan if row[1] is None else row[1]) for row in rows], record_dtype)
+            # Keep the first record of each timestamp, like clean_up_pulled_data
+            keep = np.ones(len(records), bool)
+            keep[1:] = records['Timestamp'][1:] != records['Timestamp'][:-1]
+            if previous is not None:
+                keep[0] = records['Timestamp'][0] != previous
+            previous = records['Timestamp'][-1]
+            yield records[keep]
+    finally:
+        cursor.close()
+
+
+def merge_streams(streams):
+    '''merges time-ordered record streams into (timestamps, values) chunks, one column of values per stream'''
+    streams = [iter(stream) for stream in streams]
+    buffers = [np.empty(0, record_dtype) for _ in streams]
+    exhausted = [False] * len(streams)
+    while True:
+        # Refill the streams whose buffered records were all merged
+        for i, stream in enumerate(streams):
+            while not exhausted[i] and not len(buffers[i]):
+                records = next(stream, None)
+                if records is None:
+                    exhausted[i] = True
+                else:
+                    buffers[i] = records
+        if all(exhausted) and not any(len(records) for records in buffers):
+            return
+
+        # Later records of a stream are newer than its last buffered one, so
+        # everything up to the smallest of those is final
+        ends = [records['Timestamp'][-1] for records, done in zip(buffers, exhausted) if not done]
+        watermark = min(ends) if ends else np.iinfo(np.int64).max
+        ready = [records[records['Timestamp'] <= watermark] for records in buffers]
+        buffers = [records[records['Timestamp'] > watermark] for records in buffers]
+
+        timestamps = np.unique(np.concatenate([records['Timestamp'] for records in ready]))
+        values = np.full((len(timestamps), len(streams)), np.nan)
+        for i, records in enumerate(ready):
+            values[np.searchsorted(timestamps, records['Timestamp']), i] = records['Value']
+        yield timestamps, values
+
+
+def series_names(extract_list):
+    return [
+        dateaubase.series_name(series['Project'], series['Location'], series['Equipment'], series['Parameter'])
+        for series in extract_list.values()]
+
+
+def empty_frame(extract_list, tz_aware=False):
+    '''the layout of iter_frames without any row'''
+    index = dateaubase.epochs_to_datetimes(np.empty(0, np.int64), tz_aware).rename('datetime')
+    names = series_names(extract_list)
+    return pd.DataFrame(np.empty((0, len(names))), index=index, columns=names)
+
+
+def iter_frames(extract_list, connect=None, catalog=None, chunk_rows=chunk_rows, tz_aware=False):
+    '''yields extract_data as consecutive DataFrames of bounded size, one connection per series'''
+    if connect is None:
+        def connect():
+            return dateaubase.create_connection()[1]
+
+    names = series_names(extract_list)
+    connections = []
+    try:
+        streams = []
+        for series in extract_list.values():
+            connections.append(connect())
+            streams.append(stream_series(connections[-1], series, catalog, chunk_rows))
+        for timestamps, values in merge_streams(streams):
+            index = dateaubase.epochs_to_datetimes(timestamps, tz_aware).rename('datetime')
+            yield pd.DataFrame(values, index=index, columns=names)
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def export_csv(filename, extract_list, connect=None, catalog=None, chunk_rows=chunk_rows, tz_aware=False):
+    '''writes extract_data to a CSV file chunk by chunk and returns the number of rows'''
+    n_rows = 0
+    header = True
+    with open(filename, 'w', newline='') as f:
+        for df in iter_frames(extract_list, connect, catalog, chunk_rows, tz_aware):
+            df.to_csv(f, header=header)
+            header = False
+            n_rows += len(df)
+        if header:
+            # An empty export still names its columns
+            empty_frame(extract_list, tz_aware).to_csv(f)
+    return n_rows
+
+
+def export_parquet(filename, extract_list, connect=None, catalog=None, chunk_rows=chunk_rows, tz_aware=False):
+    '''writes extract_data to a Parquet file, one row group per chunk, and returns the number of rows'''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    n_rows = 0
+    writer = None
+    try:
+        for df in iter_frames(extract_list, connect, catalog, chunk_rows, tz_aware):
+            table = pa.Table.from_pandas(df)
+            if writer is None:
+                writer = pq.ParquetWriter(filename, table.schema)
+            writer.write_table(table)
+            n_rows += len(df)
+        if writer is None:
+            table = pa.Table.from_pandas(empty_frame(extract_list, tz_aware))
+            writer = pq.ParquetWriter(filename, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
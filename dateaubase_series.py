@@ -0,0 +1,121 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import dateaubase
+import dateaubase_cache
+
+# Compact alternative to the wide frame of extract_data. Every series is kept
+# as its own pair of sorted arrays (int64 epochs, float values), so sparse or
+# misaligned series cost their number of records rather than the union of
+# all timestamps. Wide frames (aligned or resampled) and long-format frames
+# are only built on demand, optionally for a time window or a few series.
+
+Series = namedtuple('Series', ['timestamps', 'values'])
+
+
+def sorted_unique(timestamps, values):
+    '''sorts records by timestamp, keeping the first of duplicated timestamps like clean_up_pulled_data'''
+    order = np.argsort(timestamps, kind='stable')
+    timestamps, values = timestamps[order], values[order]
+    keep = np.ones(len(timestamps), bool)
+    keep[1:] = timestamps[1:] != timestamps[:-1]
+    return Series(timestamps[keep], values[keep])
+
+
+class SeriesSet:
+    '''named series of sorted (timestamps, values) arrays'''
+
+    def __init__(self, series=None):
+        self.series = dict(series or {})
+
+    def __len__(self):
+        return len(self.series)
+
+    def __getitem__(self, name):
+        return self.series[name]
+
+    def names(self):
+        return list(self.series)
+
+    def nbytes(self):
+        return sum(s.timestamps.nbytes + s.values.nbytes for s in self.series.values())
+
+    def window(self, name, start=None, end=None):
+        '''records of a series with start <= timestamp <= end'''
+        s = self.series[name]
+        low = 0 if start is None else np.searchsorted(s.timestamps, start, side='left')
+        high = len(s.timestamps) if end is None else np.searchsorted(s.timestamps, end, side='right')
+        return Series(s.timestamps[low:high], s.values[low:high])
+
+    def align(self, names=None, start=None, end=None, how='outer', tz_aware=False):
+        '''wide frame of the series on the union (outer) or intersection (inner) of their timestamps'''
+        names = self.names() if names is None else list(names)
+        windows = [self.window(name, start, end) for name in names]
+        if how == 'outer':
+            timestamps = np.unique(np.concatenate([w.timestamps for w in windows] or [np.empty(0, np.int64)]))
+        elif how == 'inner':
+            timestamps = windows[0].timestamps if windows else np.empty(0, np.int64)
+            for w in windows[1:]:
+                timestamps = np.intersect1d(timestamps, w.timestamps, assume_unique=True)
+        else:
+            raise ValueError("how must be 'outer' or 'inner'")
+        columns = {}
+        for name, w in zip(names, windows):
+            column = np.full(len(timestamps), np.nan, dtype=w.values.dtype)
+            positions = np.searchsorted(timestamps, w.timestamps)
+            found = positions < len(timestamps)
+            found[found] = timestamps[positions[found]] == w.timestamps[found]
+            column[positions[found]] = w.values[found]
+            columns[name] = column
+        index = dateaubase.epochs_to_datetimes(timestamps, tz_aware).rename('datetime')
+        return pd.DataFrame(columns, index=index, columns=names)
+
+    def resample(self, resolution, aggregate='mean', names=None, start=None, end=None, tz_aware=False):
+        '''wide frame of the series aggregated per time bucket, like extract_data(resolution=...)'''
+        names = self.names() if names is None else list(names)
+        downsampled = {}
+        for name in names:
+            w = self.window(name, start, end)
+            records = np.empty(len(w.timestamps), dateaubase_cache.record_dtype)
+            records['Timestamp'] = w.timestamps
+            records['Value'] = w.values
+            records = dateaubase_cache.downsample_records(records, resolution, aggregate)
+            downsampled[name] = Series(records['Timestamp'], records['Value'].astype(w.values.dtype))
+        return SeriesSet(downsampled).align(names, tz_aware=tz_aware)
+
+    def to_long(self, names=None, start=None, end=None, tz_aware=False):
+        '''long-format frame (datetime, series, value) with the series names as a categorical'''
+        names = self.names() if names is None else list(names)
+        windows = [self.window(name, start, end) for name in names]
+        codes = np.repeat(np.arange(len(names), dtype=np.int32), [len(w.timestamps) for w in windows])
+        return pd.DataFrame({
+            'datetime': dateaubase.epochs_to_datetimes(
+                np.concatenate([w.timestamps for w in windows] or [np.empty(0, np.int64)]), tz_aware),
+            'series': pd.Categorical.from_codes(codes, categories=names),
+            'value': np.concatenate([w.values for w in windows] or [np.empty(0)]),
+        })
+
+
+def extract_series(connexion, extract_list, catalog=None, dtype=np.float64):
+    '''extract_data returning a SeriesSet, with values stored as dtype'''
+    series = {}
+    for i in range(len(extract_list)):
+        entry = extract_list[i]
+        query, params = dateaubase.series_query(entry['Start'], entry['End'], entry, catalog)
+        df = pd.read_sql(query, connexion, params=params)
+        name = dateaubase.series_name(entry['Project'], entry['Location'], entry['Equipment'], entry['Parameter'])
+        series[name] = sorted_unique(df['Timestamp'].to_numpy(np.int64), df['measurement'].to_numpy(dtype))
+    return SeriesSet(series)
+
+
+def extract_series_cached(connexion, extract_list, cache_dir=dateaubase_cache.cache_dir, catalog=None, dtype=np.float64):
+    '''extract_series served from the local cache of dateaubase_cache'''
+    series = {}
+    for i in range(len(extract_list)):
+        entry = extract_list[i]
+        records = dateaubase_cache.cached_records(connexion, entry, cache_dir, catalog)
+        name = dateaubase.series_name(entry['Project'], entry['Location'], entry['Equipment'], entry['Parameter'])
+        series[name] = Series(records['Timestamp'], records['Value'].astype(dtype))
+    return SeriesSet(series)
@@ -0,0 +1,91 @@
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+# Server-side Value_ID allocation. dbo.value_id_allocator holds the next free
+# Value_ID and a single UPDATE both reads and advances it, so a whole block of
+# IDs is reserved atomically in one round trip. Every writer of dbo.value must
+# take its IDs from here for the reservation to be collision free.
+# The table holds a single row, enforced by its primary key: two writers
+# seeding it at the same time cannot both insert it.
+
+CREATE_TABLE = {
+    'mssql': '''
+IF OBJECT_ID('dbo.value_id_allocator', 'U') IS NULL
+    CREATE TABLE dbo.value_id_allocator (
+        Allocator_ID INT NOT NULL CONSTRAINT PK_value_id_allocator PRIMARY KEY CHECK (Allocator_ID = 1),
+        Next_Value_ID BIGINT NOT NULL);
+''',
+    'sqlite': '''
+CREATE TABLE IF NOT EXISTS dbo.value_id_allocator (
+    Allocator_ID INTEGER NOT NULL PRIMARY KEY CHECK (Allocator_ID = 1),
+    Next_Value_ID INTEGER NOT NULL);
+''',
+}
+
+SEED = '''
+INSERT INTO dbo.value_id_allocator (Allocator_ID, Next_Value_ID)
+SELECT 1, COALESCE(MAX(Value_ID), 0) + 1 FROM dbo.value
+WHERE NOT EXISTS (SELECT 1 FROM dbo.value_id_allocator);
+'''
+
+# Move past IDs written without the allocator (e.g. by AnaPro_27.py)
+CATCH_UP = '''
+UPDATE dbo.value_id_allocator
+SET Next_Value_ID = (SELECT MAX(Value_ID) + 1 FROM dbo.value)
+WHERE Next_Value_ID <= (SELECT MAX(Value_ID) FROM dbo.value);
+'''
+
+RESERVE = {
+    'mssql': 'UPDATE dbo.value_id_allocator SET Next_Value_ID = Next_Value_ID + :n OUTPUT deleted.Next_Value_ID;',
+    'sqlite': 'UPDATE dbo.value_id_allocator SET Next_Value_ID = Next_Value_ID + :n RETURNING Next_Value_ID - :n;',
+}
+
+# Minimum number of IDs reserved per round trip. With 0 every allocation is
+# reserved exactly, which leaves no gaps in Value_ID when a process exits.
+block_size = 0
+
+
+def ensure_allocator(db_engine):
+    '''creates and seeds dbo.value_id_allocator if needed'''
+    dialect = db_engine.dialect.name
+    with db_engine.begin() as conn:
+        conn.execute(text(CREATE_TABLE[dialect]))
+    try:
+        with db_engine.begin() as conn:
+            conn.execute(text(SEED))
+    except IntegrityError:
+        # Another writer seeded it between our check and our insert
+        pass
+    with db_engine.begin() as conn:
+        conn.execute(text(CATCH_UP))
+
+
+def reserve_IDs(db_engine, n):
+    '''reserves n consecutive Value_IDs on the server and returns the first one'''
+    with db_engine.begin() as conn:
+        return conn.execute(text(RESERVE[db_engine.dialect.name]), {'n': n}).scalar()
+
+
+class ValueIDAllocator:
+    '''hands out Value_IDs to parallel writers from blocks reserved on the server'''
+
+    def __init__(self, db_engine, block_size=block_size):
+        self.db_engine = db_engine
+        self.block_size = block_size
+        self.next_ID = 0
+        self.end_ID = 0
+        self.lock = threading.Lock()
+
+    def allocate(self, n):
+        '''returns the first of n consecutive Value_IDs reserved for the caller'''
+        with self.lock:
+            if self.next_ID + n > self.end_ID:
+                # Unused IDs of the previous block are left as a gap
+                size = max(n, self.block_size)
+                self.next_ID = reserve_IDs(self.db_engine, size)
+                self.end_ID = self.next_ID + size
+            first_ID = self.next_ID
+            self.next_ID += n
+            return first_ID
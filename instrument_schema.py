@@ -0,0 +1,64 @@
+import re
+import threading
+
+from collections import namedtuple
+
+import numpy as np
+
+# Maps the columns of a .par header to dbo.value series. The analyser labels
+# each column like 'TSSeq [mg/l]3000.00-0.00_1' (parameter, unit, upper and
+# lower limits of the measuring range, version); a station's configuration
+# in stations.py gives the Metadata_ID and divisor of each parameter it
+# ingests. A (header, configuration) pair is compiled once into the column
+# indices, Metadata_IDs and divisors applied to whole arrays of values, so
+# any column order or instrument layout is handled by the same code.
+
+label_pattern = re.compile(
+    r'^(?P<parameter>.+?) \[(?P<unit>[^\]]*)\]'
+    r'(?P<upper>-?\d+(?:\.\d+)?)-(?P<lower>-?\d+(?:\.\d+)?)_(?P<version>\d+)$')
+
+Column = namedtuple('Column', ['parameter', 'unit', 'upper', 'lower', 'version'])
+
+Schema = namedtuple('Schema', ['index', 'metadata_IDs', 'divisors'])
+Schema.__doc__ = '''Compiled mapping of a .par layout:
+index: positions of the ingested parameters among the header columns,
+metadata_IDs and divisors: Metadata_ID and divisor of each of them'''
+
+# Compiled schemas by (header columns, configured parameters)
+compiled = {}
+compiled_lock = threading.Lock()
+
+
+def parse_label(label):
+    '''splits a .par column label into a Column; labels without range keep only their parameter'''
+    match = label_pattern.match(label.strip())
+    if match is None:
+        return Column(label.strip(), None, None, None, None)
+    return Column(
+        match['parameter'], match['unit'], float(match['upper']), float(match['lower']), int(match['version']))
+
+
+def compile_schema(columns, parameters):
+    '''Schema of the header columns for parameters, a {parameter: (Metadata_ID, divisor)} configuration'''
+    key = (tuple(columns), tuple(parameters.items()))
+    with compiled_lock:
+        schema = compiled.get(key)
+    if schema is not None:
+        return schema
+
+    positions = {}
+    for i, label in enumerate(columns):
+        positions.setdefault(parse_label(label).parameter, i)
+    missing = [parameter for parameter in parameters if parameter not in positions]
+    if missing:
+        raise ValueError(f"Parameters {', '.join(missing)} are not in the .par header")
+    # Records follow the column order of the file
+    ingested = sorted(parameters, key=positions.get)
+    schema = Schema(
+        index=np.array([positions[parameter] for parameter in ingested], np.intp),
+        metadata_IDs=np.array([parameters[parameter][0] for parameter in ingested], np.int64),
+        divisors=np.array([parameters[parameter][1] for parameter in ingested], np.float64),
+    )
+    with compiled_lock:
+        compiled[key] = schema
+    return schema
@@ -0,0 +1,153 @@
+import cProfile
+import json
+import pstats
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters and per-stage timers of the ingestion. They are shared by the
+# reader threads and the writer, emitted as one JSON line per pass and
+# optionally served in the Prometheus text format. Stage times are summed
+# over threads, so concurrent stages can add up to more than a pass.
+# ThreadProfiler runs cProfile in every thread, whose own profiler only sees
+# the thread enabling it.
+
+prefix = 'anapro'
+
+
+class Metrics:
+    '''thread-safe counters and stage timers'''
+
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            total, count, longest = self.timers.get(stage, (0.0, 0, 0.0))
+            self.timers[stage] = (total + seconds, count + 1, max(longest, seconds))
+
+    @contextmanager
+    def timer(self, stage):
+        '''times the enclosed block as one occurrence of stage'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self.lock:
+            return {'counters': dict(self.counters), 'timers': dict(self.timers)}
+
+    def since(self, before):
+        '''counters and stage times accumulated since an earlier snapshot'''
+        now = self.snapshot()
+        counters = {
+            name: n - before['counters'].get(name, 0)
+            for name, n in now['counters'].items() if n != before['counters'].get(name, 0)}
+        timers = {}
+        for stage, (total, count, _) in now['timers'].items():
+            previous_total, previous_count, _ = before['timers'].get(stage, (0.0, 0, 0.0))
+            if count != previous_count:
+                timers[stage] = {'seconds': round(total - previous_total, 6), 'count': count - previous_count}
+        return {'counters': counters, 'timers': timers}
+
+
+# Metrics of the running process
+default = Metrics()
+count = default.count
+observe = default.observe
+timer = default.timer
+snapshot = default.snapshot
+since = default.since
+
+
+class ThreadProfiler:
+    '''cProfile of the enabling thread and of the threads started after it, merged into one pstats.Stats'''
+
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def start_thread(self, frame, event, arg):
+        # First event of a new thread: it gets a profiler of its own
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def enable(self):
+        self.profiles = [cProfile.Profile()]
+        threading.setprofile(self.start_thread)
+        self.profiles[0].enable()
+
+    def disable(self):
+        '''stops profiling the enabling thread and the threads started from now on'''
+        threading.setprofile(None)
+        self.profiles[0].disable()
+
+    def stats(self):
+        '''pstats.Stats of all the threads, after disable'''
+        with self.lock:
+            profiles = list(self.profiles)
+        # Snapshots of the threads still running stop at this point
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+
+def log_json(f, event, **fields):
+    '''writes one JSON line to f'''
+    record = {'time': round(time.time(), 3), 'event': event}
+    record.update(fields)
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+
+
+def prometheus_text(metrics=default):
+    '''metrics in the Prometheus text exposition format'''
+    snapshot = metrics.snapshot()
+    lines = []
+    for name, n in sorted(snapshot['counters'].items()):
+        lines.append(f'# TYPE {prefix}_{name}_total counter')
+        lines.append(f'{prefix}_{name}_total {n}')
+    if snapshot['timers']:
+        lines.append(f'# TYPE {prefix}_stage_seconds summary')
+        for stage, (total, count, _) in sorted(snapshot['timers'].items()):
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines.append(f'# TYPE {prefix}_stage_seconds_max gauge')
+        for stage, (_, _, longest) in sorted(snapshot['timers'].items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{stage}"}} {longest:.6f}')
+    return '\n'.join(lines) + '\n'
+
+
+def serve(port, metrics=default, host='127.0.0.1'):
+    '''serves prometheus_text on http://host:port/metrics from a daemon thread and returns the server'''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text(metrics).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,189 @@
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import dateaubase
+import instrument_schema
+import par_index
+import par_reader
+
+# Compressed columnar archive of the finished .parx files. Each file becomes
+# a .parc file holding its rows in blocks: int64 timestamps (as differences),
+# uint8 status codes, a float32 value matrix and the int16 info flags, each
+# with its bytes grouped by significance and the block compressed with zlib.
+# A JSON header lists the columns and the time range of every block, so a
+# time window is replayed by decompressing only the blocks it overlaps.
+# Values are stored as float32 when rounding them back to the analyser's
+# decimals gives the parsed values exactly, as float64 otherwise.
+
+suffix = '.parc'
+magic = b'PARC\x01'
+length_format = struct.Struct('<I')
+
+# Rows per compressed block
+block_rows = 1024
+
+# Decimals written by the analyser
+decimals = 3
+
+
+def shuffle(array):
+    '''bytes of array grouped by significance: the high bytes of similar numbers compress to almost nothing'''
+    array = np.ascontiguousarray(array)
+    return array.view(np.uint8).reshape(-1, array.dtype.itemsize).T.tobytes()
+
+
+def unshuffle(data, dtype, count):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(data, np.uint8).reshape(dtype.itemsize, count).T.copy().view(dtype).ravel()
+
+
+def value_dtype(values):
+    '''float32 when it keeps the values exactly at the analyser's decimals, float64 otherwise'''
+    restored = values.astype(np.float32).astype(np.float64).round(decimals)
+    return np.float32 if np.array_equal(restored, values, equal_nan=True) else np.float64
+
+
+def encode_block(par, dtype):
+    deltas = np.diff(par.Timestamp, prepend=par.Timestamp[:1])
+    # Column by column, each column's values are alike
+    return zlib.compress(b''.join([
+        shuffle(deltas),
+        par.Status.tobytes(),
+        shuffle(par.Values.T.astype(dtype)),
+        shuffle(par.Info.T),
+    ]))
+
+
+def decode_block(data, first, rows, n_columns, dtype):
+    data = zlib.decompress(data)
+    sizes = [8 * rows, rows, np.dtype(dtype).itemsize * rows * n_columns, 2 * rows * n_columns]
+    parts = np.split(np.frombuffer(data, np.uint8), np.cumsum(sizes)[:-1])
+    timestamps = first + np.cumsum(unshuffle(parts[0], np.int64, rows))
+    values = unshuffle(parts[2], dtype, rows * n_columns).reshape(n_columns, rows).T.astype(np.float64)
+    if dtype != np.float64:
+        values = values.round(decimals)
+    info = unshuffle(parts[3], np.int16, rows * n_columns).reshape(n_columns, rows).T
+    return timestamps, parts[1].copy(), values, info
+
+
+def write_archive(f_name, par):
+    '''writes a ParData to the archive file f_name'''
+    dtype = value_dtype(par.Values)
+    blocks, index, offset = [], [], 0
+    for start in range(0, len(par.Timestamp), block_rows):
+        block = par_reader.take_rows(par, slice(start, start + block_rows))
+        data = encode_block(block, dtype)
+        index.append([int(block.Timestamp[0]), int(block.Timestamp[-1]), len(block.Timestamp), offset, len(data)])
+        blocks.append(data)
+        offset += len(data)
+    header = json.dumps({'columns': par.columns, 'values': np.dtype(dtype).name, 'blocks': index}).encode()
+
+    # Readers never see a partially written archive
+    temporary = f_name + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(magic + length_format.pack(len(header)) + header)
+        for data in blocks:
+            f.write(data)
+    os.replace(temporary, f_name)
+
+
+def read_header(f):
+    if f.read(len(magic)) != magic:
+        raise ValueError(f'{f.name} is not a .par archive')
+    length, = length_format.unpack(f.read(length_format.size))
+    return json.loads(f.read(length))
+
+
+def read_archive(f_name, start=None, end=None):
+    '''ParData of the archived rows with start < Timestamp <= end'''
+    with open(f_name, 'rb') as f:
+        header = read_header(f)
+        data_start = f.tell()
+        columns, dtype = header['columns'], np.dtype(header['values'])
+        parts = []
+        for first, last, rows, offset, length in header['blocks']:
+            # Only the blocks overlapping the window are read
+            if (start is not None and last <= start) or (end is not None and first > end):
+                continue
+            f.seek(data_start + offset)
+            parts.append(decode_block(f.read(length), first, rows, len(columns), dtype))
+
+    if not parts:
+        return par_reader.ParData(
+            np.empty(0, np.int64), np.empty(0, np.uint8),
+            np.empty((0, len(columns))), np.empty((0, len(columns)), np.int16), columns)
+    timestamps, status, values, info = (np.concatenate(arrays) for arrays in zip(*parts))
+    par = par_reader.ParData(timestamps, status, values, info, columns)
+    keep = np.ones(len(timestamps), bool)
+    if start is not None:
+        keep &= timestamps > start
+    if end is not None:
+        keep &= timestamps <= end
+    return par if keep.all() else par_reader.take_rows(par, keep)
+
+
+def archive_name(f_name, directory):
+    '''path of the archive of a .par or .parx file in directory'''
+    return os.path.join(directory, os.path.splitext(os.path.basename(f_name))[0] + suffix)
+
+
+def archive_directory(path, directory):
+    '''archives the finished .parx files of path not archived yet; returns (files, text bytes, archive bytes)'''
+    os.makedirs(directory, exist_ok=True)
+    files, text_bytes, archive_bytes = 0, 0, 0
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.parx'):
+            continue
+        f_name = os.path.join(path, name)
+        target = archive_name(f_name, directory)
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(f_name):
+            continue
+        write_archive(target, par_reader.read_par_file(f_name))
+        files += 1
+        text_bytes += os.path.getsize(f_name)
+        archive_bytes += os.path.getsize(target)
+    return files, text_bytes, archive_bytes
+
+
+def archived_files(directory):
+    '''archive files of directory'''
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(suffix)]
+
+
+def replay(directory, start=None, end=None):
+    '''yields the ParData of the archived rows with start < Timestamp <= end, in time order'''
+    starts, file_list = par_index.build_index(archived_files(directory))
+    first = 0 if start is None else par_index.first_file_index(starts, start)
+    for file_start, f_name in zip(starts[first:], file_list[first:]):
+        if end is not None and file_start > end:
+            break
+        par = read_archive(f_name, start, end)
+        if len(par.Timestamp):
+            yield par
+
+
+def par_frame(par, tz_aware=False):
+    '''DataFrame of a ParData: its par_reader status code and one column per parameter'''
+    columns = [instrument_schema.parse_label(label).parameter for label in par.columns]
+    df = pd.DataFrame(par.Values, columns=columns, index=dateaubase.epochs_to_datetimes(par.Timestamp, tz_aware))
+    df.insert(0, 'Status', par.Status)
+    return df.rename_axis('datetime')
+
+
+def read_frame(directory, start=None, end=None, tz_aware=False):
+    '''DataFrame of the archived rows with start < Timestamp <= end, like par_frame'''
+    parts = list(replay(directory, start, end))
+    if not parts:
+        return pd.DataFrame()
+    if all(par.columns == parts[0].columns for par in parts):
+        timestamps, status, values, info = (np.concatenate(arrays) for arrays in zip(*(par[:4] for par in parts)))
+        return par_frame(par_reader.ParData(timestamps, status, values, info, parts[0].columns), tz_aware)
+    # Files with another column layout are aligned on the parameter names
+    return pd.concat([par_frame(par, tz_aware) for par in parts])
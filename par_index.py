@@ -0,0 +1,119 @@
+import bisect
+import mmap
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import par_reader
+
+# Index of .par files by the time of their first measurement. The analyser
+# names each file after that time (2020-02-08_05-44-00.par), so the index is
+# built from the names alone; only files with another name are opened, and
+# then only up to their first data line. Inside a file, the lines are in time
+# order behind their fixed-width datetime, so the first line to ingest is
+# found by bisecting the line starts of the memory-mapped file.
+
+name_pattern = re.compile(r'^(\d{4}-\d{2}-\d{2})_(\d{2}-\d{2}-\d{2})\.par[xc]?$')
+
+# Start given to files without any data line yet: they sort last
+no_data = np.iinfo(np.int64).max
+
+
+def name_stamp(f_name):
+    '''returns the 'YYYY.MM.DD  HH:MM:SS' layout of a .par file name, or None'''
+    match = name_pattern.match(os.path.basename(f_name))
+    if match is None:
+        return None
+    # Only the digit positions matter to par_reader.parse_datetimes
+    return f'{match.group(1)}  {match.group(2)}'.encode()
+
+
+def first_line_stamp(f_name):
+    '''reads the datetime of the first data line of a .par file, or None'''
+    with open(f_name, 'rb') as f:
+        for _ in range(par_reader.header_lines):
+            f.readline()
+        line = f.readline()
+    if len(line) < par_reader.datetime_width or not line.endswith(b'\n'):
+        return None
+    return line[:par_reader.datetime_width]
+
+
+def file_starts(file_list):
+    '''returns the epoch of the first measurement of each file'''
+    stamps = []
+    for f_name in file_list:
+        stamp = name_stamp(f_name)
+        if stamp is None:
+            stamp = first_line_stamp(f_name)
+        stamps.append(stamp)
+
+    starts = np.full(len(file_list), no_data, np.int64)
+    known = [i for i, stamp in enumerate(stamps) if stamp is not None]
+    if known:
+        stamps = np.frombuffer(b''.join(stamps[i] for i in known), np.uint8).reshape(-1, par_reader.datetime_width)
+        # Take the later reading of ambiguous local times: starting one file too early is harmless
+        starts[known] = par_reader.parse_datetimes(stamps, ambiguous=False, nonexistent='shift_forward')
+    return starts
+
+
+def build_index(file_list):
+    '''returns the files sorted by their first measurement, with the sorted start epochs'''
+    starts = file_starts(file_list)
+    order = sorted(range(len(file_list)), key=lambda i: (starts[i], file_list[i]))
+    return [int(starts[i]) for i in order], [file_list[i] for i in order]
+
+
+def first_file_index(starts, last_Timestamp):
+    '''index of the oldest file that may hold data more recent than last_Timestamp'''
+    # The file just before the first one starting after last_Timestamp may end with new data
+    return max(bisect.bisect_right(starts, last_Timestamp) - 1, 0)
+
+
+def local_stamp(epoch, tz='US/Eastern'):
+    '''the 'YYYY.MM.DD  HH:MM:SS' local time of an epoch, as written in .par lines'''
+    local = pd.Timestamp(epoch, unit='s', tz='UTC').tz_convert(tz)
+    return local.strftime('%Y.%m.%d  %H:%M:%S').encode(), local.tz_localize(None)
+
+
+def first_newer_offset(f_name, last_Timestamp, tz='US/Eastern'):
+    '''offset of a line starting at most three hours before the first line newer than last_Timestamp'''
+    # Local times go back an hour in the fall: lines at or before this one are
+    # all older than last_Timestamp, and every newer line is after it
+    epoch = last_Timestamp - 3600
+    older, wall = local_stamp(epoch, tz)
+    # Parsing must not start inside a repeated hour, whose readings are told apart by their order
+    while wall.tz_localize(tz, ambiguous='NaT') is pd.NaT:
+        epoch -= 3600
+        older, wall = local_stamp(epoch, tz)
+    with open(f_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            lo = 0
+            for _ in range(par_reader.header_lines):
+                lo = data.find(b'\n', lo) + 1
+                if lo == 0:
+                    return 0
+            if data[lo:lo + par_reader.datetime_width] > older:
+                # Nothing to skip: the header is parsed with the data
+                return 0
+
+            # The line at lo is older; every line starting at or after hi is not
+            hi = len(data)
+            while True:
+                following = data.find(b'\n', lo) + 1
+                if following == 0 or following >= hi:
+                    # A last incomplete line is read again once complete
+                    return following or lo
+                # First line starting at or after the middle of the candidates
+                mid = (following + hi) // 2
+                line = data.find(b'\n', mid - 1) + 1
+                if line == 0 or line >= hi:
+                    hi = mid
+                elif data[line:line + par_reader.datetime_width] > older:
+                    hi = line
+                else:
+                    lo = line
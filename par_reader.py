@@ -0,0 +1,167 @@
+import threading
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Parser for spectro::lyser .par files working directly on the raw bytes.
+# Every data line has the layout
+#   YYYY.MM.DD  HH:MM:SS <tab> Status <tab> value <tab> info <tab> value ...
+# so the datetime is read from fixed byte positions and the values and info
+# flags are converted column by column by NumPy.
+
+# Windows-1252 ('ANSI' on the acquisition PCs)
+par_encoding = 'cp1252'
+
+# Number of header lines at the start of a .par file
+header_lines = 2
+
+# Width of the 'YYYY.MM.DD  HH:MM:SS' prefix of each line
+datetime_width = 20
+
+# Codes of the Status column; anything else is stored as unknown_status
+status_codes = {b'Ok': 0, b'Failure': 1}
+unknown_status = 255
+
+# Header columns of the files read by header_columns, by path, least
+# recently used first. Finished files drop out once header_cache_size newer
+# ones were read.
+header_cache = OrderedDict()
+header_cache_size = 64
+header_lock = threading.Lock()
+
+ParData = namedtuple('ParData', ['Timestamp', 'Status', 'Values', 'Info', 'columns'])
+ParData.__doc__ = '''Columnar content of a .par file:
+Timestamp: int64 epoch seconds, Status: uint8 codes,
+Values: float64 (rows x parameters), Info: int16 (rows x parameters),
+columns: parameter names from the header'''
+
+
+def parse_header(line):
+    '''returns the parameter names of the .par column header line'''
+    names = line.decode(par_encoding).rstrip('\r\n').split('\t')
+    # Columns alternate between a parameter and its [info] column
+    return names[2::2]
+
+
+def parse_datetimes(stamps, tz='US/Eastern', ambiguous=None, nonexistent='raise', after=None):
+    '''converts an (n, 20) uint8 array of 'YYYY.MM.DD  HH:MM:SS' into int64 epoch seconds;
+    repeated local times are read in line order after the epoch after, unless ambiguous is given'''
+    digits = stamps.astype(np.int64) - ord('0')
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = digits[:, 8] * 10 + digits[:, 9]
+    hour = digits[:, 12] * 10 + digits[:, 13]
+    minute = digits[:, 15] * 10 + digits[:, 16]
+    second = digits[:, 18] * 10 + digits[:, 19]
+
+    # Days since the epoch through numpy's calendar arithmetic
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]').astype(np.int64) + day - 1
+    naive = days * 86400 + hour * 3600 + minute * 60 + second
+
+    # The analyser writes local time
+    index = pd.DatetimeIndex(naive.astype('datetime64[s]'))
+    if ambiguous is not None:
+        return index.tz_localize(tz, ambiguous=ambiguous, nonexistent=nonexistent).asi8 // 10 ** 9
+    local = index.tz_localize(tz, ambiguous='NaT', nonexistent=nonexistent)
+    epochs = local.asi8 // 10 ** 9
+    repeated = np.flatnonzero(local.isna())
+    if not len(repeated):
+        return epochs
+
+    # Each line of the hour repeated in the fall takes the earlier of its two
+    # readings unless that would go back in time (a chunk holding only a few
+    # lines of that hour is read like the whole file)
+    early = index[repeated].tz_localize(tz, ambiguous=np.ones(len(repeated), bool)).asi8 // 10 ** 9
+    late = index[repeated].tz_localize(tz, ambiguous=np.zeros(len(repeated), bool)).asi8 // 10 ** 9
+    for i, row in enumerate(repeated):
+        previous = epochs[row - 1] if row > 0 else after
+        epochs[row] = late[i] if previous is not None and early[i] <= previous else early[i]
+    return epochs
+
+
+def parse_par_bytes(data, header=True, columns=None, after=None):
+    '''parses the content of a .par file (or complete lines appended to one, following the epoch after) into a ParData'''
+    if header:
+        lines = data.split(b'\n', header_lines)
+        columns = parse_header(lines[1])
+        data = lines[2] if len(lines) > header_lines else b''
+    n_fields = 2 + 2 * len(columns)
+
+    data = data.rstrip(b'\r\n')
+    if not data:
+        return ParData(
+            np.empty(0, np.int64), np.empty(0, np.uint8),
+            np.empty((0, len(columns))), np.empty((0, len(columns)), np.int16), columns)
+
+    # Some analysers write decimal commas
+    if b',' in data:
+        data = data.replace(b',', b'.')
+    fields = data.replace(b'\r', b'').replace(b'\n', b'\t').split(b'\t')
+    if len(fields) % n_fields:
+        raise ValueError(f'.par lines must have {n_fields} tab separated fields')
+
+    # Fixed width datetimes straight from their bytes
+    stamps = b''.join(fields[0::n_fields])
+    if len(stamps) != datetime_width * (len(fields) // n_fields):
+        raise ValueError(f'.par datetimes must be {datetime_width} characters long')
+    stamps = np.frombuffer(stamps, np.uint8).reshape(-1, datetime_width)
+
+    labels, inverse = np.unique(np.array(fields[1::n_fields]), return_inverse=True)
+    codes = np.array([status_codes.get(label, unknown_status) for label in labels], np.uint8)
+
+    # Values and info flags alternate: convert them all in one call
+    del fields[1::n_fields]
+    del fields[0::n_fields - 1]
+    joined = b'\t'.join(fields)
+    if b'\t\t' in joined or joined.startswith(b'\t') or joined.endswith(b'\t'):
+        # Empty fields are missing values
+        joined = b'\t'.join(field or b'NaN' for field in fields)
+    numbers = np.fromstring(joined, sep='\t')
+    if numbers.size != len(fields):
+        raise ValueError('.par values must be numbers or NaN')
+    numbers = numbers.reshape(-1, n_fields - 2)
+
+    return ParData(
+        Timestamp=parse_datetimes(stamps, after=after),
+        Status=codes[inverse],
+        Values=numbers[:, 0::2],
+        Info=np.nan_to_num(numbers[:, 1::2], nan=0.0).astype(np.int16),
+        columns=columns,
+    )
+
+
+def cache_header(f_name, columns):
+    '''keeps the header columns of a file for header_columns'''
+    with header_lock:
+        header_cache[f_name] = columns
+        header_cache.move_to_end(f_name)
+        while len(header_cache) > header_cache_size:
+            header_cache.popitem(last=False)
+
+
+def header_columns(f_name):
+    '''parameter names of the header of a .par file, read once per file'''
+    with header_lock:
+        columns = header_cache.get(f_name)
+        if columns is not None:
+            header_cache.move_to_end(f_name)
+    if columns is None:
+        with open(f_name, 'rb') as f:
+            lines = [f.readline() for _ in range(header_lines)]
+        columns = parse_header(lines[-1])
+        cache_header(f_name, columns)
+    return columns
+
+
+def read_par_file(f_name):
+    '''parses a whole .par file into a ParData'''
+    with open(f_name, 'rb') as f:
+        return parse_par_bytes(f.read())
+
+
+def take_rows(par, rows):
+    '''ParData of the selected rows (boolean mask or indices) of par'''
+    return par._replace(Timestamp=par.Timestamp[rows], Status=par.Status[rows], Values=par.Values[rows], Info=par.Info[rows])
@@ -0,0 +1,190 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+# Waits for changes of the .par files of the station directories instead of
+# rescanning them on a schedule. Local Linux directories are watched with
+# inotify. Network shares (where inotify does not see the writes of other
+# hosts) and other systems are polled: only the directory mtime and the
+# size and mtime of its newest .par file are checked, at an interval growing
+# while nothing changes. Changes are batched over a debounce window so that
+# a burst of writes wakes the ingestion once.
+
+suffixes = ('.par', '.parx')
+
+# Filesystems whose changes inotify may not report
+network_filesystems = {'cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'fuse.sshfs', '9p'}
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+watch_mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+event_header = struct.Struct('iIII')
+
+
+def load_inotify():
+    '''returns libc when it provides inotify, None otherwise'''
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def filesystem_type(path):
+    '''type of the filesystem holding path according to /proc/mounts, or None'''
+    try:
+        with open('/proc/mounts') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best, fs_type = '', None
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        inside = path == mount_point or path.startswith(mount_point.rstrip('/') + '/')
+        if inside and len(mount_point) > len(best):
+            best, fs_type = mount_point, mount_type
+    return fs_type
+
+
+def is_network_path(path):
+    if path.startswith('//') or path.startswith('\\\\'):
+        return True
+    return filesystem_type(path) in network_filesystems
+
+
+def newest_par(directory):
+    names = [name for name in os.listdir(directory) if name.endswith(suffixes)]
+    return os.path.join(directory, max(names)) if names else None
+
+
+class ParWatcher:
+    '''waits until the .par files of some of the watched directories change'''
+
+    def __init__(self, directories, debounce=2.0, min_poll=1.0, max_poll=60.0, use_inotify=True):
+        # directories: {name: path}
+        self.debounce = debounce
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.fd = None
+        self.watches = {}
+        self.polled = {}
+        libc = load_inotify() if use_inotify else None
+        if libc is not None:
+            self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if self.fd < 0:
+                self.fd, libc = None, None
+        for name, path in directories.items():
+            wd = -1
+            if libc is not None and not is_network_path(path):
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(path), watch_mask)
+            if wd >= 0:
+                self.watches[wd] = name
+            else:
+                # name: [path, signature, interval, next check]
+                self.polled[name] = [path, self.signature(path), min_poll, time.monotonic() + min_poll]
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def signature(self, path, previous=None):
+        '''(directory mtime, newest .par file, its size, its mtime), cheap to compare between polls'''
+        try:
+            directory_mtime = os.stat(path).st_mtime
+            if previous is not None and previous[0] == directory_mtime:
+                # No file was added or removed: only the newest file can have grown
+                newest = previous[1]
+            else:
+                newest = newest_par(path)
+            if newest is None:
+                return directory_mtime, None, 0, 0
+            stat = os.stat(newest)
+            return directory_mtime, newest, stat.st_size, stat.st_mtime
+        except OSError:
+            # An unreachable share is checked again at the next poll
+            return None
+
+    def poll(self, now):
+        '''names of the polled directories that changed among those due for a check'''
+        changed = set()
+        for name, state in self.polled.items():
+            path, signature, interval, due = state
+            if now < due:
+                continue
+            new_signature = self.signature(path, signature)
+            if new_signature != signature and new_signature is not None:
+                changed.add(name)
+                interval = self.min_poll
+            else:
+                # Back off while the directory is idle
+                interval = min(interval * 2, self.max_poll)
+            state[1:] = [new_signature if new_signature is not None else signature, interval, now + interval]
+        return changed
+
+    def read_events(self):
+        '''names of the inotify-watched directories with .par events'''
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            position = 0
+            while position < len(data):
+                wd, mask, _, length = event_header.unpack_from(data, position)
+                name = data[position + event_header.size:position + event_header.size + length].rstrip(b'\0')
+                position += event_header.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.watches.values())
+                elif wd in self.watches and os.fsdecode(name).endswith(suffixes):
+                    changed.add(self.watches[wd])
+
+    def check(self, timeout):
+        '''waits at most timeout seconds (None: forever) for changes and returns the changed names'''
+        now = time.monotonic()
+        if self.polled:
+            next_poll = min(state[3] for state in self.polled.values())
+            timeout = max(next_poll - now, 0) if timeout is None else max(min(timeout, next_poll - now), 0)
+        changed = set()
+        if self.fd is not None:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+            if readable:
+                changed |= self.read_events()
+        elif timeout is None:
+            # Nothing to watch
+            raise ValueError('ParWatcher has no directory to watch')
+        else:
+            time.sleep(timeout)
+        return changed | self.poll(time.monotonic())
+
+    def wait(self, timeout=None):
+        '''returns the names of the directories whose .par files changed, or an empty set after timeout'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        changed = set()
+        while not changed:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return changed
+            changed = self.check(remaining)
+        # Gather the rest of the burst before waking the ingestion
+        end = time.monotonic() + self.debounce
+        while time.monotonic() < end:
+            changed |= self.check(end - time.monotonic())
+        return changed
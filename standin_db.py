@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import tempfile
+
+from sqlalchemy import create_engine, event
+
+# Local SQLite stand-in for the dateaubase, to exercise the ingestion and
+# extraction code without a SQL Server. The database file is attached under
+# the name 'dbo' to an empty in-memory main database, so 'value', 'dbo.value'
+# and 'dbo.value.Timestamp' all resolve like on the server.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dbo.value (
+    Value_ID INTEGER PRIMARY KEY,
+    Value REAL,
+    Number_of_experiment INTEGER,
+    Metadata_ID INTEGER,
+    Comment_ID INTEGER,
+    Timestamp INTEGER
+);
+CREATE TABLE IF NOT EXISTS dbo.project (
+    Project_ID INTEGER PRIMARY KEY,
+    Project_name TEXT
+);
+CREATE TABLE IF NOT EXISTS dbo.sampling_points (
+    Sampling_point_ID INTEGER PRIMARY KEY,
+    Sampling_location TEXT,
+    Description TEXT
+);
+CREATE TABLE IF NOT EXISTS dbo.project_has_sampling_points (
+    Project_ID INTEGER,
+    Sampling_point_ID INTEGER
+);
+CREATE TABLE IF NOT EXISTS dbo.equipment_model (
+    Equipment_model_ID INTEGER PRIMARY KEY,
+    Equipment_model TEXT
+);
+CREATE TABLE IF NOT EXISTS dbo.equipment (
+    Equipment_ID INTEGER PRIMARY KEY,
+    Equipment_identifier TEXT,
+    Equipment_model_ID INTEGER
+);
+CREATE TABLE IF NOT EXISTS dbo.equipment_has_sampling_points (
+    Equipment_ID INTEGER,
+    Sampling_point_ID INTEGER
+);
+CREATE TABLE IF NOT EXISTS dbo.unit (
+    Unit_ID INTEGER PRIMARY KEY,
+    Unit TEXT
+);
+CREATE TABLE IF NOT EXISTS dbo.parameter (
+    Parameter_ID INTEGER PRIMARY KEY,
+    Parameter TEXT,
+    Unit_ID INTEGER
+);
+CREATE TABLE IF NOT EXISTS dbo.equipment_model_has_parameter (
+    Equipment_model_ID INTEGER,
+    Parameter_ID INTEGER
+);
+CREATE TABLE IF NOT EXISTS dbo.metadata (
+    Metadata_ID INTEGER PRIMARY KEY,
+    Parameter_ID INTEGER,
+    Equipment_ID INTEGER,
+    Sampling_point_ID INTEGER,
+    Project_ID INTEGER
+);
+CREATE INDEX IF NOT EXISTS dbo.value_metadata_timestamp ON value (Metadata_ID, Timestamp);
+'''
+
+
+def new_filename():
+    handle, filename = tempfile.mkstemp(suffix='.sqlite', prefix='dateaubase_')
+    os.close(handle)
+    return filename
+
+
+def connect_standin(filename):
+    '''returns a DB-API connection to the stand-in, like the pyodbc one of dateaubase.create_connection'''
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    conn.execute(f"ATTACH DATABASE '{filename}' AS dbo")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def create_standin(filename=None):
+    '''returns an SQLAlchemy engine on an SQLite file with the dateaubase tables'''
+    if filename is None:
+        filename = new_filename()
+    # The pool's connections may be closed by another thread than the one using them
+    engine = create_engine('sqlite://', connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def attach_dbo(dbapi_connection, connection_record):
+        dbapi_connection.execute(f"ATTACH DATABASE '{filename}' AS dbo")
+
+    raw = engine.raw_connection()
+    try:
+        raw.executescript(SCHEMA)
+        raw.commit()
+    finally:
+        raw.close()
+    return engine
+
+
+def add_series(conn, project, location, equipment, parameter, unit):
+    '''registers a (project, location, equipment, parameter) series and returns its Metadata_ID'''
+    def get_or_create(table, key_column, values):
+        columns = list(values)
+        where = ' AND '.join(f'{column} = ?' for column in columns)
+        row = conn.execute(f'SELECT {key_column} FROM {table} WHERE {where}', list(values.values())).fetchone()
+        if row is not None:
+            return row[0]
+        placeholders = ', '.join('?' for _ in columns)
+        cursor = conn.execute(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({placeholders})', list(values.values()))
+        return cursor.lastrowid
+
+    project_ID = get_or_create('project', 'Project_ID', {'Project_name': project})
+    point_ID = get_or_create('sampling_points', 'Sampling_point_ID', {'Sampling_location': location, 'Description': location})
+    get_or_create('project_has_sampling_points', 'rowid', {'Project_ID': project_ID, 'Sampling_point_ID': point_ID})
+    model_ID = get_or_create('equipment_model', 'Equipment_model_ID', {'Equipment_model': equipment})
+    equipment_ID = get_or_create('equipment', 'Equipment_ID', {'Equipment_identifier': equipment, 'Equipment_model_ID': model_ID})
+    get_or_create('equipment_has_sampling_points', 'rowid', {'Equipment_ID': equipment_ID, 'Sampling_point_ID': point_ID})
+    unit_ID = get_or_create('unit', 'Unit_ID', {'Unit': unit})
+    parameter_ID = get_or_create('parameter', 'Parameter_ID', {'Parameter': parameter, 'Unit_ID': unit_ID})
+    get_or_create('equipment_model_has_parameter', 'rowid', {'Equipment_model_ID': model_ID, 'Parameter_ID': parameter_ID})
+    metadata_ID = get_or_create('metadata', 'Metadata_ID', {
+        'Parameter_ID': parameter_ID, 'Equipment_ID': equipment_ID,
+        'Sampling_point_ID': point_ID, 'Project_ID': project_ID})
+    conn.commit()
+    return metadata_ID
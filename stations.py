@@ -0,0 +1,59 @@
+from collections import namedtuple
+
+# Registry of the spectro::lyser stations feeding the dateaubase.
+# parameters maps each parameter of the .par header (the label up to its
+# [unit], see instrument_schema.py) to its (Metadata_ID, divisor); the
+# position of the parameters in the files does not matter (the Grandpiles
+# analysers list Temp, pH, K and NH4-N in the reverse order of the Laval one).
+
+Station = namedtuple('Station', ['name', 'path', 'parameters'])
+
+stations = {
+    'laval': Station(
+        name='laval',
+        path='//10.10.11.13/infpc1_2/',
+        parameters={
+            'TSSeq': (5, 1000),
+            'NO3-Neq': (6, 1000),
+            'CODeq': (7, 1000),
+            'CODfeq': (8, 1000),
+            'NH4-N': (1, 1),
+            'K': (2, 1),
+            'pH': (3, 1),
+            'Temp.': (4, 1),
+        },
+    ),
+    'grandpiles_influent': Station(
+        name='grandpiles_influent',
+        path='//10.10.10.11/inflpc/',
+        parameters={
+            'TSSeq': (62, 1000),
+            'NO3-Neq': (59, 1000),
+            'CODeq': (60, 1000),
+            'CODfeq': (61, 1000),
+            'NH4-N': (76, 1),
+            'K': (77, 1),
+            'pH': (75, 1),
+            'Temp.': (78, 1),
+        },
+    ),
+    'grandpiles_effluent': Station(
+        name='grandpiles_effluent',
+        path='//10.10.10.12/gp_eff2/',
+        parameters={
+            'TSSeq': (66, 1000),
+            'NO3-Neq': (63, 1000),
+            'CODeq': (64, 1000),
+            'CODfeq': (65, 1000),
+            'NH4-N': (80, 1),
+            'K': (81, 1),
+            'pH': (79, 1),
+            'Temp.': (82, 1),
+        },
+    ),
+}
+
+
+def metadata_IDs(station):
+    '''Metadata_IDs of the series written by a station'''
+    return [metadata_ID for metadata_ID, _ in station.parameters.values()]
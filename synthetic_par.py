@@ -0,0 +1,140 @@
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+import par_reader
+
+# Generates spectro::lyser .par files with the layout of sample_files/, at any
+# scale, for the benchmarks. Rows are written every step seconds in local time
+# with a daily cycle on typical values, 'Ok'/'Failure' status periods and
+# occasional rows where the spectral parameters are NaN like after a failed
+# measurement. Files are cut every file_rows rows, never inside the repeated
+# hour of a fall DST change (the parser infers it from a whole file).
+
+serial = '80207090_20_0x0100_spectro::lyser_INFLUENTV120'
+banner = 'This file contains data of the current measurement.         '
+
+# (column label, info label, typical value, info flag) of the Laval analyser
+laval_columns = [
+    ('TSSeq [mg/l]3000.00-0.00_1', '[TSSeq_0.0000_0.3995_0.0000_0.0000]', 80.0, 0),
+    ('NO3-Neq [mg/l]40.00-0.00_1', '[NO3-Neq_0.0000_0.0000_0.0000_0.0000]', 5.0, 0),
+    ('CODeq [mg/l]3750.00-0.00_1', '[CODeq_2.4443_0.9996_0.0000_0.0000]', 440.0, 0),
+    ('CODfeq [mg/l]1250.00-0.00_1', '[CODfeq_-4.8229_1.3661_0.0000_0.0000]', 150.0, 0),
+    ('NH4-N [ppm]19.80-0.10_2', '[NH4-N_0.0_1.0_0.0_0.0]', 30.0, 9),
+    ('K [ppm]55.00-0.10_1', '[K_0.0_1.0_0.0_0.0]', 13.5, 0),
+    ('pH [pH]12.00-2.00_2', '[pH_0.0_1.0_0.0_0.0]', 7.5, 0),
+    ('Temp. [M-0C]100.00--10.00_1', '[Temp._0.0_1.0_0.0_0.0]', 18.0, 0),
+]
+
+# The Grandpiles analysers list Temp, pH, K and NH4-N in the reverse order
+grandpiles_columns = laval_columns[:4] + laval_columns[:3:-1]
+
+# Parameters blanked by a failed spectral measurement, and their info flag
+spectral_parameters = 4
+failed_info = -4
+
+# Rows per file, like the 18 hours of the sample files
+file_rows = 1097
+
+
+def header(columns):
+    '''the two header lines of a .par file'''
+    labels = ['Date/Time', 'Status']
+    for label, info_label, _, _ in columns:
+        labels += [label, info_label]
+    return f'{serial}\t{banner}\n' + '\t'.join(labels) + '\n'
+
+
+def local_times(epochs, tz='US/Eastern'):
+    '''naive local epoch seconds (wall clock read as UTC) of epochs'''
+    return pd.DatetimeIndex(epochs.astype('datetime64[s]'), tz='UTC').tz_convert(tz).tz_localize(None).asi8 // 10 ** 9
+
+
+def format_datetimes(wall):
+    '''the 'YYYY.MM.DD  HH:MM:SS' strings of naive local epoch seconds'''
+    iso = np.datetime_as_string(wall.astype('datetime64[s]'))
+    return np.char.replace(np.char.replace(iso, '-', '.'), 'T', '  ')
+
+
+def ambiguous_rows(wall):
+    '''mask of the rows whose wall clock time happens twice (fall DST change)'''
+    mask = np.zeros(len(wall), bool)
+    for i in np.flatnonzero(wall[1:] <= wall[:-1]) + 1:
+        mask |= (wall >= wall[i]) & (wall <= wall[i - 1])
+    return mask
+
+
+def file_bounds(wall, rows):
+    '''row ranges of the files, moving the cuts out of repeated hours'''
+    ambiguous = ambiguous_rows(wall)
+    bounds = [0]
+    while bounds[-1] + rows < len(wall):
+        cut = bounds[-1] + rows
+        while cut < len(wall) and (ambiguous[cut] or ambiguous[cut - 1]):
+            cut += 1
+        bounds.append(cut)
+    if bounds[-1] < len(wall):
+        bounds.append(len(wall))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def synthetic_rows(epochs, columns, rng, nan_rate=0.005, failure_rate=0.2, status_period=3600):
+    '''(status, values, info) arrays of a station for the rows at epochs'''
+    n_rows = len(epochs)
+    typical = np.array([column[2] for column in columns])
+    day = 2 * np.pi * (epochs % 86400) / 86400
+    values = typical * (1 + 0.2 * np.sin(day)[:, None] + 0.02 * rng.standard_normal((n_rows, len(columns))))
+    info = np.tile(np.array([column[3] for column in columns], np.int16), (n_rows, 1))
+
+    # The status holds for whole periods
+    periods = epochs // status_period
+    failed_periods = rng.random(periods.max() - periods.min() + 1 if n_rows else 0) < failure_rate
+    status = np.where(failed_periods[periods - periods.min()] if n_rows else [], 'Failure', 'Ok')
+
+    blank = rng.random(n_rows) < nan_rate
+    values[blank, :spectral_parameters] = np.nan
+    info[blank, :spectral_parameters] = failed_info
+    return status, values, info
+
+
+def par_text(wall, status, values, info, columns):
+    '''the data lines of a .par file'''
+    table = {'Date/Time': format_datetimes(wall), 'Status': status}
+    for i, (label, info_label, _, _) in enumerate(columns):
+        # Rounded like the analyser instead of formatted value by value
+        table[label] = values[:, i].round(3)
+        table[info_label] = info[:, i]
+    buffer = io.StringIO()
+    pd.DataFrame(table).to_csv(
+        buffer, sep='\t', header=False, index=False, na_rep='NaN', lineterminator='\n')
+    return buffer.getvalue()
+
+
+def write_station(directory, start, end, columns=laval_columns, step=60, rows=file_rows, seed=0, **options):
+    '''writes the .par files of a station for start <= epoch < end and returns their paths and row count'''
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    epochs = np.arange(start, end, step, dtype=np.int64)
+    wall = local_times(epochs)
+    status, values, info = synthetic_rows(epochs, columns, rng, **options)
+    paths = []
+    for first, last in file_bounds(wall, rows):
+        # Files are named after their first row, like the analyser does
+        name = pd.Timestamp(wall[first], unit='s').strftime('%Y-%m-%d_%H-%M-%S') + '.par'
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding=par_reader.par_encoding, newline='') as f:
+            f.write(header(columns))
+            f.write(par_text(wall[first:last], status[first:last], values[first:last], info[first:last], columns))
+        paths.append(path)
+    return paths, len(epochs)
+
+
+def append_rows(path, start, n_rows, columns=laval_columns, step=60, seed=0, **options):
+    '''appends n_rows rows starting at epoch start to a .par file, like the analyser during a measurement'''
+    rng = np.random.default_rng(seed)
+    epochs = start + step * np.arange(n_rows, dtype=np.int64)
+    status, values, info = synthetic_rows(epochs, columns, rng, **options)
+    with open(path, 'a', encoding=par_reader.par_encoding, newline='') as f:
+        f.write(par_text(local_times(epochs), status, values, info, columns))
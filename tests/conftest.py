@@ -0,0 +1,80 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the root of the repository
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import bulk_writer
+import standin_db
+import synthetic_par
+
+# Local midnight of 2020-02-01
+first_epoch = 1580533200
+
+# The series of the stand-in fixture, with a quote to exercise the SQL literals
+project = 'pilEAUte'
+location = "Primary settling tank's effluent"
+equipment = 'Spectro_010'
+
+
+def value_records(metadata_ID, timestamps, values, first_ID=1):
+    '''dbo.value records of one series'''
+    n = len(timestamps)
+    return pd.DataFrame({
+        'Value_ID': np.arange(first_ID, first_ID + n), 'Value': values, 'Number_of_experiment': 1,
+        'Metadata_ID': metadata_ID, 'Comment_ID': np.nan, 'Timestamp': timestamps,
+    })
+
+
+def series(start, end, parameter='COD'):
+    '''extract_list entry of a series of the stand-in'''
+    return {'Start': start, 'End': end, 'Project': project, 'Location': location,
+            'Equipment': equipment, 'Parameter': parameter}
+
+
+def finished_files(directory, days=2):
+    '''writes a station whose files were all renamed to .parx by the analyser; returns them and their timestamps'''
+    paths, _ = synthetic_par.write_station(str(directory), first_epoch, first_epoch + int(days * 86400))
+    for path in paths:
+        os.rename(path, path + 'x')
+    return [path + 'x' for path in paths], first_epoch + 60 * np.arange(int(days * 1440))
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / 'db.sqlite')
+
+
+@pytest.fixture
+def engine(db_file):
+    '''SQLAlchemy engine on an empty stand-in'''
+    engine = standin_db.create_standin(db_file)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def standin(db_file, engine):
+    '''connection to a stand-in holding a day of 1-minute COD records'''
+    conn = standin_db.connect_standin(db_file)
+    metadata_ID = standin_db.add_series(conn, project, location, equipment, 'COD', 'mg/l')
+    bulk_writer.insert_values(
+        engine, value_records(metadata_ID, first_epoch + 60 * np.arange(1440), np.sin(np.arange(1440) / 100)))
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def anapro(monkeypatch, tmp_path):
+    '''the AnaPro_37 module, with its archives and checkpoint under tmp_path'''
+    # AnaPro_37 reads login.txt from the working directory when imported
+    monkeypatch.chdir(root)
+    import AnaPro_37
+    monkeypatch.setattr(AnaPro_37, 'archive_dir', str(tmp_path / 'archive'))
+    monkeypatch.setattr(AnaPro_37, 'checkpoint_file', str(tmp_path / 'checkpoint.sqlite'))
+    return AnaPro_37
@@ -0,0 +1,257 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+import numpy as np
+import pytest
+
+import checkpoint as ckpt
+import id_allocator
+import par_archive
+import stations
+import synthetic_par
+from conftest import finished_files, first_epoch
+
+
+@pytest.fixture
+def engine(engine):
+    id_allocator.ensure_allocator(engine)
+    return engine
+
+
+def finished_station(directory, days=3):
+    '''a station whose files were all renamed to .parx by the analyser, and its timestamps'''
+    _, timestamps = finished_files(directory, days)
+    return stations.stations['laval']._replace(path=str(directory)), timestamps
+
+
+def rescan_window(anapro, engine, station):
+    since, until = first_epoch + 86400, first_epoch + 2 * 86400
+    allocator = id_allocator.ValueIDAllocator(engine)
+    return anapro.rescan_station(engine, allocator, station, since, until), since, until
+
+
+def test_rescan_reads_parx_files(anapro, engine, tmp_path):
+    station, timestamps = finished_station(tmp_path / 'laval')
+    n, since, until = rescan_window(anapro, engine, station)
+    n_rows = ((timestamps > since) & (timestamps <= until)).sum()
+    assert n == n_rows * len(station.parameters)
+    assert engine.execute('SELECT MIN(Timestamp), MAX(Timestamp) FROM dbo.value').fetchone() == (since + 60, until)
+    # A second rescan of the window finds nothing missing
+    assert rescan_window(anapro, engine, station)[0] == 0
+
+
+def test_rescan_replays_archives(anapro, engine, tmp_path):
+    station, timestamps = finished_station(tmp_path / 'laval')
+    par_archive.archive_directory(station.path, os.path.join(anapro.archive_dir, station.name))
+    for name in os.listdir(station.path):
+        os.remove(os.path.join(station.path, name))
+    n, since, until = rescan_window(anapro, engine, station)
+    assert n == ((timestamps > since) & (timestamps <= until)).sum() * len(station.parameters)
+
+
+def test_the_index_is_only_created_on_request(anapro, engine, capsys):
+    engine.execute('DROP INDEX dbo.value_metadata_timestamp')
+    with pytest.raises(RuntimeError, match='create-index'):
+        anapro.prepare(engine)
+
+    anapro.create_index(engine)
+    assert 'Created the index' in capsys.readouterr().out
+    anapro.prepare(engine)
+    anapro.create_index(engine)
+    assert 'already exists' in capsys.readouterr().out
+
+
+def test_backfill_never_duplicates(anapro, engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(anapro, 'upsert', False)
+    station, timestamps = finished_station(tmp_path / 'laval', days=2)
+    since, until = first_epoch + 43200, first_epoch + 2 * 86400
+    anapro.backfill(engine, [station], since, until, processes=1)
+    expected = ((timestamps > since) & (timestamps <= until)).sum() * len(station.parameters)
+    assert engine.execute('SELECT COUNT(*) FROM dbo.value').scalar() == expected
+
+    # A wider window only adds its new rows
+    anapro.backfill(engine, [station], first_epoch - 1, until, processes=1)
+    assert engine.execute('SELECT COUNT(*) FROM dbo.value').scalar() == len(timestamps) * len(station.parameters)
+    assert engine.execute(
+        'SELECT COUNT(*) FROM (SELECT 1 FROM dbo.value GROUP BY Metadata_ID, Timestamp HAVING COUNT(*) > 1)').scalar() == 0
+
+
+def live_station(directory, days=1):
+    '''a station whose analyser is still writing its newest .par file, and the end of its rows'''
+    end = first_epoch + int(days * 86400)
+    synthetic_par.write_station(str(directory), first_epoch, end)
+    return stations.stations['laval']._replace(path=str(directory)), end
+
+
+def stored_rows(engine):
+    '''(rows, first Timestamp, last Timestamp) of dbo.value, one row per .par line'''
+    count, first, last = engine.execute('SELECT COUNT(*), MIN(Timestamp), MAX(Timestamp) FROM dbo.value').fetchone()
+    return count // len(stations.stations['laval'].parameters), first, last
+
+
+def test_read_new_bytes_keeps_partial_lines(anapro, tmp_path):
+    header = synthetic_par.header(synthetic_par.laval_columns).encode()
+    f_name = tmp_path / 'a.par'
+    # Only the first header line: nothing is consumed
+    f_name.write_bytes(header.split(b'\n')[0] + b'\n')
+    assert anapro.read_new_bytes(str(f_name), 0) == (b'', 0)
+
+    line = b'2020.02.01  00:00:00\tOk' + b'\t1.5\t0' * 8 + b'\n'
+    f_name.write_bytes(header + line + line[:30])
+    chunk, offset = anapro.read_new_bytes(str(f_name), 0)
+    assert chunk == header + line and offset == len(header + line)
+    # The last line is read once complete
+    f_name.write_bytes(header + line + line)
+    assert anapro.read_new_bytes(str(f_name), offset) == (line, len(header) + 2 * len(line))
+
+
+def test_read_par_tail_reuses_the_header(anapro, tmp_path):
+    station, end = live_station(tmp_path / 'laval', days=0.25)
+    (f_name,) = [os.path.join(station.path, name) for name in os.listdir(station.path)]
+    par, offset = anapro.read_par_tail(f_name, 0)
+    synthetic_par.append_rows(f_name, end, 10)
+    tail, new_offset = anapro.read_par_tail(f_name, offset)
+    assert tail.columns == par.columns
+    assert np.array_equal(tail.Timestamp, end + 60 * np.arange(10))
+    assert new_offset == os.path.getsize(f_name)
+    assert anapro.read_par_tail(f_name, new_offset) == (None, new_offset)
+
+
+def test_passes_only_read_the_appended_lines(anapro, engine, tmp_path):
+    station, end = live_station(tmp_path / 'laval')
+    anapro.main(engine, [station])
+    assert stored_rows(engine) == (1440, first_epoch, end - 60)
+
+    newest = os.path.join(station.path, max(os.listdir(station.path)))
+    synthetic_par.append_rows(newest, end, 30)
+    # A new run reopens the checkpoint: only the newest file is read, from its offset
+    before = anapro.metrics.snapshot()
+    anapro.main(engine, [station])
+    read = anapro.metrics.since(before)['counters']
+    assert stored_rows(engine) == (1470, first_epoch, end + 29 * 60)
+    assert read['files_read'] == 1
+    assert read['bytes_read'] < os.path.getsize(newest) // 10
+
+    # Nothing new: nothing read
+    before = anapro.metrics.snapshot()
+    anapro.main(engine, [station])
+    assert anapro.metrics.since(before)['counters'].get('bytes_read', 0) == 0
+
+
+def test_a_rewritten_file_is_read_from_its_start(anapro, engine, tmp_path):
+    station, end = live_station(tmp_path / 'laval')
+    anapro.main(engine, [station])
+    newest = os.path.join(station.path, max(os.listdir(station.path)))
+
+    # The analyser starts the file again, shorter, with newer rows
+    with open(newest, 'w', encoding='cp1252', newline='') as f:
+        f.write(synthetic_par.header(synthetic_par.laval_columns))
+    synthetic_par.append_rows(newest, end, 20)
+    anapro.main(engine, [station])
+    assert stored_rows(engine) == (1460, first_epoch, end + 19 * 60)
+
+
+def test_a_checkpoint_ahead_of_the_database_is_not_trusted(anapro, engine, tmp_path):
+    station, end = live_station(tmp_path / 'laval', days=2)
+    anapro.main(engine, [station])
+    # dbo.value restored from a backup missing the last day
+    engine.execute(f'DELETE FROM dbo.value WHERE Timestamp >= {first_epoch + 86400}')
+
+    anapro.main(engine, [station])
+    assert stored_rows(engine) == (2880, first_epoch, end - 60)
+
+
+def test_read_station_queues_its_files(anapro, tmp_path):
+    station, end = live_station(tmp_path / 'laval')
+    parsed = Queue()
+    anapro.read_station(station, 0, parsed, threading.Event())
+    items = [parsed.get_nowait() for _ in range(parsed.qsize())]
+    files = sorted(os.path.join(station.path, name) for name in os.listdir(station.path))
+    assert [item[0] for item in items] == ['start'] + ['file'] * len(files) + ['done']
+    assert [item[2] for item in items[1:-1]] == files
+    assert np.concatenate([item[3].Timestamp for item in items[1:-1]])[-1] == end - 60
+    assert items[-2][4] == os.path.getsize(files[-1])
+
+    # An unreachable share is reported to the writer
+    anapro.read_station(station._replace(path=str(tmp_path / 'missing')), 0, parsed, threading.Event())
+    assert [parsed.get_nowait()[0] for _ in range(parsed.qsize())] == ['start', 'error']
+
+
+def test_read_station_gives_up_when_stopped(anapro, tmp_path):
+    station, _ = live_station(tmp_path / 'laval')
+    parsed = Queue(1)
+    parsed.put('full')
+    stop = threading.Event()
+    stop.set()
+    anapro.read_station(station, 0, parsed, stop)
+    assert parsed.get_nowait() == 'full' and parsed.empty()
+
+
+def test_pipeline_formats_the_files(anapro, engine, tmp_path):
+    station, end = live_station(tmp_path / 'laval', days=0.25)
+    (f_name,) = [os.path.join(station.path, name) for name in os.listdir(station.path)]
+    par, offset = anapro.read_par_tail(f_name, 0)
+    pipeline = anapro.Pipeline(id_allocator.ValueIDAllocator(engine))
+    try:
+        pipeline.parsed.put(('start', station, end - 3600))
+        pipeline.parsed.put(('file', station, f_name, par, offset, 1.5))
+        pipeline.parsed.put(('file', station, f_name, 'not a par', offset, 1.5))
+        pipeline.parsed.put(('done', station))
+        kind, _, file, new_data, new_offset, mtime = pipeline.formatted.get(timeout=5)
+        assert (kind, file, new_offset, mtime) == ('file', f_name, offset, 1.5)
+        # Only the rows newer than the last timestamp, with consecutive Value_IDs
+        assert np.array_equal(np.unique(new_data['Timestamp']), end - 3600 + 60 * np.arange(1, 60))
+        assert np.array_equal(new_data['Value_ID'], 1 + np.arange(len(new_data)))
+        assert pipeline.formatted.get(timeout=5)[0] == 'failed'
+        assert pipeline.formatted.get(timeout=5)[0] == 'done'
+    finally:
+        pipeline.close()
+
+
+def test_run_pass_writes_the_stations_that_answer(anapro, engine, tmp_path, capsys):
+    station, end = live_station(tmp_path / 'laval')
+    missing = stations.stations['grandpiles_influent']._replace(path=str(tmp_path / 'missing'))
+    pipeline = anapro.Pipeline(id_allocator.ValueIDAllocator(engine))
+    checkpoint = ckpt.open_checkpoint(anapro.checkpoint_file)
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            new_records = anapro.run_pass(engine, checkpoint, pipeline, pool, [station, missing], in_flight, 30)
+    finally:
+        pipeline.close()
+        checkpoint.close()
+    assert new_records == {'laval': 1440 * len(station.parameters)}
+    assert in_flight == {}
+    assert stored_rows(engine) == (1440, first_epoch, end - 60)
+    assert 'grandpiles_influent: ' in capsys.readouterr().out
+
+
+def test_main_does_not_hang_when_a_pass_fails(anapro, engine, tmp_path, monkeypatch):
+    # Enough files to fill both queues of the pipeline
+    directory = tmp_path / 'laval'
+    synthetic_par.write_station(str(directory), first_epoch, first_epoch + 86400, rows=15)
+    station = stations.stations['laval']._replace(path=str(directory))
+    broken = stations.stations['grandpiles_influent']._replace(path=str(tmp_path / 'grandpiles'))
+    get_station_last = anapro.get_station_last
+
+    def failing_get_station_last(engine, checkpoint, station):
+        if station.name == broken.name:
+            raise RuntimeError('connection lost')
+        return get_station_last(engine, checkpoint, station)
+
+    monkeypatch.setattr(anapro, 'get_station_last', failing_get_station_last)
+    errors = []
+
+    def run():
+        try:
+            anapro.main(engine, [station, broken])
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(30)
+    assert not thread.is_alive()
+    assert [str(e) for e in errors] == ['connection lost']
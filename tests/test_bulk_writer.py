@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import bulk_writer
+from conftest import value_records as records
+
+
+def stored(engine):
+    return engine.execute(
+        'SELECT Metadata_ID, Timestamp, Value FROM dbo.value ORDER BY Metadata_ID, Timestamp').fetchall()
+
+
+def test_insert_in_batches(engine):
+    df = records(1, 60 * np.arange(2500), np.arange(2500) / 4)
+    assert bulk_writer.insert_values(engine, df, batch_size=1000) == 2500
+    assert engine.execute('SELECT COUNT(*), MIN(Timestamp), MAX(Timestamp) FROM dbo.value').fetchone() == (2500, 0, 149940)
+    assert bulk_writer.insert_values(engine, df.iloc[:0]) == 0
+
+
+def test_insert_keeps_missing_values(engine):
+    bulk_writer.insert_values(engine, records(1, [0, 60], [np.nan, 1.5]))
+    assert stored(engine) == [(1, 0, None), (1, 60, 1.5)]
+
+
+def test_upsert_twice_adds_nothing(engine):
+    df = pd.concat([records(1, 60 * np.arange(300), 1.0), records(2, 60 * np.arange(300), 2.0, first_ID=301)])
+    assert bulk_writer.upsert_values(engine, df, batch_size=128) == 600
+    before = stored(engine)
+    assert bulk_writer.upsert_values(engine, df, batch_size=128) == 0
+    assert stored(engine) == before
+
+
+def test_upsert_overlapping_windows(engine):
+    bulk_writer.upsert_values(engine, records(1, 60 * np.arange(0, 100), 1.0))
+    # The second window repeats the last 40 rows of the first with new values
+    assert bulk_writer.upsert_values(engine, records(1, 60 * np.arange(60, 160), 2.0, first_ID=101)) == 60
+
+    rows = stored(engine)
+    assert len(rows) == 160
+    assert [value for _, _, value in rows] == [1.0] * 60 + [2.0] * 100
+
+
+def test_upsert_keeps_the_last_duplicate_of_a_batch(engine):
+    assert bulk_writer.upsert_values(engine, records(1, [0, 60, 60], [1.0, 2.0, 3.0])) == 2
+    assert stored(engine) == [(1, 0, 1.0), (1, 60, 3.0)]
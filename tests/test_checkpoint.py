@@ -0,0 +1,50 @@
+import os
+
+import checkpoint as ckpt
+
+
+def test_listing_is_cached_per_suffix(tmp_path):
+    directory = tmp_path / 'share'
+    directory.mkdir()
+    for name in ['2020-01-31_21-44-00.parx', '2020-02-01_16-00-00.par']:
+        (directory / name).write_text('')
+    conn = ckpt.open_checkpoint(str(tmp_path / 'checkpoint.sqlite'))
+
+    assert ckpt.list_files(conn, 'laval', str(directory), '.par') == ['2020-02-01_16-00-00.par']
+    assert ckpt.list_files(conn, 'laval', str(directory), '.parx') == ['2020-01-31_21-44-00.parx']
+    assert ckpt.list_files(conn, 'laval', str(directory), ('.par', '.parx')) == [
+        '2020-01-31_21-44-00.parx', '2020-02-01_16-00-00.par']
+    # Served from the stored listings
+    assert ckpt.list_files(conn, 'laval', str(directory), '.par') == ['2020-02-01_16-00-00.par']
+
+
+def test_listing_is_refreshed_when_the_directory_changes(tmp_path):
+    directory = tmp_path / 'share'
+    directory.mkdir()
+    (directory / 'a.par').write_text('')
+    conn = ckpt.open_checkpoint(str(tmp_path / 'checkpoint.sqlite'))
+    assert ckpt.list_files(conn, 'laval', str(directory), '.par') == ['a.par']
+
+    (directory / 'b.par').write_text('')
+    stat = os.stat(directory)
+    os.utime(directory, (stat.st_atime, stat.st_mtime + 1))
+    assert ckpt.list_files(conn, 'laval', str(directory), '.par') == ['a.par', 'b.par']
+
+
+def test_last_and_offsets_are_kept(tmp_path):
+    filename = str(tmp_path / 'checkpoint.sqlite')
+    conn = ckpt.open_checkpoint(filename)
+    assert ckpt.load_last(conn, 'laval') is None
+    ckpt.save_last(conn, 'laval', 41, 1580680000)
+    ckpt.save_last(conn, 'laval', 42, 1580680060)
+    ckpt.save_offset(conn, 'laval', 'a.par', 1024, 1.5)
+    ckpt.save_offset(conn, 'laval', 'b.par', 2048, 2.5)
+    ckpt.save_offset(conn, 'grandpiles', 'a.par', 10, 3.5)
+    ckpt.forget_files(conn, 'laval', ['a.par'])
+    conn.close()
+
+    # Reopened like after a restart
+    conn = ckpt.open_checkpoint(filename)
+    assert ckpt.load_last(conn, 'laval') == (42, 1580680060)
+    assert ckpt.load_offsets(conn, 'laval') == {'b.par': (2048, 2.5)}
+    assert ckpt.load_offsets(conn, 'grandpiles') == {'a.par': (10, 3.5)}
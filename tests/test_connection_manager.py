@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+
+import connection_manager
+
+
+def sqlite_engine(path):
+    return create_engine(f'sqlite:///{path}')
+
+
+def test_is_alive(tmp_path):
+    assert connection_manager.is_alive(sqlite_engine(tmp_path / 'db.sqlite'))
+    # The directory of the database does not exist
+    assert not connection_manager.is_alive(sqlite_engine(tmp_path / 'missing' / 'db.sqlite'))
+
+
+def test_prefers_the_first_live_endpoint(tmp_path):
+    manager = connection_manager.ConnectionManager([
+        ('local', lambda: sqlite_engine(tmp_path / 'missing' / 'db.sqlite')),
+        ('remote', lambda: sqlite_engine(tmp_path / 'remote.sqlite')),
+    ])
+    engine = manager.engine()
+    assert manager.current == 'remote'
+    assert engine is manager.engines['remote']
+    # Trusted for the ttl without a new check
+    assert manager.engine() is engine
+    manager.dispose()
+
+
+def test_reconnects_after_invalidate(tmp_path):
+    manager = connection_manager.ConnectionManager([
+        ('local', lambda: sqlite_engine(tmp_path / 'local' / 'db.sqlite')),
+        ('remote', lambda: sqlite_engine(tmp_path / 'remote.sqlite')),
+    ])
+    assert manager.engine() is manager.engines['remote']
+
+    # The local server comes back, which is only noticed once the current endpoint fails
+    (tmp_path / 'local').mkdir()
+    assert manager.current == 'remote'
+    manager.invalidate()
+    assert manager.current is None
+    assert manager.engine() is manager.engines['local']
+    assert manager.current == 'local'
+    manager.dispose()
+
+
+def test_no_endpoint_reachable(tmp_path):
+    manager = connection_manager.ConnectionManager([('local', lambda: sqlite_engine(tmp_path / 'missing' / 'db.sqlite'))])
+    with pytest.raises(ConnectionError):
+        manager.engine()
+    manager.dispose()
+
+
+def test_endpoint_is_cached_across_runs(tmp_path):
+    cache_file = str(tmp_path / 'endpoint.json')
+    endpoints = [
+        ('local', lambda: sqlite_engine(tmp_path / 'missing' / 'db.sqlite')),
+        ('remote', lambda: sqlite_engine(tmp_path / 'remote.sqlite')),
+    ]
+    first = connection_manager.ConnectionManager(endpoints, cache_file=cache_file)
+    first.engine()
+    first.dispose()
+    assert json.load(open(cache_file))['endpoint'] == 'remote'
+
+    second = connection_manager.ConnectionManager(endpoints, cache_file=cache_file)
+    assert second.current == 'remote'
+    second.invalidate()
+    assert json.load(open(cache_file))['endpoint'] is None
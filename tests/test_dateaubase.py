@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import dateaubase
+import dateaubase_cache
+import standin_db
+from conftest import equipment, first_epoch, location, project, series
+
+
+def test_build_query_returns_sql_text(standin):
+    query = dateaubase.build_query(first_epoch, first_epoch + 3600, project, location, equipment, 'COD')
+    assert isinstance(query, str)
+    assert 'dbo.value.Timestamp > {}'.format(first_epoch) in query
+    query_params, params = dateaubase.build_query_params(
+        first_epoch, first_epoch + 3600, project, location, equipment, 'COD')
+    pd.testing.assert_frame_equal(
+        pd.read_sql(query, standin), pd.read_sql(query_params, standin, params=params))
+    assert len(pd.read_sql(query, standin)) == 59
+
+
+def test_aggregates_skip_duplicated_timestamps(standin, tmp_path):
+    # Records written twice at the same timestamps with other values, some of them missing
+    metadata_ID = standin.execute('SELECT MAX(Metadata_ID) FROM dbo.metadata').fetchone()[0]
+    timestamps = first_epoch + 60 * np.arange(0, 1440, 7)
+    values = np.where(np.arange(len(timestamps)) % 3 == 0, np.nan, 100.0)
+    standin.executemany(
+        'INSERT INTO dbo.value (Value_ID, Value, Number_of_experiment, Metadata_ID, Timestamp) VALUES (?, ?, 1, ?, ?)',
+        [(2000 + i, None if np.isnan(value) else value, metadata_ID, int(timestamp))
+         for i, (timestamp, value) in enumerate(zip(timestamps, values))])
+    standin.commit()
+
+    extract_list = {0: series(first_epoch - 1, first_epoch + 86400)}
+    for aggregate in dateaubase.aggregates:
+        server = dateaubase.extract_data(standin, extract_list, resolution='1h', aggregate=aggregate)
+        local = dateaubase_cache.extract_data_cached(
+            standin, extract_list, str(tmp_path / 'cache'), resolution='1h', aggregate=aggregate)
+        pd.testing.assert_frame_equal(server, local, check_dtype=False)
+        assert server.to_numpy().max() < 1
+
+
+def test_split_range_keeps_every_timestamp():
+    for start, end in [(0, 10), (0, 7200), (-1, 7201), (5, 5), (9, 3)]:
+        inside = set(range(start + 1, end))
+        chunks = dateaubase.split_range(start, end, 3600)
+        assert set().union(*(range(low + 1, high) for low, high in chunks)) == inside
+    assert dateaubase.split_range(5, 5, 3600) == [(5, 5)]
+
+
+@pytest.mark.parametrize('start, end', [
+    (first_epoch - 1, first_epoch + 86400),
+    # Chunk edges on the records
+    (first_epoch, first_epoch + 86340),
+    (first_epoch + 600, first_epoch + 600),
+    (first_epoch + 600, first_epoch - 600),
+])
+def test_parallel_extraction_matches_extract_data(standin, db_file, start, end):
+    extract_list = {0: series(start, end)}
+    parallel = dateaubase.extract_data_parallel(
+        extract_list, connect=lambda: standin_db.connect_standin(db_file), chunk_days=1 / 24, max_workers=3)
+    pd.testing.assert_frame_equal(parallel, dateaubase.extract_data(standin, extract_list))
+
+
+@pytest.mark.parametrize('resolution', ['1D', '7min', '2h', 0])
+def test_resolutions_not_dividing_an_hour_are_rejected(resolution):
+    with pytest.raises(ValueError):
+        dateaubase.build_aggregate_query(first_epoch, first_epoch + 86400, series(0, 0), resolution)
+    with pytest.raises(ValueError):
+        dateaubase_cache.downsample_records(np.empty(0, dateaubase_cache.record_dtype), resolution)
+
+
+def test_buckets_start_on_local_hours(standin):
+    extract_list = {0: series(first_epoch - 1, first_epoch + 86400)}
+    quarters = dateaubase.extract_data(standin, extract_list, resolution='15min')
+    assert (quarters.index.minute % 15 == 0).all() and (quarters.index.second == 0).all()
+    assert quarters.index[0].hour == 0
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import dateaubase
+import dateaubase_cache
+from conftest import first_epoch, series
+
+
+def test_interval_arithmetic():
+    coverage = dateaubase_cache.add_interval([(0, 9)], 10, 19)
+    assert coverage == [(0, 19)]
+    coverage = dateaubase_cache.add_interval(coverage, 30, 39)
+    assert coverage == [(0, 19), (30, 39)]
+    assert dateaubase_cache.missing_intervals(coverage, 5, 50) == [(20, 29), (40, 50)]
+    assert dateaubase_cache.missing_intervals(coverage, 0, 19) == []
+
+
+def test_cached_records_match_the_server(standin, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    start, end = first_epoch + 3600, first_epoch + 7200
+    records = dateaubase_cache.cached_records(standin, series(start, end), cache_dir)
+    expected = dateaubase.extract_data(standin, {0: series(start, end)})
+    assert np.array_equal(records['Value'], expected.iloc[:, 0].to_numpy())
+    assert records['Timestamp'][0] == start + 60 and records['Timestamp'][-1] == end - 60
+
+
+def test_covered_ranges_are_not_queried_again(standin, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = dateaubase_cache.cached_records(standin, series(first_epoch - 1, first_epoch + 43200), cache_dir)
+    second = dateaubase_cache.cached_records(standin, series(first_epoch + 43000, first_epoch + 86400), cache_dir)
+
+    # Everything up to the last record on the server is served from the cache, without a connection
+    last = first_epoch + 60 * 1439
+    both = dateaubase_cache.cached_records(None, series(first_epoch - 1, last + 1), cache_dir)
+    assert len(both) == 1440
+    assert np.array_equal(both['Timestamp'], np.union1d(first['Timestamp'], second['Timestamp']))
+
+
+def test_downsampled_like_the_server(standin, tmp_path):
+    extract_list = {0: series(first_epoch - 1, first_epoch + 86400)}
+    for aggregate in dateaubase.aggregates:
+        local = dateaubase_cache.extract_data_cached(
+            standin, extract_list, str(tmp_path / 'cache'), resolution='1h', aggregate=aggregate)
+        server = dateaubase.extract_data(standin, extract_list, resolution='1h', aggregate=aggregate)
+        pd.testing.assert_frame_equal(local, server, check_dtype=False)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bulk_writer
+import dateaubase
+import dateaubase_export
+import standin_db
+from conftest import equipment, first_epoch, location, project, series, value_records
+
+parameters = ['COD', 'TSS']
+
+
+@pytest.fixture
+def export_db(db_file, engine):
+    '''stand-in holding two series of a day, every minute and every two minutes, with some duplicates'''
+    conn = standin_db.connect_standin(db_file)
+    first_ID = 1
+    for step, parameter in enumerate(parameters, 1):
+        metadata_ID = standin_db.add_series(conn, project, location, equipment, parameter, 'mg/l')
+        timestamps = first_epoch + 60 * step * np.arange(1440 // step)
+        timestamps = np.concatenate([timestamps, timestamps[::50]])
+        values = np.random.default_rng(step).random(len(timestamps))
+        bulk_writer.insert_values(engine, value_records(metadata_ID, timestamps, values, first_ID))
+        first_ID += len(timestamps)
+    conn.close()
+    return db_file
+
+
+def extract_list(start, end):
+    return {i: series(start, end, parameter) for i, parameter in enumerate(parameters)}
+
+
+def expected(db_file, entries):
+    conn = standin_db.connect_standin(db_file)
+    try:
+        return dateaubase.extract_data(conn, entries)
+    finally:
+        conn.close()
+
+
+def test_csv_matches_extract_data(export_db, tmp_path):
+    entries = extract_list(first_epoch - 1, first_epoch + 86400)
+    filename = str(tmp_path / 'export.csv')
+    n_rows = dateaubase_export.export_csv(
+        filename, entries, connect=lambda: standin_db.connect_standin(export_db), chunk_rows=100)
+    df = pd.read_csv(filename, index_col='datetime', parse_dates=['datetime'])
+    assert n_rows == len(df) == 1440
+    pd.testing.assert_frame_equal(df, expected(export_db, entries), check_freq=False, check_names=False)
+
+
+def test_empty_csv_has_a_header(export_db, tmp_path):
+    filename = str(tmp_path / 'export.csv')
+    entries = extract_list(first_epoch - 86400, first_epoch - 1)
+    assert dateaubase_export.export_csv(filename, entries, connect=lambda: standin_db.connect_standin(export_db)) == 0
+    df = pd.read_csv(filename, index_col='datetime')
+    assert df.empty
+    assert list(df.columns) == dateaubase_export.series_names(entries)
+
+
+def test_parquet_matches_extract_data(export_db, tmp_path):
+    pytest.importorskip('pyarrow')
+    entries = extract_list(first_epoch - 1, first_epoch + 86400)
+    filename = str(tmp_path / 'export.parquet')
+    n_rows = dateaubase_export.export_parquet(
+        filename, entries, connect=lambda: standin_db.connect_standin(export_db), chunk_rows=100)
+    df = pd.read_parquet(filename)
+    assert n_rows == len(df) == 1440
+    pd.testing.assert_frame_equal(df, expected(export_db, entries), check_freq=False)
@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import id_allocator
+
+
+def test_seeded_past_the_existing_rows(engine):
+    engine.execute('INSERT INTO dbo.value (Value_ID, Value, Metadata_ID, Timestamp) VALUES (41, 1.0, 1, 0)')
+    id_allocator.ensure_allocator(engine)
+    id_allocator.ensure_allocator(engine)
+    assert engine.execute('SELECT Allocator_ID, Next_Value_ID FROM dbo.value_id_allocator').fetchall() == [(1, 42)]
+
+
+def test_catches_up_with_rows_written_without_it(engine):
+    id_allocator.ensure_allocator(engine)
+    engine.execute('INSERT INTO dbo.value (Value_ID, Value, Metadata_ID, Timestamp) VALUES (100, 1.0, 1, 0)')
+    id_allocator.ensure_allocator(engine)
+    assert id_allocator.reserve_IDs(engine, 5) == 101
+    assert id_allocator.reserve_IDs(engine, 1) == 106
+
+
+def test_a_second_row_is_refused(engine):
+    id_allocator.ensure_allocator(engine)
+    with pytest.raises(IntegrityError):
+        engine.execute('INSERT INTO dbo.value_id_allocator (Allocator_ID, Next_Value_ID) VALUES (1, 7)')
+    with pytest.raises(IntegrityError):
+        engine.execute('INSERT INTO dbo.value_id_allocator (Allocator_ID, Next_Value_ID) VALUES (2, 7)')
+
+
+def test_losing_the_seeding_race(engine, monkeypatch):
+    id_allocator.ensure_allocator(engine)
+    # The row appears between the NOT EXISTS check and the insert of another writer
+    monkeypatch.setattr(id_allocator, 'SEED', 'INSERT INTO dbo.value_id_allocator (Allocator_ID, Next_Value_ID) VALUES (1, 1);')
+    id_allocator.ensure_allocator(engine)
+    assert engine.execute('SELECT COUNT(*) FROM dbo.value_id_allocator').scalar() == 1
+
+
+def test_parallel_allocations_do_not_overlap(engine):
+    id_allocator.ensure_allocator(engine)
+    allocator = id_allocator.ValueIDAllocator(engine, block_size=50)
+    firsts = []
+
+    def allocate():
+        for n in range(1, 20):
+            firsts.append((allocator.allocate(n), n))
+
+    threads = [threading.Thread(target=allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    IDs = np.concatenate([first + np.arange(n) for first, n in firsts])
+    assert len(np.unique(IDs)) == len(IDs)
@@ -0,0 +1,34 @@
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+def busy_worker(n):
+    return sum(range(n))
+
+
+def test_profiler_sees_the_worker_threads():
+    profiler = metrics.ThreadProfiler()
+    profiler.enable()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(busy_worker, [10000] * 4))
+    profiler.disable()
+    calls = {function: stat[1] for (_, _, function), stat in profiler.stats().stats.items()}
+    assert calls['busy_worker'] == 4
+
+
+def test_serve_listens_on_localhost():
+    registry = metrics.Metrics()
+    registry.count('rows_written', 3)
+    with registry.timer('write'):
+        pass
+    server = metrics.serve(0, registry)
+    try:
+        host, port = server.server_address
+        assert host == '127.0.0.1'
+        text = urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics').read().decode()
+    finally:
+        server.shutdown()
+    assert 'anapro_rows_written_total 3' in text
+    assert 'anapro_stage_seconds_count{stage="write"} 1' in text
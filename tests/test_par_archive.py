@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+import par_archive
+import par_reader
+import synthetic_par
+from conftest import finished_files, first_epoch
+
+
+def assert_same(par, expected):
+    assert par.columns == expected.columns
+    assert np.array_equal(par.Timestamp, expected.Timestamp)
+    assert np.array_equal(par.Status, expected.Status)
+    assert np.array_equal(par.Values, expected.Values, equal_nan=True)
+    assert np.array_equal(par.Info, expected.Info)
+
+
+def test_archive_is_lossless(tmp_path):
+    (f_name,), _ = finished_files(tmp_path / 'station', days=0.5)
+    par = par_reader.read_par_file(f_name)
+    target = par_archive.archive_name(f_name, str(tmp_path))
+    par_archive.write_archive(target, par)
+    assert target.endswith('.parc')
+    assert os.path.getsize(target) < os.path.getsize(f_name)
+    assert_same(par_archive.read_archive(target), par)
+
+
+def test_window_reads_the_overlapping_blocks(tmp_path):
+    (f_name,), _ = finished_files(tmp_path / 'station', days=0.5)
+    par = par_reader.read_par_file(f_name)
+    target = par_archive.archive_name(f_name, str(tmp_path))
+    par_archive.write_archive(target, par)
+
+    start, end = int(par.Timestamp[100]), int(par.Timestamp[600])
+    window = (par.Timestamp > start) & (par.Timestamp <= end)
+    assert_same(par_archive.read_archive(target, start, end), par_reader.take_rows(par, window))
+    assert len(par_archive.read_archive(target, int(par.Timestamp[-1])).Timestamp) == 0
+
+
+def test_archive_directory_and_replay(tmp_path):
+    files, _ = finished_files(tmp_path / 'station')
+    # Files still being written are left alone
+    synthetic_par.write_station(str(tmp_path / 'station'), first_epoch + 2 * 86400, first_epoch + 2 * 86400 + 3600)
+    archive_dir = str(tmp_path / 'archive')
+
+    n_files, text_bytes, archive_bytes = par_archive.archive_directory(str(tmp_path / 'station'), archive_dir)
+    assert n_files == len(files)
+    assert archive_bytes < text_bytes
+    # Archived files are not archived again
+    assert par_archive.archive_directory(str(tmp_path / 'station'), archive_dir) == (0, 0, 0)
+
+    start, end = first_epoch + 3600, first_epoch + 30 * 3600
+    replayed = list(par_archive.replay(archive_dir, start, end))
+    expected = [par_reader.read_par_file(f_name) for f_name in files]
+    timestamps = np.concatenate([par.Timestamp for par in expected])
+    assert np.array_equal(
+        np.concatenate([par.Timestamp for par in replayed]), timestamps[(timestamps > start) & (timestamps <= end)])
+
+    df = par_archive.read_frame(archive_dir)
+    assert len(df) == len(timestamps)
+    assert list(df.columns[:2]) == ['Status', 'TSSeq']
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import par_index
+import par_reader
+import synthetic_par
+from conftest import first_epoch
+
+# 2020-11-01 00:00 EDT, the day local time goes back an hour
+fall_midnight = 1604203200
+
+
+@pytest.fixture(scope='module')
+def par_file(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('station')
+    (f_name,), _ = synthetic_par.write_station(str(directory), fall_midnight - 86400, fall_midnight + 86400, rows=3000)
+    return f_name
+
+
+def test_files_are_indexed_by_name(tmp_path):
+    paths, _ = synthetic_par.write_station(str(tmp_path), first_epoch, first_epoch + 3 * 86400)
+    starts, file_list = par_index.build_index(list(reversed(paths)))
+    assert file_list == paths
+    assert starts == [int(par_reader.read_par_file(f_name).Timestamp[0]) for f_name in paths]
+    assert par_index.first_file_index(starts, starts[1] + 60) == 1
+    assert par_index.first_file_index(starts, starts[0] - 60) == 0
+
+
+@pytest.mark.parametrize('hours', [2, 12, 24.5, 25, 25.75, 26.25, 30, 47.99])
+def test_first_newer_offset(par_file, hours):
+    timestamps = par_reader.read_par_file(par_file).Timestamp
+    last_Timestamp = fall_midnight - 86400 + int(hours * 3600)
+    offset = par_index.first_newer_offset(par_file, last_Timestamp)
+    assert offset > 0
+
+    # Parsing from the offset gives every newer line, and starts at most three hours early
+    with open(par_file, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    tail = par_reader.parse_par_bytes(data, header=False, columns=par_reader.header_columns(par_file))
+    assert np.array_equal(tail.Timestamp[tail.Timestamp > last_Timestamp], timestamps[timestamps > last_Timestamp])
+    assert tail.Timestamp[0] <= last_Timestamp
+    assert last_Timestamp - tail.Timestamp[0] <= 3 * 3600
+
+
+def test_nothing_to_skip(par_file):
+    assert par_index.first_newer_offset(par_file, fall_midnight - 2 * 86400) == 0
+    assert par_index.first_newer_offset(par_file, 0) == 0
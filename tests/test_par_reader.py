@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import par_reader
+import synthetic_par
+
+# 2020-11-01 00:00 EDT: local time goes back from 02:00 EDT to 01:00 EST at 06:00 UTC
+midnight = 1604203200
+fall_back = 1604210400
+
+
+def lines_at(epochs, columns=synthetic_par.laval_columns):
+    status, values, info = synthetic_par.synthetic_rows(epochs, columns, np.random.default_rng(0), nan_rate=0)
+    return synthetic_par.par_text(synthetic_par.local_times(epochs), status, values, info, columns).encode()
+
+
+def parse_lines(epochs, **options):
+    header = synthetic_par.header(synthetic_par.laval_columns).encode()
+    columns = par_reader.parse_header(header.split(b'\n')[1])
+    return par_reader.parse_par_bytes(lines_at(epochs), header=False, columns=columns, **options)
+
+
+def test_whole_file_across_the_fall_back():
+    epochs = midnight + 60 * np.arange(300)
+    data = synthetic_par.header(synthetic_par.laval_columns).encode() + lines_at(epochs)
+    assert np.array_equal(par_reader.parse_par_bytes(data).Timestamp, epochs)
+
+
+def test_chunk_before_the_clock_goes_back():
+    # Only first readings of the repeated hour: nothing to infer from
+    epochs = fall_back - 3600 + 60 * np.arange(10)
+    assert np.array_equal(parse_lines(epochs, after=epochs[0] - 60).Timestamp, epochs)
+
+
+def test_chunk_after_the_clock_went_back():
+    # Second readings following lines ingested before the change
+    epochs = fall_back + 60 * np.arange(10)
+    assert np.array_equal(parse_lines(epochs, after=fall_back - 60).Timestamp, epochs)
+
+
+def test_chunk_holding_the_change():
+    epochs = fall_back - 300 + 60 * np.arange(10)
+    assert np.array_equal(parse_lines(epochs, after=epochs[0] - 60).Timestamp, epochs)
+
+
+def test_empty_fields_are_missing_values():
+    header = synthetic_par.header(synthetic_par.laval_columns).encode()
+    line = b'2020.02.01  00:00:00\tOk\t\t0' + b'\t1.5\t0' * 7 + b'\n'
+    line += b'2020.02.01  00:01:00\tOk' + b'\t1.5\t0' * 7 + b'\t2.5\t\n'
+    par = par_reader.parse_par_bytes(header + line)
+    assert np.isnan(par.Values[0, 0]) and par.Values[0, 1] == 1.5
+    assert par.Values[1, 7] == 2.5 and par.Info[1, 7] == 0
+
+
+def test_rejects_lines_with_missing_fields():
+    header = synthetic_par.header(synthetic_par.laval_columns).encode()
+    with pytest.raises(ValueError):
+        par_reader.parse_par_bytes(header + b'2020.02.01  00:00:00\tOk\t1.5\t0\n')
+
+
+def test_header_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(par_reader, 'header_cache', par_reader.OrderedDict())
+    monkeypatch.setattr(par_reader, 'header_cache_size', 3)
+    paths, _ = synthetic_par.write_station(str(tmp_path), midnight - 86400, midnight, rows=300)
+    for path in paths:
+        assert par_reader.header_columns(path) == [column[0] for column in synthetic_par.laval_columns]
+    # The most recently used files are kept
+    par_reader.header_columns(paths[-3])
+    par_reader.cache_header(str(tmp_path / 'new.par'), ['TSSeq'])
+    assert list(par_reader.header_cache) == [paths[-1], paths[-3], str(tmp_path / 'new.par')]
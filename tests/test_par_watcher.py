@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+import pytest
+
+import par_watcher
+
+
+def stations(tmp_path, names=('laval', 'quebec')):
+    '''{name: path} of empty station directories'''
+    directories = {}
+    for name in names:
+        (tmp_path / name).mkdir()
+        directories[name] = str(tmp_path / name)
+    return directories
+
+
+def append(path, text='2020-02-01 00:00:00\t1.0\n'):
+    with open(path, 'a') as f:
+        f.write(text)
+
+
+def later(delay, function, *args):
+    '''calls function(*args) after delay seconds in a thread'''
+    timer = threading.Timer(delay, function, args)
+    timer.start()
+    return timer
+
+
+@pytest.fixture
+def inotify_watcher(tmp_path):
+    directories = stations(tmp_path)
+    watcher = par_watcher.ParWatcher(directories, debounce=0.2)
+    if watcher.fd is None or len(watcher.watches) != len(directories):
+        watcher.close()
+        pytest.skip('inotify is not available here')
+    yield watcher, directories
+    watcher.close()
+
+
+@pytest.fixture
+def polling_watcher(tmp_path):
+    directories = stations(tmp_path)
+    watcher = par_watcher.ParWatcher(directories, debounce=0.2, min_poll=0.02, max_poll=0.16, use_inotify=False)
+    yield watcher, directories
+    watcher.close()
+
+
+def test_inotify_reports_par_changes(inotify_watcher):
+    watcher, directories = inotify_watcher
+    assert watcher.wait(0.1) == set()
+
+    append(os.path.join(directories['laval'], '2020-02-01_00-00-00.par'))
+    assert watcher.wait(5) == {'laval'}
+    # Other files are ignored
+    append(os.path.join(directories['quebec'], 'notes.txt'))
+    assert watcher.wait(0.3) == set()
+
+
+def test_inotify_batches_a_burst(inotify_watcher):
+    watcher, directories = inotify_watcher
+    # The second write lands within the debounce window of the first
+    later(0.05, append, os.path.join(directories['quebec'], '2020-02-01_00-00-00.par'))
+    append(os.path.join(directories['laval'], '2020-02-01_00-00-00.par'))
+    assert watcher.wait(5) == {'laval', 'quebec'}
+
+
+def test_inotify_events_are_parsed(tmp_path):
+    watcher = par_watcher.ParWatcher({}, use_inotify=False)
+    read_end, write_end = os.pipe()
+    os.set_blocking(read_end, False)
+    watcher.fd, watcher.watches = read_end, {1: 'laval', 2: 'quebec'}
+
+    def event(wd, mask, name=b''):
+        # Names are padded with NULs like those of the kernel
+        name = name + b'\0' * (-len(name) % 16) if name else b''
+        return par_watcher.event_header.pack(wd, mask, 0, len(name)) + name
+
+    try:
+        os.write(write_end, event(1, par_watcher.IN_MODIFY, b'2020-02-01_00-00-00.parx')
+                 + event(2, par_watcher.IN_CREATE, b'notes.txt') + event(3, par_watcher.IN_CREATE, b'a.par'))
+        assert watcher.read_events() == {'laval'}
+        os.write(write_end, event(-1, par_watcher.IN_Q_OVERFLOW))
+        # Lost events: every directory is checked
+        assert watcher.read_events() == {'laval', 'quebec'}
+    finally:
+        watcher.close()
+        os.close(write_end)
+
+
+def test_polling_reports_par_changes(polling_watcher):
+    watcher, directories = polling_watcher
+    assert set(watcher.polled) == {'laval', 'quebec'}
+    assert watcher.wait(0.1) == set()
+
+    path = os.path.join(directories['laval'], '2020-02-01_00-00-00.par')
+    append(path)
+    assert watcher.wait(2) == {'laval'}
+    # Growing the newest file is a change too
+    append(path)
+    assert watcher.wait(2) == {'laval'}
+    # Adding any file changes the directory mtime, but other files are not followed
+    notes = os.path.join(directories['quebec'], 'notes.txt')
+    append(notes)
+    assert watcher.wait(2) == {'quebec'}
+    append(notes)
+    assert watcher.wait(0.3) == set()
+
+
+def test_polling_batches_a_burst(polling_watcher):
+    watcher, directories = polling_watcher
+    later(0.05, append, os.path.join(directories['quebec'], '2020-02-01_00-00-00.par'))
+    append(os.path.join(directories['laval'], '2020-02-01_00-00-00.par'))
+    started = time.monotonic()
+    assert watcher.wait(2) == {'laval', 'quebec'}
+    # Woken once, after the debounce window
+    assert time.monotonic() - started >= watcher.debounce
+
+
+def test_polling_backs_off_while_idle(polling_watcher):
+    watcher, directories = polling_watcher
+    state = watcher.polled['laval']
+    now = state[3]
+    intervals = []
+    for _ in range(5):
+        watcher.poll(now)
+        intervals.append(state[2])
+        now = state[3]
+    assert intervals == [0.04, 0.08, 0.16, 0.16, 0.16]
+
+    append(os.path.join(directories['laval'], '2020-02-01_00-00-00.par'))
+    assert watcher.poll(now) == {'laval'}
+    assert state[2] == watcher.min_poll and state[3] == now + watcher.min_poll
+    # Not due yet
+    append(os.path.join(directories['laval'], '2020-02-01_00-00-00.par'))
+    assert watcher.poll(now) == set()
+
+
+def test_signature_follows_the_newest_file(tmp_path):
+    directory = stations(tmp_path, ['laval'])['laval']
+    watcher = par_watcher.ParWatcher({}, use_inotify=False)
+    empty = watcher.signature(directory)
+    assert empty[1:] == (None, 0, 0)
+
+    older = os.path.join(directory, '2020-02-01_00-00-00.par')
+    newer = os.path.join(directory, '2020-02-02_00-00-00.parx')
+    append(older)
+    append(newer)
+    signature = watcher.signature(directory)
+    assert signature[1] == newer and signature[2] == os.path.getsize(newer)
+    assert watcher.signature(directory, signature) == signature
+
+    append(newer)
+    grown = watcher.signature(directory, signature)
+    assert grown[1] == newer and grown[2] > signature[2]
+    # With the directory unchanged, only the known newest file is checked
+    stale = (signature[0], older) + signature[2:]
+    assert watcher.signature(directory, stale)[1] == older
+    # Unreachable directories are checked again later
+    assert watcher.signature(str(tmp_path / 'missing')) is None
+
+
+def test_nothing_to_watch(tmp_path):
+    watcher = par_watcher.ParWatcher({}, use_inotify=False)
+    with pytest.raises(ValueError):
+        watcher.wait()
+    assert watcher.wait(0.01) == set()